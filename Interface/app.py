@@ -1,17 +1,31 @@
 # app.py
 import os
-import re
+import sys
 import time
-import calendar
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from datetime import datetime, date
-from dateutil import parser as dparser
+from pathlib import Path
+from datetime import date
 
 import pandas as pd
-import requests
-from openpyxl import load_workbook
 import streamlit as st
 
+# Módulos compartilhados ficam na raiz do repositório (um nível acima de Interface/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from cache_consultas import ConsultaCache
+from chaves_api import KeyPool, key_label
+from broker_limites import PRIORIDADE_INTERATIVA
+from consulta_http import build_session, set_priority
+from saidas import OUTPUT_FORMATS, dataframe_to_bytes
+from processamento import add_sheet_into_excel_bytes, process_dataframe
+
+# quem está esperando na página passa na frente dos scripts de lote no broker de limites
+set_priority(PRIORIDADE_INTERATIVA)
+
 # ===========================
 # Configuração da página
 # ===========================
@@ -31,285 +45,152 @@ st.markdown(
 )
 
 # ===========================
-# Utilitários (seu código, adaptado)
+# Execução em segundo plano (jobs)
 # ===========================
-def clean_cnpj(s: str) -> str:
-    return re.sub(r'\D', '', str(s)).zfill(14)
-
-def parse_date_any(s):
-    if not s:
-        return None
-    s = str(s).strip()
-    formatos = ["%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d"]
-    for fmt in formatos:
-        try:
-            return datetime.strptime(s, fmt).date()
-        except Exception:
-            pass
-    try:
-        return dparser.parse(s, dayfirst=True).date()
-    except Exception:
-        return None
-
-def _get_value(item, keys):
-    for k in keys:
-        if isinstance(item, dict) and k in item and item[k] not in (None, ""):
-            return item[k]
-    return None
-
-def extract_periods_from_response(resp_json: dict):
-    periods = []
-    if not resp_json or not isinstance(resp_json, dict):
-        return periods
-
-    data = resp_json.get("data")
-    data_root = None
-
-    if isinstance(data, list) and data:
-        data_root = data[0]
-    elif isinstance(data, dict):
-        data_root = data
-    else:
-        data_root = resp_json
-
-    candidate_list_keys = [
-        "simples_nacional_periodos_anteriores",
-        "simples_nacional_periodos",
-        "periodos_simples",
-        "simples_periodos",
-        "simples_nacional",
-        "periodos",
-        "permanencia",
-        "periodo"
-    ]
-
-    for k in candidate_list_keys:
-        lst = data_root.get(k) if isinstance(data_root, dict) else None
-        if isinstance(lst, list):
-            for item in lst:
-                if not isinstance(item, dict):
-                    continue
-                s = _get_value(item, ["inicio_data", "data_inicio", "inicio", "data"])
-                e = _get_value(item, ["fim_data", "data_fim", "fim", "data_fim"])
-                detalhe = _get_value(item, ["detalhamento", "detalhe", "motivo"]) or ""
-                si = parse_date_any(s)
-                ei = parse_date_any(e)
-                if si:
-                    periods.append({"start": si, "end": ei, "detalhe": detalhe})
-            if periods:
-                return periods
-
-    return periods
-
-def month_date_range(year, month):
-    first_day = date(year, month, 1)
-    last_day = date(year, month, calendar.monthrange(year, month)[1])
-    return first_day, last_day
-
-def is_month_fully_covered(periods, year, month):
-    start_month, end_month = month_date_range(year, month)
-    hoje = date.today()
-
-    for p in periods:
-        si = p.get("start")
-        ei = p.get("end")
-        detalhe = p.get("detalhe") or ""
-        if not si:
-            continue
-        ei_efetivo = ei if ei else hoje
-
-        if si <= start_month and ei_efetivo >= end_month:
-            if year == hoje.year and month == hoje.month and ei is None:
-                return True, "Status atual é Simples Nacional."
-            else:
-                return True, "Permaneceu no Simples Nacional o mês inteiro."
-
-    for p in periods:
-        si = p.get("start")
-        ei = p.get("end")
-        if not si or not ei:
-            continue
-        if si <= end_month and ei < end_month:
-            excl_data = ei.strftime("%Y-%m-%d")
-            return False, f"Excluída do Simples Nacional em {excl_data}."
-
-    return False, "Não optante/Nunca esteve no Simples Nacional neste mês."
-
-def read_cnpjs_from_df(df: pd.DataFrame):
-    if 'cnpj_part' not in df.columns:
-        raise ValueError("A planilha deve conter a coluna 'cnpj_part'.")
-    cnpjs = (
-        df['cnpj_part']
-        .dropna()
-        .astype(str)
-        .apply(clean_cnpj)
-        .unique()
-    )
-    return cnpjs
-
-def query_infosimples(cnpj, api_url: str, api_key: str, debug: bool = False, log_fn=print):
-    try:
-        if api_url and api_url.strip():
-            args = {"cnpj": cnpj, "token": api_key, "timeout": 300}
-            r = requests.post(api_url, data=args, timeout=60)
-        else:
-            r = requests.get(f"https://www.receitaws.com.br/v1/cnpj/{cnpj}", timeout=60)
-
-        try:
-            j = r.json()
-        except Exception:
-            j = None
-
-        if debug:
-            log_fn("=" * 80)
-            log_fn(f"[DEBUG] CNPJ PROCESSADO: {cnpj}")
-            log_fn("[DEBUG] JSON COMPLETO:")
-            import json
-            log_fn(json.dumps(j, indent=2, ensure_ascii=False))
-
-        return r.status_code if 'r' in locals() else None, j
-    except Exception as e:
-        if debug:
-            log_fn(f"[DEBUG] Erro na requisição para {cnpj}: {e}")
-        return None, None
-
-def process_dataframe(
-    df_input: pd.DataFrame,
-    api_url: str,
-    api_key: str,
-    start_year: int = 2020,
-    sleep_seconds: float = 0.5,
-    debug: bool = False,
-    progress_cb=lambda x: None,
-    log_fn=lambda *args, **kwargs: None
-):
-    cnpjs = read_cnpjs_from_df(df_input)
-    total = len(cnpjs)
-    rows = []
-    hoje = date.today()
-
-    for idx, cnpj in enumerate(cnpjs, start=1):
-        progress_cb(idx / total if total else 1.0)
-
-        status, resp_json = query_infosimples(cnpj, api_url, api_key, debug, log_fn)
-        periods = extract_periods_from_response(resp_json)
-
-        situacao_atual = None
-        if resp_json and "data" in resp_json:
-            data_field = resp_json["data"]
-            if isinstance(data_field, list) and len(data_field) > 0:
-                data_item = data_field[0]
-            elif isinstance(data_field, dict):
-                data_item = data_field
-            else:
-                data_item = {}
-
-            situacao_atual = (
-                data_item.get("simples_nacional_situacao")
-                or data_item.get("situacao_simples")
-                or data_item.get("situacao")
-            )
-
-        texto_situacao = (situacao_atual or "").lower()
-
-        if "optante pelo simples nacional" in texto_situacao:
-            m = re.search(r"desde\s+(\d{2}/\d{2}/\d{4})", texto_situacao)
-            if m:
-                start_date = parse_date_any(m.group(1))
-            else:
-                start_date = date(hoje.year, 1, 1)
-
-            has_open_period = any(p.get("end") is None for p in periods)
-            if not has_open_period:
-                periods.append({
-                    "start": start_date,
-                    "end": None,
-                    "detalhe": "Situação Atual: Optante pelo Simples Nacional"
-                })
-
-        for year in range(start_year, hoje.year + 1):
-            for month in range(1, 13):
-                if year == hoje.year and month > hoje.month:
-                    continue
-
-                regime, motivo = is_month_fully_covered(periods, year, month)
-                regime_str = "Simples Nacional" if regime else "Outro Regime"
-
-                mes_data = date(year, month, 1)
-                mes_str = mes_data.strftime("%d/%m/%Y")
-
-                periods_str = "; ".join([
-                    f"{p['start']} - {p.get('end', 'até hoje')} [{p.get('detalhe', '')}]"
-                    for p in periods
-                ])
-
-                rows.append({
-                    "CNPJ": cnpj,
-                    "MÊS": mes_str,
-                    "REGIME": regime_str,
-                    "MOTIVO": motivo,
-                    "Períodos_detectados": periods_str,
-                    "Situacao_Atual": situacao_atual or ""
-                })
-
-        time.sleep(sleep_seconds)
-
-    df_result = pd.DataFrame(rows, columns=[
-        "CNPJ", "MÊS", "REGIME", "MOTIVO", "Períodos_detectados", "Situacao_Atual"
-    ])
-    return df_result
-def add_sheet_into_excel_bytes(original_file_bytes: bytes, df_to_add: pd.DataFrame, sheet_name="CONSULTA") -> bytes:
+class ConsultaJob:
+    """Estado de uma consulta rodando no pool de workers (compartilhado entre sessões)."""
+
+    def __init__(self, job_id: str, file_name: str, output_format: str):
+        self.job_id = job_id
+        self.file_name = file_name
+        self.output_format = output_format
+        self.progress = 0.0
+        self.status = "na fila"      # na fila | executando | concluído | erro
+        self.error = None
+        self.df_result = None
+        self.out_bytes = None
+        self.logs = deque(maxlen=200)
+        self.stats = {"cache_hits": 0}
+        self.started_at = time.time()
+        self.future = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("concluído", "erro")
+
+
+class JobRunner:
     """
-    Carrega o Excel, garante que ao menos 1 planilha esteja visível,
-    substitui (ou cria) a aba `sheet_name` e devolve os bytes do arquivo atualizado.
+    Pool de threads do processo do Streamlit. Cada upload vira um job identificado
+    pelo hash do arquivo + opções (a API_KEY entra só como hash): re-runs do script e
+    uploads repetidos reaproveitam o job que já está em andamento (ou pronto) em vez
+    de refazer as consultas. Jobs terminados guardam o resultado em memória: saem
+    depois de `ttl_seconds` sem acesso ou quando passam de `max_jobs` (o mais antigo).
     """
-    from io import BytesIO
-    from openpyxl import load_workbook
-
-    wb = load_workbook(BytesIO(original_file_bytes))
-
-    def visible_count(workbook):
-        return sum(1 for ws in workbook.worksheets if getattr(ws, "sheet_state", "visible") == "visible")
-
-    created_tmp = False
-    tmp_name = "_tmp_visible_"
-
-    # Se vamos remover a folha alvo e ela é a única visível, cria uma temporária antes
-    if sheet_name in wb.sheetnames:
-        if visible_count(wb) <= 1:
-            wb.create_sheet(tmp_name)  # visível por padrão
-            created_tmp = True
-        ws_old = wb[sheet_name]
-        wb.remove(ws_old)
 
-    # Se por algum motivo não sobrou nenhuma visível (arquivos com todas ocultas), cria temporária
-    if visible_count(wb) == 0:
-        wb.create_sheet(tmp_name)
-        created_tmp = True
-
-    out_buf = BytesIO()
-    with pd.ExcelWriter(out_buf, engine="openpyxl") as writer:
-        writer.book = wb
-        writer.sheets = {ws.title: ws for ws in wb.worksheets}
-
-        # Cria/escreve a nova aba CONSULTA
-        df_to_add.to_excel(writer, sheet_name=sheet_name, index=False)
-
-        # Define CONSULTA como ativa (opcional)
+    def __init__(self, service: "LookupService", max_workers: int = 2,
+                 ttl_seconds: float = 3600, max_jobs: int = 20):
+        self._service = service
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="consulta-job")
+        self._jobs = OrderedDict()       # do menos para o mais recentemente acessado
+        self._last_access = {}
+        self._lock = threading.Lock()
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+
+    def get(self, job_id: str):
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._touch(job_id)
+            return job
+
+    def submit(self, file_bytes: bytes, file_name: str, options: dict) -> str:
+        key = hashlib.sha256(file_bytes).hexdigest()
+        key += "|" + "|".join(f"{k}={options[k]}" for k in sorted(options) if k != "api_key")
+        key += "|api_key=" + _key_fingerprint(options.get("api_key"))
+        job_id = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != "erro":
+                return job_id
+            job = ConsultaJob(job_id, file_name, options["output_format"])
+            self._jobs[job_id] = job
+            self._touch(job_id)
+        job.future = self._executor.submit(self._run, job, file_bytes, dict(options))
+        return job_id
+
+    def _run(self, job: ConsultaJob, file_bytes: bytes, options: dict):
+        job.status = "executando"
         try:
-            writer.book.active = writer.book.sheetnames.index(sheet_name)
-        except Exception:
-            pass
+            df_in = pd.read_excel(BytesIO(file_bytes))
+            output_format = options.pop("output_format")
 
-        # Remove a temporária somente depois que CONSULTA já existe (há outra visível)
-        if created_tmp and tmp_name in writer.book.sheetnames:
-            ws_tmp = writer.book[tmp_name]
-            writer.book.remove(ws_tmp)
+            def progress_cb(p):
+                job.progress = p
 
-        writer.save()
-
-    out_buf.seek(0)
-    return out_buf.getvalue()
+            df_result = process_dataframe(
+                df_input=df_in,
+                progress_cb=progress_cb,
+                log_fn=lambda msg, *a, **k: job.logs.append(str(msg)),
+                session=self._service.session,
+                cache=self._service.cache,
+                stats=job.stats,
+                **options
+            )
+            if output_format == "xlsx":
+                # Gera um Excel novo com a aba CONSULTA inserida no arquivo original
+                job.out_bytes = add_sheet_into_excel_bytes(file_bytes, df_result, sheet_name="CONSULTA")
+            else:
+                job.out_bytes = dataframe_to_bytes(df_result, output_format)
+            job.df_result = df_result
+            job.progress = 1.0
+            job.status = "concluído"
+        except Exception as e:
+            job.error = e
+            job.status = "erro"
+
+    def _touch(self, job_id: str):
+        self._jobs.move_to_end(job_id)
+        self._last_access[job_id] = time.time()
+
+    def _evict(self):
+        # só jobs terminados saem; os em andamento ficam até acabar
+        agora = time.time()
+        terminados = [jid for jid, job in self._jobs.items() if job.done]
+        vencidos = {jid for jid in terminados if agora - self._last_access[jid] > self.ttl_seconds}
+        excesso = len(self._jobs) - len(vencidos) - self.max_jobs
+        if excesso > 0:
+            vencidos.update([jid for jid in terminados if jid not in vencidos][:excesso])
+        for jid in vencidos:
+            del self._jobs[jid]
+            del self._last_access[jid]
+
+
+def _key_fingerprint(api_key) -> str:
+    """Identifica a chave (ou o pool de chaves) no id do job sem guardar o token."""
+    if isinstance(api_key, KeyPool):
+        return "pool:" + ",".join(key_label(k) for k, _, _ in api_key.keys)
+    return key_label(api_key) if api_key else ""
+
+
+class LookupService:
+    """Cliente HTTP (pool keep-alive), cache de respostas e pool de API_KEYS, únicos no processo."""
+
+    def __init__(self, cache_path: str, ttl_seconds: int, pool_size: int = 10):
+        self.session = build_session(pool_size)
+        self.cache = ConsultaCache(cache_path, ttl_seconds=ttl_seconds)
+        self.key_pool = KeyPool.from_env()
+
+
+@st.cache_resource
+def get_lookup_service() -> LookupService:
+    cache_path = os.getenv("CONSULTA_CACHE_PATH", str(Path(__file__).resolve().parent / "cache_consultas.sqlite3"))
+    ttl_hours = float(os.getenv("CONSULTA_CACHE_TTL_HORAS", "24"))
+    return LookupService(cache_path, ttl_seconds=int(ttl_hours * 3600))
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    return JobRunner(
+        get_lookup_service(),
+        max_workers=int(os.getenv("CONSULTA_JOB_WORKERS", "2")),
+        ttl_seconds=float(os.getenv("CONSULTA_JOB_TTL_MIN", "60")) * 60,
+        max_jobs=int(os.getenv("CONSULTA_JOB_MAX", "20")),
+    )
 
 # ===========================
 # Sidebar (opções)
@@ -321,73 +202,106 @@ with st.sidebar:
     start_year = st.number_input("Ano inicial de análise", min_value=2000, max_value=date.today().year, value=2020)
     sleep_seconds = st.number_input("Intervalo entre CNPJs (segundos)", min_value=0.0, max_value=10.0, value=0.5, step=0.1)
     debug = st.checkbox("Ativar DEBUG (log detalhado)", value=True)
+    output_format = st.selectbox(
+        "Formato do download",
+        OUTPUT_FORMATS,
+        index=0,
+        help="xlsx devolve a planilha enviada com a aba CONSULTA; os demais trazem só o resultado "
+             "(melhores para lotes grandes)."
+    )
+
+    service = get_lookup_service()
+    st.divider()
+    st.caption("🗄️ Cache de consultas (compartilhado entre sessões)")
+    st.metric("CNPJs servidos do cache", service.cache.hits)
+    st.caption(f"{len(service.cache)} CNPJs em cache • consultados na API: {service.cache.misses}")
 
 # ===========================
 # Upload da Planilha
 # ===========================
 uploaded = st.file_uploader("Envie sua planilha Excel (.xlsx) com a coluna 'cnpj_part'", type=["xlsx"])
 
-# Espaço para logs no modo DEBUG
-log_area = st.empty()
-def st_log(msg):
-    if debug:
-        log_area.write(f"```\n{msg}\n```")
-
 # ===========================
 # Botão principal
 # ===========================
+runner = get_job_runner()
+st.session_state.setdefault("job_ids", [])
+
 run = st.button("Rodar consulta", type="primary", disabled=(uploaded is None))
 
 if run:
     try:
-        if uploaded is None:
-            st.warning("Envie um arquivo Excel primeiro.")
-            st.stop()
-
+        file_bytes = uploaded.getvalue()
         try:
-            df_in = pd.read_excel(uploaded)
+            df_check = pd.read_excel(BytesIO(file_bytes), nrows=0)
         except Exception as e:
             st.error(f"Não foi possível ler o Excel enviado: {e}")
             st.stop()
 
-        if 'cnpj_part' not in df_in.columns:
+        if 'cnpj_part' not in df_check.columns:
             st.error("A planilha deve conter a coluna 'cnpj_part'.")
             st.stop()
 
-        progress = st.progress(0, text="Processando CNPJs...")
-
-        def progress_cb(p):
-            progress.progress(int(p * 100), text="Processando CNPJs...")
-
-        with st.spinner("Consultando dados e gerando a aba 'CONSULTA'..."):
-            df_result = process_dataframe(
-                df_input=df_in,
-                api_url=api_url,
-                api_key=api_key,
-                start_year=start_year,
-                sleep_seconds=sleep_seconds,
-                debug=debug,
-                progress_cb=progress_cb,
-                log_fn=st_log
-            )
-
-            # Gera um Excel novo com a aba CONSULTA inserida no arquivo original
-            uploaded.seek(0)
-            original_bytes = uploaded.read()
-            out_bytes = add_sheet_into_excel_bytes(original_bytes, df_result, sheet_name="CONSULTA")
-
-        st.success("✅ Consulta finalizada! A aba 'CONSULTA' foi gerada.")
-        st.caption(f"Total de linhas na CONSULTA: {len(df_result):,}".replace(",", "."))
+        job_id = runner.submit(file_bytes, uploaded.name, {
+            "api_url": api_url,
+            # campo vazio + API_KEYS no .env: usa o pool de chaves
+            "api_key": api_key or service.key_pool,
+            "start_year": int(start_year),
+            "sleep_seconds": float(sleep_seconds),
+            "debug": debug,
+            "output_format": output_format,
+        })
+        if job_id not in st.session_state["job_ids"]:
+            st.session_state["job_ids"].insert(0, job_id)
+    except Exception as e:
+        st.error(f"Ocorreu um erro: {e}")
 
-        st.subheader("Prévia do resultado")
+# ===========================
+# Acompanhamento dos jobs desta sessão
+# ===========================
+FILE_INFO = {
+    "xlsx": ("consulta_atualizada.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("consulta.parquet", "application/vnd.apache.parquet"),
+    "csv": ("consulta.csv.gz", "application/gzip"),
+    "jsonl": ("consulta.jsonl", "application/x-ndjson"),
+}
+
+any_running = False
+for job_id in st.session_state["job_ids"]:
+    job = runner.get(job_id)
+    if job is None:
+        continue
+
+    st.markdown(f"**{job.file_name}** — job `{job.job_id}` — {job.status}")
+
+    if not job.done:
+        any_running = True
+        elapsed = int(time.time() - job.started_at)
+        st.progress(int(job.progress * 100), text=f"Processando CNPJs... ({elapsed}s)")
+        if debug and job.logs:
+            st.code(job.logs[-1])
+        continue
+
+    if job.status == "erro":
+        st.error(f"Ocorreu um erro: {job.error}")
+        continue
+
+    df_result = job.df_result
+    st.success("✅ Consulta finalizada! A aba 'CONSULTA' foi gerada.")
+    st.caption(f"Total de linhas na CONSULTA: {len(df_result):,}".replace(",", ".")
+               + f" • CNPJs servidos do cache: {job.stats['cache_hits']}")
+
+    with st.expander("Prévia do resultado", expanded=(job_id == st.session_state["job_ids"][0])):
         st.dataframe(df_result.head(50), use_container_width=True)
 
-        st.download_button(
-            label="⬇️ Baixar Excel com a aba CONSULTA",
-            data=out_bytes,
-            file_name="consulta_atualizada.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+    file_name, mime = FILE_INFO[job.output_format]
+    label = (
+        "⬇️ Baixar Excel com a aba CONSULTA" if job.output_format == "xlsx"
+        else f"⬇️ Baixar resultado ({file_name})"
+    )
+    st.download_button(label=label, data=job.out_bytes, file_name=file_name, mime=mime, key=f"dl-{job_id}")
 
-    except Exception as e:
-        st.error(f"Ocorreu um erro: {e}")
+# Enquanto houver job em andamento, reexecuta o script periodicamente para atualizar o progresso
+if any_running:
+    time.sleep(1.0)
+    st.rerun()
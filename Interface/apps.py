@@ -3,15 +3,23 @@
 # Sem frameworks. Usa http.server (padrão do Python) e seu script original (main()).
 
 import os
+import re
+import json
+import time
+import uuid
+import inspect
 import importlib.util
+import multiprocessing
 import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import webbrowser
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
 import tempfile
-from email.parser import BytesParser
+from email.parser import BytesHeaderParser
 from email.policy import default
 
 # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
@@ -22,6 +30,11 @@ SCRIPT_FILENAME = "seu_script.py"   # ex.: "consulta_sn.py"
 APP_TITLE = "Consulta Simples Nacional"
 PHRASE = "Envie sua planilha e eu faço o resto"
 
+# Quantas planilhas o servidor processa ao mesmo tempo (o resto recebe 503 e tenta depois)
+MAX_CONCURRENT_JOBS = int(os.getenv("UPLOAD_MAX_JOBS", "2"))
+# Tamanho máximo aceito para a planilha enviada
+MAX_UPLOAD_BYTES = int(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024
+
 # ------------ Loader do módulo do usuário (exige função main()) ------------
 def load_user_module():
     spec = importlib.util.spec_from_file_location("usercode", SCRIPT_FILENAME)
@@ -37,6 +50,131 @@ def load_user_module():
         raise RuntimeError("O script original não possui a função main().")
     return mod
 
+# ------------ Workers quentes: processos com o script do usuário já carregado ------------
+# Cada job é despachado com parâmetros (planilha de entrada, opções) para um processo que
+# importou o script (pandas, openpyxl, .env...) uma única vez. O watchdog só recicla os
+# processos quando o arquivo do script muda.
+_worker_mod = None
+_worker_progress = None
+_worker_warmup = None
+
+
+def _worker_init(script_path, progress_queue, warmup_barrier=None):
+    global SCRIPT_FILENAME, _worker_mod, _worker_progress, _worker_warmup
+    SCRIPT_FILENAME = script_path
+    _worker_progress = progress_queue
+    _worker_warmup = warmup_barrier
+    _worker_mod = load_user_module()
+
+
+def _worker_run(job_id, input_path, options):
+    mod = _worker_mod
+    params = inspect.signature(mod.main).parameters
+    kwargs = {k: v for k, v in (options or {}).items() if k in params}
+    if "input_file" in params:
+        kwargs["input_file"] = input_path
+    else:
+        setattr(mod, "INPUT_FILE", input_path)  # scripts antigos só leem a global
+    if "progress_cb" in params:
+        def progress_cb(done, total):
+            _worker_progress.put((job_id, done, total))
+        kwargs["progress_cb"] = progress_cb
+    mod.main(**kwargs)  # deve atualizar o próprio arquivo (aba "CONSULTA")
+
+
+def _worker_ping():
+    # Segura o worker até todos os outros também terem passado pelo _worker_init: assim
+    # cada ping cai num processo diferente e nenhum fica para ser importado no 1º job
+    try:
+        _worker_warmup.wait(timeout=120)
+    except threading.BrokenBarrierError:
+        pass
+    return os.getpid()
+
+
+class WarmWorkerPool:
+    def __init__(self, script_path, max_workers, poll_seconds=2.0):
+        self.script_path = os.path.abspath(script_path)
+        self.max_workers = max_workers
+        self.poll_seconds = poll_seconds
+        self._ctx = multiprocessing.get_context("spawn")
+        self._progress = self._ctx.Queue()
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self._mtime = self._script_mtime()
+        self._executor = self._new_executor()
+        threading.Thread(target=self._dispatch_progress, name="worker-progress", daemon=True).start()
+        threading.Thread(target=self._watchdog, name="worker-watchdog", daemon=True).start()
+
+    def _script_mtime(self):
+        try:
+            return os.path.getmtime(self.script_path)
+        except OSError:
+            return None
+
+    def _new_executor(self):
+        executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._ctx,
+            initializer=_worker_init,
+            initargs=(self.script_path, self._progress, self._ctx.Barrier(self.max_workers)),
+        )
+        # Com "spawn" os processos só nascem quando chega trabalho: um ping por worker faz
+        # o spawn + import do script agora, e não no primeiro job depois de abrir/reciclar.
+        # Não espera: se o script não carregar, o próximo run() recebe o BrokenProcessPool.
+        self.warmup = [executor.submit(_worker_ping) for _ in range(self.max_workers)]
+        return executor
+
+    def recycle(self):
+        # Jobs em andamento terminam nos processos antigos; os novos já pegam o script atualizado
+        with self._lock:
+            old, self._executor = self._executor, self._new_executor()
+        old.shutdown(wait=False)
+
+    def _watchdog(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            mtime = self._script_mtime()
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self.recycle()
+
+    def _dispatch_progress(self):
+        while True:
+            job_id, done, total = self._progress.get()
+            cb = self._listeners.get(job_id)
+            if cb is not None:
+                cb(done, total)
+
+    def run(self, input_path, options=None, progress_cb=None):
+        """Roda o main() do script num worker quente e espera terminar."""
+        job_id = uuid.uuid4().hex
+        if progress_cb is not None:
+            self._listeners[job_id] = progress_cb
+        try:
+            with self._lock:
+                executor = self._executor
+            try:
+                executor.submit(_worker_run, job_id, input_path, options).result()
+            except BrokenProcessPool:
+                # Worker morreu (ou o script não carregou): próximos jobs usam processos novos
+                self.recycle()
+                raise RuntimeError(f"Não consegui executar o script '{SCRIPT_FILENAME}' nos workers.")
+        finally:
+            self._listeners.pop(job_id, None)
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = WarmWorkerPool(SCRIPT_FILENAME, MAX_CONCURRENT_JOBS)
+        return _worker_pool
+
 # -------------------- Ação do botão desktop (original) --------------------
 def select_and_run():
     path = filedialog.askopenfilename(
@@ -48,13 +186,11 @@ def select_and_run():
 
     def worker():
         try:
-            mod = load_user_module()
-            setattr(mod, "INPUT_FILE", path)
             btn_local.config(state=tk.DISABLED)
             root.config(cursor="watch")
             root.update_idletasks()
 
-            mod.main()
+            get_worker_pool().run(path)
 
             root.after(0, lambda: messagebox.showinfo(
                 "Pronto",
@@ -91,23 +227,25 @@ UPLOAD_HTML = """<!doctype html>
   .name { color:#333; font-weight:500; }
   .small { color:#666; font-size:.92rem; }
   footer { margin-top: 28px; color:#666; font-size:.9rem; }
+  progress { width: 100%; margin-top: 14px; height: 14px; }
 </style>
 </head>
 <body>
   <h1>Enviar planilha para consulta</h1>
-  <p class="hint">A planilha será processada localmente por este computador e o arquivo resultante será baixado automaticamente.</p>
+  <p class="hint">A planilha será processada localmente por este computador e o arquivo resultante será baixado automaticamente ao terminar.</p>
 
   <div class="card">
     <div id="drop" class="drop">
       <p class="small">Arraste e solte aqui, ou</p>
       <label for="file"><button type="button">Escolher planilha (.xlsx ou .xlsm)</button></label>
-      <form id="form" method="POST" action="/upload" enctype="multipart/form-data" target="_blank">
+      <form id="form" method="POST" action="/upload" enctype="multipart/form-data">
         <input id="file" type="file" name="file" accept=".xlsx,.xlsm" required>
         <div class="actions">
           <span id="filename" class="name"></span>
           <button id="send" type="submit" disabled>Enviar</button>
           <span id="status" class="small"></span>
         </div>
+        <progress id="bar" max="1" value="0" hidden></progress>
       </form>
     </div>
   </div>
@@ -138,9 +276,52 @@ UPLOAD_HTML = """<!doctype html>
     }
   });
 
-  document.getElementById('form').addEventListener('submit', () => {
-    status.textContent = 'Enviando e processando... o download iniciará ao finalizar.';
+  const bar = document.getElementById('bar');
+
+  function fmtEta(s) {
+    if (s === null || s === undefined) return '';
+    if (s < 60) return ` • faltam ~${Math.round(s)}s`;
+    return ` • faltam ~${Math.round(s / 60)} min`;
+  }
+
+  function showProgress(job) {
+    if (job.total) {
+      bar.max = job.total; bar.value = job.feitos;
+      status.textContent = `${job.feitos}/${job.total} CNPJs${fmtEta(job.eta_s)}`;
+    } else {
+      status.textContent = job.status === 'na_fila' ? 'Na fila...' : 'Processando...';
+    }
+  }
+
+  // Envia o arquivo, recebe o id do job e acompanha o progresso por SSE
+  document.getElementById('form').addEventListener('submit', async (e) => {
+    e.preventDefault();
     sendBtn.disabled = true;
+    status.textContent = 'Enviando...';
+    try {
+      const resp = await fetch('/upload', { method: 'POST', body: new FormData(e.target) });
+      const info = await resp.json().catch(() => ({}));
+      if (!resp.ok) throw new Error(info.erro || `HTTP ${resp.status}`);
+      bar.hidden = false; bar.removeAttribute('value');
+      const es = new EventSource(info.eventos);
+      es.onmessage = (ev) => {
+        const job = JSON.parse(ev.data);
+        showProgress(job);
+        if (job.status === 'concluido') {
+          es.close();
+          status.textContent = 'Concluído! Baixando o arquivo...';
+          window.location = job.resultado;
+          sendBtn.disabled = false;
+        } else if (job.status === 'erro') {
+          es.close();
+          status.textContent = `Erro: ${job.erro}`;
+          sendBtn.disabled = false;
+        }
+      };
+    } catch (err) {
+      status.textContent = `Erro: ${err.message}`;
+      sendBtn.disabled = false;
+    }
   });
 </script>
 </body>
@@ -156,11 +337,220 @@ def _content_type_for(ext: str) -> str:
     return "application/octet-stream"
 
 
+# ------------------ Leitura do upload (multipart) em streaming ------------------
+class UploadTooLarge(Exception):
+    pass
+
+
+def save_multipart_file(rfile, content_length, content_type, field="file",
+                        allowed_exts=(".xlsx", ".xlsm"), max_bytes=None, chunk_size=64 * 1024):
+    """
+    Lê o corpo multipart/form-data direto do socket, em blocos, e grava a parte
+    `field` num arquivo temporário sem nunca manter o upload inteiro em memória
+    (no máximo um bloco + o tamanho do delimitador).
+
+    Devolve (nome_original, caminho_temporario) ou (None, None) se o campo não veio.
+    Levanta UploadTooLarge acima de `max_bytes` e ValueError para corpo inválido.
+    """
+    m = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not m:
+        raise ValueError("Conteúdo inválido (boundary ausente)")
+    delim = b"\r\n--" + m.group(1).encode("latin-1")
+    keep = len(delim) - 1
+    remaining = content_length
+    # O CRLF inicial faz o primeiro delimitador casar com o mesmo padrão dos demais
+    buf = b"\r\n"
+
+    def fill():
+        nonlocal buf, remaining
+        if remaining <= 0:
+            return False
+        data = rfile.read(min(chunk_size, remaining))
+        if not data:
+            remaining = 0
+            return False
+        remaining -= len(data)
+        buf += data
+        return True
+
+    # Preâmbulo até o primeiro delimitador
+    while True:
+        idx = buf.find(delim)
+        if idx >= 0:
+            buf = buf[idx + len(delim):]
+            break
+        buf = buf[-keep:]
+        if not fill():
+            raise ValueError("Corpo multipart sem delimitador")
+
+    while True:
+        while len(buf) < 2 and fill():
+            pass
+        if buf.startswith(b"--"):
+            return None, None  # fim do multipart sem o campo procurado
+
+        # Cabeçalhos da parte
+        while b"\r\n\r\n" not in buf:
+            if len(buf) > 16 * 1024:
+                raise ValueError("Cabeçalho multipart muito grande")
+            if not fill():
+                raise ValueError("Corpo multipart truncado")
+        head, buf = buf.split(b"\r\n\r\n", 1)
+        headers = BytesHeaderParser(policy=default).parsebytes(head.lstrip(b"\r\n") + b"\r\n\r\n")
+        name = headers.get_param("name", header="Content-Disposition")
+        filename = headers.get_param("filename", header="Content-Disposition")
+
+        out = None
+        if name == field and filename:
+            ext = Path(filename).suffix or ".xlsx"
+            if ext.lower() not in allowed_exts:
+                raise ValueError("Tipo de arquivo não suportado. Envie .xlsx ou .xlsm.")
+            out = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
+
+        # Corpo da parte: grava (ou descarta) até o próximo delimitador
+        written = 0
+        try:
+            while True:
+                idx = buf.find(delim)
+                if idx >= 0:
+                    data, buf = buf[:idx], buf[idx + len(delim):]
+                    done = True
+                elif len(buf) > keep:
+                    data, buf = buf[:-keep], buf[-keep:]
+                    done = False
+                else:
+                    data, done = b"", False
+                if out is not None and data:
+                    written += len(data)
+                    if max_bytes is not None and written > max_bytes:
+                        raise UploadTooLarge(f"Arquivo maior que o limite de {max_bytes // (1024 * 1024)} MB")
+                    out.write(data)
+                if done:
+                    break
+                if not fill():
+                    raise ValueError("Corpo multipart truncado")
+        except BaseException:
+            if out is not None:
+                out.close()
+                os.unlink(out.name)
+            raise
+
+        if out is not None:
+            out.close()
+            return filename, out.name
+
+
+# ------------------ Jobs de processamento das planilhas enviadas ------------------
+# O servidor atende cada requisição numa thread própria (ThreadingHTTPServer), então a
+# página continua abrindo para todos enquanto uma planilha é processada. O trabalho
+# pesado vai para um pool limitado, e o semáforo recusa uploads acima do limite.
+#
+# API:
+#   POST /upload             -> 202 {"job_id": ...} assim que o arquivo é recebido
+#   GET  /jobs/<id>          -> progresso em JSON (CNPJs feitos/total, ETA)
+#   GET  /jobs/<id>/events   -> o mesmo progresso via Server-Sent Events
+#   GET  /jobs/<id>/result   -> planilha processada (quando status == "concluido")
+JOB_TTL_SECONDS = 3600  # jobs terminados (e seus arquivos) ficam disponíveis por 1h
+
+job_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="upload-job")
+job_slots = threading.BoundedSemaphore(MAX_CONCURRENT_JOBS)
+jobs = {}
+jobs_lock = threading.Lock()
+
+
+class UploadJob:
+    def __init__(self, filename, temp_path):
+        self.id = uuid.uuid4().hex[:12]
+        self.filename = filename
+        self.ext = Path(filename).suffix or ".xlsx"
+        self.temp_path = temp_path
+        self.status = "na_fila"   # na_fila | executando | concluido | erro
+        self.done = 0
+        self.total = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            for k, v in fields.items():
+                setattr(self, k, v)
+            self.version += 1
+            self.changed.notify_all()
+
+    def finished(self):
+        return self.status in ("concluido", "erro")
+
+    def snapshot(self):
+        now = time.time()
+        elapsed = (self.finished_at or now) - self.started_at if self.started_at else 0.0
+        eta = None
+        if self.status == "executando" and self.total and self.done:
+            eta = round(elapsed / self.done * (self.total - self.done), 1)
+        return {
+            "job_id": self.id,
+            "arquivo": self.filename,
+            "status": self.status,
+            "feitos": self.done,
+            "total": self.total,
+            "decorrido_s": round(elapsed, 1),
+            "eta_s": eta,
+            "erro": str(self.error) if self.error else None,
+            "resultado": f"/jobs/{self.id}/result" if self.status == "concluido" else None,
+        }
+
+
+def run_user_job(job):
+    job.update(status="executando", started_at=time.time())
+    try:
+        def progress_cb(done, total):
+            job.update(done=done, total=total)
+
+        # Scripts antigos podem não aceitar progress_cb: rodam sem progresso
+        get_worker_pool().run(job.temp_path, progress_cb=progress_cb)
+        job.update(status="concluido", finished_at=time.time())
+    except Exception as e:
+        job.update(status="erro", error=e, finished_at=time.time())
+    finally:
+        job_slots.release()
+
+
+def _discard_job_file(job):
+    try:
+        if job.temp_path and os.path.exists(job.temp_path):
+            os.unlink(job.temp_path)
+    except Exception:
+        pass
+
+
+def cleanup_jobs():
+    limit = time.time() - JOB_TTL_SECONDS
+    with jobs_lock:
+        expired = [j for j in jobs.values() if j.finished() and (j.finished_at or 0) < limit]
+        for job in expired:
+            del jobs[job.id]
+    for job in expired:
+        _discard_job_file(job)
+
+
 class UploadHandler(BaseHTTPRequestHandler):
     # Evita logs muito verbosos no console
     def log_message(self, fmt, *args):
         return
 
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self):
         if self.path in ("/", "/index", "/index.html"):
             page = UPLOAD_HTML.encode("utf-8")
@@ -169,8 +559,74 @@ class UploadHandler(BaseHTTPRequestHandler):
             self.send_header("Content-Length", str(len(page)))
             self.end_headers()
             self.wfile.write(page)
-        else:
+            return
+
+        m = re.fullmatch(r"/jobs/([0-9a-f]+)(/events|/result)?/?", self.path.split("?", 1)[0])
+        if not m:
             self.send_error(404, "Not found")
+            return
+        with jobs_lock:
+            job = jobs.get(m.group(1))
+        if job is None:
+            self.send_error(404, "Job não encontrado")
+            return
+
+        action = m.group(2)
+        if action is None:
+            self._send_json(200, job.snapshot())
+        elif action == "/events":
+            self._stream_events(job)
+        else:
+            self._send_result(job)
+
+    def _stream_events(self, job):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "keep-alive")
+        self.end_headers()
+        try:
+            seen = -1
+            while True:
+                with job.changed:
+                    if job.version == seen and not job.finished():
+                        # Acorda a cada atualização do job ou a cada 15s (mantém a conexão viva)
+                        job.changed.wait(timeout=15)
+                    version = job.version
+                    snap = job.snapshot()
+                if version != seen:
+                    self.wfile.write(f"data: {json.dumps(snap, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    seen = version
+                else:
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+                if snap["status"] in ("concluido", "erro"):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # navegador fechou a página; o job continua rodando
+        self.close_connection = True
+
+    def _send_result(self, job):
+        if job.status == "erro":
+            self._send_json(500, job.snapshot())
+            return
+        if job.status != "concluido":
+            self._send_json(409, job.snapshot())
+            return
+
+        out_name = f"{Path(job.filename).stem}_CONSULTA{job.ext}"
+        self.send_response(200)
+        self.send_header("Content-Type", _content_type_for(job.ext))
+        self.send_header("Content-Disposition", f'attachment; filename="{out_name}"')
+        self.send_header("Content-Length", str(os.path.getsize(job.temp_path)))
+        self.end_headers()
+
+        with open(job.temp_path, "rb") as f:
+            while True:
+                data = f.read(1024 * 1024)
+                if not data:
+                    break
+                self.wfile.write(data)
 
     def do_POST(self):
         if self.path != "/upload":
@@ -191,148 +647,136 @@ class UploadHandler(BaseHTTPRequestHandler):
         if clen <= 0:
             self.send_error(400, "Request body vazio")
             return
+        if clen > MAX_UPLOAD_BYTES + 64 * 1024:  # folga para cabeçalhos do multipart
+            self.close_connection = True
+            self._send_json(413, {"erro": f"Arquivo maior que o limite de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"})
+            return
+
+        cleanup_jobs()
+        if not job_slots.acquire(blocking=False):
+            self._send_json(503, {"erro": "Já há planilhas em processamento. Tente novamente em instantes."},
+                            headers={"Retry-After": "60"})
+            return
 
+        temp_path = None
+        submitted = False
         try:
-            # Lê o corpo inteiro (ok para .xlsx/.xlsm típicos)
-            body = self.rfile.read(clen)
-
-            # Monta uma mensagem MIME com o cabeçalho Content-Type original
-            raw = b"Content-Type: " + ctype.encode("utf-8") + b"\r\nMIME-Version: 1.0\r\n\r\n" + body
-            msg = BytesParser(policy=default).parsebytes(raw)
-
-            # Encontra a parte do formulário com name="file"
-            file_bytes = None
-            filename = None
-
-            if msg.is_multipart():
-                for part in msg.iter_parts():
-                    cd = part.get("Content-Disposition", "")
-                    if cd and "form-data" in cd:
-                        name = part.get_param("name", header="Content-Disposition")
-                        fn = part.get_param("filename", header="Content-Disposition")
-                        if name == "file" and fn:
-                            filename = fn
-                            file_bytes = part.get_payload(decode=True)
-                            break
-
-            if not filename or file_bytes is None:
+            # Grava o arquivo enviado direto no temporário, em blocos
+            filename, temp_path = save_multipart_file(
+                self.rfile, clen, ctype, max_bytes=MAX_UPLOAD_BYTES
+            )
+            if not filename:
                 self.send_error(400, "Arquivo não enviado")
                 return
 
-            ext = Path(filename).suffix or ".xlsx"
-            if ext.lower() not in (".xlsx", ".xlsm"):
-                self.send_error(400, "Tipo de arquivo não suportado. Envie .xlsx ou .xlsm.")
-                return
-
-            # Salva em arquivo temporário
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-                temp_path = tmp.name
-                tmp.write(file_bytes)
-
-            # Processa com o script do usuário
-            mod = load_user_module()
-            setattr(mod, "INPUT_FILE", temp_path)
-            mod.main()  # deve atualizar o próprio arquivo temp (aba "CONSULTA")
-
-            # Responde com download do arquivo processado
-            out_name = f"{Path(filename).stem}_CONSULTA{ext}"
-            ctype_out = _content_type_for(ext)
-
-            self.send_response(200)
-            self.send_header("Content-Type", ctype_out)
-            self.send_header("Content-Disposition", f'attachment; filename="{out_name}"')
-            self.end_headers()
-
-            with open(temp_path, "rb") as f:
-                while True:
-                    data = f.read(1024 * 1024)
-                    if not data:
-                        break
-                    self.wfile.write(data)
-
+            # Registra o job e responde na hora; o processamento segue no pool
+            job = UploadJob(filename, temp_path)
+            with jobs_lock:
+                jobs[job.id] = job
+            job_executor.submit(run_user_job, job)
+            submitted = True
+
+            self._send_json(202, {
+                "job_id": job.id,
+                "status": f"/jobs/{job.id}",
+                "eventos": f"/jobs/{job.id}/events",
+                "resultado": f"/jobs/{job.id}/result",
+            }, headers={"Location": f"/jobs/{job.id}"})
+
+        except UploadTooLarge as e:
+            self.close_connection = True  # o restante do corpo não foi lido
+            self._send_json(413, {"erro": str(e)})
+        except ValueError as e:
+            self.close_connection = True
+            self._send_json(400, {"erro": str(e)})
         except Exception as e:
-            self.send_response(500)
-            self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(f"<h1>Erro</h1><pre>{e}</pre>".encode("utf-8"))
+            self._send_json(500, {"erro": str(e)})
         finally:
-            # Remove o temporário
-            try:
-                if "temp_path" in locals() and os.path.exists(temp_path):
-                    os.unlink(temp_path)
-            except Exception:
-                pass
+            if not submitted:
+                # Nada foi para o pool: libera a vaga e remove o temporário
+                job_slots.release()
+                try:
+                    if temp_path and os.path.exists(temp_path):
+                        os.unlink(temp_path)
+                except Exception:
+                    pass
 
 # --------- Inicialização da janela principal (Tkinter) ----------
-root = tk.Tk()
-root.title(APP_TITLE)
-root.resizable(False, False)
-
-def center(win, w=520, h=200):
-    win.update_idletasks()
-    sw = win.winfo_screenwidth()
-    sh = win.winfo_screenheight()
-    x = int((sw - w) / 2)
-    y = int((sh - h) / 2)
-    win.geometry(f"{w}x{h}+{x}+{y}")
-
-lbl = tk.Label(root, text=PHRASE, font=("Segoe UI", 14))
-lbl.pack(padx=24, pady=(24, 12))
-
-# Botão fluxo desktop (original)
-btn_local = tk.Button(root, text="Selecionar planilha (.xlsx)", command=select_and_run, width=28)
-btn_local.pack(pady=(0, 8))
-
-# ---- Controles do servidor web local ----
-httpd = None
-
-def start_local_upload_page():
-    global httpd
-    if httpd is not None:
-        # Já está rodando: só abre/foi aberto
-        webbrowser.open_new_tab(f"http://127.0.0.1:{httpd.server_port}/")
-        return
+# (fica sob o __main__: os workers "spawn" reimportam este arquivo e não devem abrir janelas)
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.title(APP_TITLE)
+    root.resizable(False, False)
+
+    def center(win, w=520, h=200):
+        win.update_idletasks()
+        sw = win.winfo_screenwidth()
+        sh = win.winfo_screenheight()
+        x = int((sw - w) / 2)
+        y = int((sh - h) / 2)
+        win.geometry(f"{w}x{h}+{x}+{y}")
+
+    lbl = tk.Label(root, text=PHRASE, font=("Segoe UI", 14))
+    lbl.pack(padx=24, pady=(24, 12))
+
+    # Botão fluxo desktop (original)
+    btn_local = tk.Button(root, text="Selecionar planilha (.xlsx)", command=select_and_run, width=28)
+    btn_local.pack(pady=(0, 8))
+
+    # ---- Controles do servidor web local ----
+    httpd = None
+
+    def start_local_upload_page():
+        global httpd
+        if httpd is not None:
+            # Já está rodando: só abre/foi aberto
+            webbrowser.open_new_tab(f"http://127.0.0.1:{httpd.server_port}/")
+            return
 
-    # Tenta porta 8765; se estiver ocupada, usa aleatória (0)
-    for port in (8765, 0):
-        try:
-            httpd = HTTPServer(("127.0.0.1", port), UploadHandler)
-            break
-        except OSError:
-            httpd = None
-            continue
+        # Tenta porta 8765; se estiver ocupada, usa aleatória (0)
+        for port in (8765, 0):
+            try:
+                httpd = ThreadingHTTPServer(("127.0.0.1", port), UploadHandler)
+                httpd.daemon_threads = True
+                break
+            except OSError:
+                httpd = None
+                continue
+
+        if httpd is None:
+            messagebox.showerror("Erro", "Não consegui iniciar o servidor local.")
+            return
 
-    if httpd is None:
-        messagebox.showerror("Erro", "Não consegui iniciar o servidor local.")
-        return
+        t = threading.Thread(target=httpd.serve_forever, daemon=True)
+        t.start()
+        webbrowser.open_new_tab(f"http://127.0.0.1:{httpd.server_port}/")
+        messagebox.showinfo("Servidor Web", f"Página de upload aberta em http://127.0.0.1:{httpd.server_port}/")
 
-    t = threading.Thread(target=httpd.serve_forever, daemon=True)
-    t.start()
-    webbrowser.open_new_tab(f"http://127.0.0.1:{httpd.server_port}/")
-    messagebox.showinfo("Servidor Web", f"Página de upload aberta em http://127.0.0.1:{httpd.server_port}/")
+    def stop_local_upload_page():
+        global httpd
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+            httpd = None
+            messagebox.showinfo("Servidor Web", "Servidor finalizado.")
 
-def stop_local_upload_page():
-    global httpd
-    if httpd is not None:
-        httpd.shutdown()
-        httpd.server_close()
-        httpd = None
-        messagebox.showinfo("Servidor Web", "Servidor finalizado.")
+    btn_web_start = tk.Button(root, text="Abrir página web (upload)", command=start_local_upload_page, width=28)
+    btn_web_start.pack(pady=(0, 0))
 
-btn_web_start = tk.Button(root, text="Abrir página web (upload)", command=start_local_upload_page, width=28)
-btn_web_start.pack(pady=(0, 0))
+    btn_web_stop = tk.Button(root, text="Parar página web", command=stop_local_upload_page, width=28)
+    btn_web_stop.pack(pady=(6, 16))
 
-btn_web_stop = tk.Button(root, text="Parar página web", command=stop_local_upload_page, width=28)
-btn_web_stop.pack(pady=(6, 16))
+    def on_close():
+        try:
+            stop_local_upload_page()
+        except Exception:
+            pass
+        root.destroy()
 
-def on_close():
-    try:
-        stop_local_upload_page()
-    except Exception:
-        pass
-    root.destroy()
+    root.protocol("WM_DELETE_WINDOW", on_close)
 
-root.protocol("WM_DELETE_WINDOW", on_close)
+    # workers sobem (e importam o script) enquanto a janela espera o primeiro clique
+    get_worker_pool()
 
-center(root)
-root.mainloop()
+    center(root)
+    root.mainloop()
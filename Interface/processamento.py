@@ -0,0 +1,315 @@
+# processamento.py
+# Pipeline da página de consulta (sem Streamlit): leitura dos CNPJs, consulta,
+# cobertura mês a mês e a aba CONSULTA. Importável por app.py e pelos benchmarks.
+import re
+import sys
+import time
+import calendar
+from io import BytesIO
+from pathlib import Path
+from datetime import datetime, date
+from dateutil import parser as dparser
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Módulos compartilhados ficam na raiz do repositório (um nível acima de Interface/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from cache_consultas import ConsultaCache
+from consulta_http import fetch_cnpj, is_cacheable, replaying, source_key
+from saidas import write_output
+
+# ===========================
+# Utilitários (seu código, adaptado)
+# ===========================
+def clean_cnpj(s: str) -> str:
+    return re.sub(r'\D', '', str(s)).zfill(14)
+
+def parse_date_any(s):
+    if not s:
+        return None
+    s = str(s).strip()
+    formatos = ["%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d"]
+    for fmt in formatos:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except Exception:
+            pass
+    try:
+        return dparser.parse(s, dayfirst=True).date()
+    except Exception:
+        return None
+
+def _get_value(item, keys):
+    for k in keys:
+        if isinstance(item, dict) and k in item and item[k] not in (None, ""):
+            return item[k]
+    return None
+
+def extract_periods_from_response(resp_json: dict):
+    periods = []
+    if not resp_json or not isinstance(resp_json, dict):
+        return periods
+
+    data = resp_json.get("data")
+    data_root = None
+
+    if isinstance(data, list) and data:
+        data_root = data[0]
+    elif isinstance(data, dict):
+        data_root = data
+    else:
+        data_root = resp_json
+
+    candidate_list_keys = [
+        "simples_nacional_periodos_anteriores",
+        "simples_nacional_periodos",
+        "periodos_simples",
+        "simples_periodos",
+        "simples_nacional",
+        "periodos",
+        "permanencia",
+        "periodo"
+    ]
+
+    for k in candidate_list_keys:
+        lst = data_root.get(k) if isinstance(data_root, dict) else None
+        if isinstance(lst, list):
+            for item in lst:
+                if not isinstance(item, dict):
+                    continue
+                s = _get_value(item, ["inicio_data", "data_inicio", "inicio", "data"])
+                e = _get_value(item, ["fim_data", "data_fim", "fim", "data_fim"])
+                detalhe = _get_value(item, ["detalhamento", "detalhe", "motivo"]) or ""
+                si = parse_date_any(s)
+                ei = parse_date_any(e)
+                if si:
+                    periods.append({"start": si, "end": ei, "detalhe": detalhe})
+            if periods:
+                return periods
+
+    return periods
+
+def month_date_range(year, month):
+    first_day = date(year, month, 1)
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    return first_day, last_day
+
+def is_month_fully_covered(periods, year, month):
+    start_month, end_month = month_date_range(year, month)
+    hoje = date.today()
+
+    for p in periods:
+        si = p.get("start")
+        ei = p.get("end")
+        detalhe = p.get("detalhe") or ""
+        if not si:
+            continue
+        ei_efetivo = ei if ei else hoje
+
+        if si <= start_month and ei_efetivo >= end_month:
+            if year == hoje.year and month == hoje.month and ei is None:
+                return True, "Status atual é Simples Nacional."
+            else:
+                return True, "Permaneceu no Simples Nacional o mês inteiro."
+
+    for p in periods:
+        si = p.get("start")
+        ei = p.get("end")
+        if not si or not ei:
+            continue
+        if si <= end_month and ei < end_month:
+            excl_data = ei.strftime("%Y-%m-%d")
+            return False, f"Excluída do Simples Nacional em {excl_data}."
+
+    return False, "Não optante/Nunca esteve no Simples Nacional neste mês."
+
+def read_cnpjs_from_df(df: pd.DataFrame):
+    if 'cnpj_part' not in df.columns:
+        raise ValueError("A planilha deve conter a coluna 'cnpj_part'.")
+    cnpjs = (
+        df['cnpj_part']
+        .dropna()
+        .astype(str)
+        .apply(clean_cnpj)
+        .unique()
+    )
+    return cnpjs
+
+def query_infosimples(cnpj, api_url: str, api_key: str, debug: bool = False, log_fn=print,
+                      session=None, cache: ConsultaCache = None, stats: dict = None):
+    # endpoint faz parte da chave: homologação e produção não misturam respostas
+    source = source_key(api_url)
+    if cache is not None:
+        cached = cache.get(source, cnpj)
+        if cached is not None:
+            if stats is not None:
+                stats["cache_hits"] = stats.get("cache_hits", 0) + 1
+            if debug:
+                log_fn(f"[DEBUG] CNPJ {cnpj} servido do cache")
+            return cached
+
+    try:
+        status, j = fetch_cnpj(cnpj, api_url, api_key, session=session)
+
+        if debug:
+            log_fn("=" * 80)
+            log_fn(f"[DEBUG] CNPJ PROCESSADO: {cnpj}")
+            log_fn("[DEBUG] JSON COMPLETO:")
+            import json
+            log_fn(json.dumps(j, indent=2, ensure_ascii=False))
+
+        if cache is not None and is_cacheable(status, j):
+            cache.set(source, cnpj, status, j)
+        return status, j
+    except Exception as e:
+        if debug:
+            log_fn(f"[DEBUG] Erro na requisição para {cnpj}: {e}")
+        return None, None
+
+def process_dataframe(
+    df_input: pd.DataFrame,
+    api_url: str,
+    api_key: str,
+    start_year: int = 2020,
+    sleep_seconds: float = 0.5,
+    debug: bool = False,
+    progress_cb=lambda x: None,
+    log_fn=lambda *args, **kwargs: None,
+    output_format: str = None,
+    output_path: str = None,
+    session=None,
+    cache: ConsultaCache = None,
+    stats: dict = None
+):
+    cnpjs = read_cnpjs_from_df(df_input)
+    total = len(cnpjs)
+    rows = []
+    hoje = date.today()
+
+    for idx, cnpj in enumerate(cnpjs, start=1):
+        progress_cb(idx / total if total else 1.0)
+
+        hits_before = stats.get("cache_hits", 0) if stats is not None else 0
+        status, resp_json = query_infosimples(cnpj, api_url, api_key, debug, log_fn,
+                                              session=session, cache=cache, stats=stats)
+        from_cache = stats is not None and stats.get("cache_hits", 0) > hits_before
+        periods = extract_periods_from_response(resp_json)
+
+        situacao_atual = None
+        if resp_json and "data" in resp_json:
+            data_field = resp_json["data"]
+            if isinstance(data_field, list) and len(data_field) > 0:
+                data_item = data_field[0]
+            elif isinstance(data_field, dict):
+                data_item = data_field
+            else:
+                data_item = {}
+
+            situacao_atual = (
+                data_item.get("simples_nacional_situacao")
+                or data_item.get("situacao_simples")
+                or data_item.get("situacao")
+            )
+
+        texto_situacao = (situacao_atual or "").lower()
+
+        if "optante pelo simples nacional" in texto_situacao:
+            m = re.search(r"desde\s+(\d{2}/\d{2}/\d{4})", texto_situacao)
+            if m:
+                start_date = parse_date_any(m.group(1))
+            else:
+                start_date = date(hoje.year, 1, 1)
+
+            has_open_period = any(p.get("end") is None for p in periods)
+            if not has_open_period:
+                periods.append({
+                    "start": start_date,
+                    "end": None,
+                    "detalhe": "Situação Atual: Optante pelo Simples Nacional"
+                })
+
+        for year in range(start_year, hoje.year + 1):
+            for month in range(1, 13):
+                if year == hoje.year and month > hoje.month:
+                    continue
+
+                regime, motivo = is_month_fully_covered(periods, year, month)
+                regime_str = "Simples Nacional" if regime else "Outro Regime"
+
+                mes_data = date(year, month, 1)
+                mes_str = mes_data.strftime("%d/%m/%Y")
+
+                periods_str = "; ".join([
+                    f"{p['start']} - {p.get('end', 'até hoje')} [{p.get('detalhe', '')}]"
+                    for p in periods
+                ])
+
+                rows.append({
+                    "CNPJ": cnpj,
+                    "MÊS": mes_str,
+                    "REGIME": regime_str,
+                    "MOTIVO": motivo,
+                    "Períodos_detectados": periods_str,
+                    "Situacao_Atual": situacao_atual or ""
+                })
+
+        # Resposta vinda do cache não gerou requisição: não precisa esperar
+        if not from_cache and not replaying():
+            time.sleep(sleep_seconds)
+
+    df_result = pd.DataFrame(rows, columns=[
+        "CNPJ", "MÊS", "REGIME", "MOTIVO", "Períodos_detectados", "Situacao_Atual"
+    ])
+
+    # Opcional: grava também em disco (parquet particionado por ano, csv.gz, jsonl ou xlsx)
+    if output_path:
+        write_output(df_result, output_path, output_format)
+    return df_result
+def add_sheet_into_excel_bytes(original_file_bytes: bytes, df_to_add: pd.DataFrame, sheet_name="CONSULTA") -> bytes:
+    """
+    Carrega o Excel, garante que ao menos 1 planilha esteja visível,
+    substitui (ou cria) a aba `sheet_name` e devolve os bytes do arquivo atualizado.
+    """
+    wb = load_workbook(BytesIO(original_file_bytes))
+
+    def visible_count(workbook):
+        return sum(1 for ws in workbook.worksheets if getattr(ws, "sheet_state", "visible") == "visible")
+
+    created_tmp = False
+    tmp_name = "_tmp_visible_"
+
+    # Se vamos remover a folha alvo e ela é a única visível, cria uma temporária antes
+    if sheet_name in wb.sheetnames:
+        if visible_count(wb) <= 1:
+            wb.create_sheet(tmp_name)  # visível por padrão
+            created_tmp = True
+        ws_old = wb[sheet_name]
+        wb.remove(ws_old)
+
+    # Se por algum motivo não sobrou nenhuma visível (arquivos com todas ocultas), cria temporária
+    if visible_count(wb) == 0:
+        wb.create_sheet(tmp_name)
+        created_tmp = True
+
+    # Escreve as linhas direto no workbook já carregado: o ExcelWriter montaria uma
+    # segunda cópia do conteúdo (e o writer.book/save não existem mais no pandas 2+)
+    ws_new = wb.create_sheet(sheet_name)
+    ws_new.append(list(df_to_add.columns))
+    for row in df_to_add.itertuples(index=False, name=None):
+        ws_new.append(list(row))
+
+    # Define CONSULTA como ativa (opcional)
+    try:
+        wb.active = wb.sheetnames.index(sheet_name)
+    except Exception:
+        pass
+
+    # Remove a temporária somente depois que CONSULTA já existe (há outra visível)
+    if created_tmp and tmp_name in wb.sheetnames:
+        wb.remove(wb[tmp_name])
+
+    out_buf = BytesIO()
+    wb.save(out_buf)
+    wb.close()
+    return out_buf.getvalue()
@@ -1,10 +1,21 @@
+import os
+import re
+import sys
 import requests
 import pandas as pd
 from datetime import datetime
+from pathlib import Path
 import time
 
+# fila de erros e gravação das saídas ficam na raiz do repositório
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fila_erros import DeadLetterQueue, resumo as resumo_fila
+from saidas import patch_output
+
 INPUT_FILE = "cnpjs.txt"
 OUTPUT_FILE = "resultado_brasilapi.xlsx"
+# BRASILAPI_URL no ambiente permite apontar para o provedor local (provedor_local.py)
+BRASILAPI_URL = os.getenv("BRASILAPI_URL") or "https://brasilapi.com.br/api/cnpj/v1/{cnpj}"
 
 def read_cnpjs(path):
     with open(path, "r") as f:
@@ -51,7 +62,7 @@ def extract_simples_years(j):
     return simples_years, reasons
 
 def consultar_cnpj(cnpj):
-    url = f"https://brasilapi.com.br/api/cnpj/v1/{cnpj}"
+    url = BRASILAPI_URL.format(cnpj=cnpj)
     try:
         resp = requests.get(url, timeout=10)
         if resp.status_code == 200:
@@ -63,46 +74,106 @@ def consultar_cnpj(cnpj):
     except Exception as e:
         return None, f"Exception:{e}"
 
-def processar():
+def classe_erro(erro):
+    """"Erro 429 (...)" -> HTTP_429; exceções de rede -> CONEXAO."""
+    m = re.match(r"Erro (\d{3})", erro or "")
+    return f"HTTP_{m.group(1)}" if m else "CONEXAO"
+
+def linhas_do_cnpj(cnpj, j, erro):
+    resultados = []
+    if erro:
+        for ano in range(2020, 2025 + 1):
+            resultados.append({
+                "CNPJ+ANO": f"{cnpj}{ano}",
+                "CNPJ": cnpj,
+                "Ano": ano,
+                "Regime": "ERRO",
+                "Motivo": erro
+            })
+        return resultados
+
+    simples_years, reasons = extract_simples_years(j)
+
+    for ano in range(2020, 2025 + 1):
+        if ano in simples_years:
+            regime = "Simples Nacional"
+            motivo = ";".join(reasons)
+        else:
+            regime = "Outro Regime"
+            motivo = "sem_evidencia_simples"
+        resultados.append({
+            "CNPJ+ANO": f"{cnpj}{ano}",
+            "CNPJ": cnpj,
+            "Ano": ano,
+            "Regime": regime,
+            "Motivo": motivo
+        })
+    return resultados
+
+def processar(limpar_dlq=False):
     cnpjs = read_cnpjs(INPUT_FILE)
     resultados = []
+    dlq = DeadLetterQueue.for_output(OUTPUT_FILE)
 
     for cnpj in cnpjs:
         print(f"🔎 Consultando {cnpj}...")
         j, erro = consultar_cnpj(cnpj)
+        resultados.extend(linhas_do_cnpj(cnpj, j, erro))
         if erro:
-            for ano in range(2020, 2025 + 1):
-                resultados.append({
-                    "CNPJ+ANO": f"{cnpj}{ano}",
-                    "CNPJ": cnpj,
-                    "Ano": ano,
-                    "Regime": "ERRO",
-                    "Motivo": erro
-                })
+            dlq.add(cnpj, "brasilapi", classe_erro(erro), erro, saida=OUTPUT_FILE)
             continue
-
-        simples_years, reasons = extract_simples_years(j)
-
-        for ano in range(2020, 2025 + 1):
-            if ano in simples_years:
-                regime = "Simples Nacional"
-                motivo = ";".join(reasons)
-            else:
-                regime = "Outro Regime"
-                motivo = "sem_evidencia_simples"
-            resultados.append({
-                "CNPJ+ANO": f"{cnpj}{ano}",
-                "CNPJ": cnpj,
-                "Ano": ano,
-                "Regime": regime,
-                "Motivo": motivo
-            })
+        dlq.resolve(cnpj)
 
         time.sleep(0.5)  # Respeitar limite da API
 
+    if limpar_dlq:
+        dlq.keep_only(cnpjs)
     df = pd.DataFrame(resultados)
     df.to_excel(OUTPUT_FILE, index=False)
     print(f"✅ Resultados salvos em {OUTPUT_FILE}")
+    if len(dlq):
+        print(f"🧯 {resumo_fila(dlq)}. Para tentar só esses: --reprocessar")
+
+def reprocessar(forcar=False):
+    """Consulta de novo só os CNPJs da fila de erros e corrige as linhas deles no OUTPUT_FILE."""
+    dlq = DeadLetterQueue.for_output(OUTPUT_FILE)
+    itens = dlq.due(force=forcar)
+    if not itens:
+        print(f"Nada liberado para reprocessar. {resumo_fila(dlq) or 'Fila de erros vazia.'}")
+        return
+
+    corrigidos, linhas = [], []
+    for item in itens:
+        cnpj = item["cnpj"]
+        j, erro = consultar_cnpj(cnpj)
+        if erro:
+            tentativas = dlq.add(cnpj, "brasilapi", classe_erro(erro), erro, saida=OUTPUT_FILE)
+            print(f"❌ {cnpj}: {erro} (tentativa {tentativas})")
+        else:
+            print(f"✔ {cnpj}: corrigido")
+            corrigidos.append(cnpj)
+            linhas.extend(linhas_do_cnpj(cnpj, j, None))
+        time.sleep(0.5)
+
+    patch_output(OUTPUT_FILE, pd.DataFrame(linhas, columns=["CNPJ+ANO", "CNPJ", "Ano", "Regime", "Motivo"]))
+    for cnpj in corrigidos:
+        dlq.resolve(cnpj)
+    print(f"✅ {len(corrigidos)} de {len(itens)} CNPJs corrigidos em {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    processar()
+    import argparse
+    ap = argparse.ArgumentParser(description="Consulta do Simples Nacional pela BrasilAPI.")
+    ap.add_argument("--entrada", default=INPUT_FILE)
+    ap.add_argument("--saida", default=OUTPUT_FILE)
+    ap.add_argument("--reprocessar", action="store_true",
+                    help="consulta de novo só os CNPJs da fila de erros e corrige as linhas em --saida")
+    ap.add_argument("--forcar", action="store_true", help="com --reprocessar: ignora a espera (backoff) da fila")
+    ap.add_argument("--limpar-dlq", action="store_true",
+                    help="tira da fila de erros os CNPJs que não estão em --entrada (use só com a lista completa)")
+    args = ap.parse_args()
+    INPUT_FILE = args.entrada
+    OUTPUT_FILE = args.saida
+    if args.reprocessar:
+        reprocessar(forcar=args.forcar)
+    else:
+        processar(limpar_dlq=args.limpar_dlq)
@@ -1,23 +1,147 @@
+import argparse
 import asyncio
-from playwright.async_api import async_playwright
+import json
+import os
+import re
+import time
 import pandas as pd
 from pathlib import Path
 
+from extracao_html import cnpj_do_resultado, parse_resultado_html, periods_to_string, to_infosimples_json
+# playwright só é importado quando o navegador é usado (o modo --html roda sem ele)
+
 INPUT_FILE = "cnpj.txt"
 OUTPUT_FILE = "resultado_playwright.xlsx"
+RESPOSTAS_FILE = None   # .jsonl com as respostas no formato InfoSimples (para os motores mensal/anual)
+SALVAR_HTML = None      # pasta onde guardar o HTML do resultado (fixtures)
+FORM_URL = "https://consopt.www8.receita.fazenda.gov.br/consultaoptantes"
+
+# Pool de navegadores
+WORKERS = min(4, os.cpu_count() or 1)   # contextos headless em paralelo
+INTERVALO = 2.0                         # segundos mínimos entre consultas de um mesmo contexto
+
+# O que não precisa ser baixado para ler o resultado
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "hotjar.com",
+    "clarity.ms",
+    "facebook.net",
+)
+
+
+async def _block_assets(route):
+    req = route.request
+    if req.resource_type in BLOCKED_RESOURCE_TYPES or any(h in req.url for h in BLOCKED_HOSTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _ensure_form(page):
+    """
+    Deixa a página no formulário sem recarregar quando possível:
+    1) o campo ainda está na tela (resultado renderizado junto do form)
+    2) volta no histórico (o form vem do cache do navegador)
+    3) só então faz o goto completo
+    """
+    if await page.locator("input[name='Cnpj']").count():
+        return
+    if page.url != "about:blank":
+        try:
+            await page.go_back(wait_until="domcontentloaded")
+            if await page.locator("input[name='Cnpj']").count():
+                return
+        except Exception:
+            pass
+    await page.goto(FORM_URL, wait_until="domcontentloaded")
+
+
+# Serializa só o bloco do resultado, não a página inteira
+RESULT_HTML_JS = """() => {
+    const el = document.querySelector('.msgErro') ? document.body
+        : (document.querySelector('.panel-body, #conteudo, .body-content') || document.body);
+    return el.outerHTML;
+}"""
+
 
 async def consultar_cnpj(page, cnpj: str) -> str:
-    await page.goto("https://consopt.www8.receita.fazenda.gov.br/consultaoptantes")
+    await _ensure_form(page)
 
     await page.fill("input[name='Cnpj']", cnpj)
 
-    await page.click("input[type='submit'][value='Consultar']")
+    # o resultado anterior pode continuar no DOM junto do form: sem esperar a navegação
+    # do POST, o wait_for_selector abaixo passaria na hora contra a página velha
+    async with page.expect_navigation(wait_until="domcontentloaded", timeout=60000):
+        await page.click("input[type='submit'][value='Consultar']")
 
     await page.wait_for_selector("table, .msgErro, .tabelaSimples", timeout=60000)
 
-    return await page.content()
+    html = await page.evaluate(RESULT_HTML_JS)
+    mostrado = cnpj_do_resultado(html)
+    if mostrado is not None and mostrado != re.sub(r"\D", "", cnpj):
+        raise RuntimeError(f"a página mostra o CNPJ {mostrado}, não o consultado")
+    return html
+
+
+def linha_resultado(cnpj, html):
+    """Linha da planilha de saída + resposta no formato InfoSimples."""
+    parsed = parse_resultado_html(html)
+    linha = {
+        "CNPJ": cnpj,
+        "Situacao_Simples": parsed["situacao_simples"] or "",
+        "Situacao_SIMEI": parsed["situacao_simei"] or "",
+        "Periodos_Anteriores": periods_to_string(parsed["periodos"]),
+        "Periodos_SIMEI": periods_to_string(parsed["periodos_simei"]),
+        "Erro": parsed["erro"] or "",
+    }
+    return linha, to_infosimples_json(parsed)
+
+
+def linha_erro(cnpj, erro):
+    return {"CNPJ": cnpj, "Situacao_Simples": "", "Situacao_SIMEI": "", "Periodos_Anteriores": "",
+            "Periodos_SIMEI": "", "Erro": f"ERRO: {erro}"}, None
+
+
+async def worker(wid, browser, fila, resultados, intervalo):
+    # Cada worker tem o seu contexto (cookies/sessão isolados) e reaproveita a mesma aba
+    context = await browser.new_context()
+    await context.route("**/*", _block_assets)
+    page = await context.new_page()
+    ultimo = 0.0
+    try:
+        while True:
+            try:
+                idx, cnpj = fila.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+
+            espera = intervalo - (time.monotonic() - ultimo)
+            if espera > 0:
+                await asyncio.sleep(espera)
+            ultimo = time.monotonic()
+
+            print(f"🔎 [{wid}] Consultando {cnpj}...")
+            try:
+                content = await consultar_cnpj(page, cnpj)
+                if SALVAR_HTML:
+                    Path(SALVAR_HTML, f"{cnpj}.html").write_text(content, encoding="utf-8")
+                resultados[idx] = linha_resultado(cnpj, content)
+            except Exception as e:
+                print(f"❌ [{wid}] Erro consultando {cnpj}: {e}")
+                resultados[idx] = linha_erro(cnpj, e)
+                # página pode ter ficado num estado estranho: a próxima consulta recarrega o form
+                try:
+                    await page.goto("about:blank")
+                except Exception:
+                    pass
+    finally:
+        await context.close()
 
-async def main():
+
+async def main(workers=WORKERS, intervalo=INTERVALO, headless=True, slow_mo=0):
     cnpjs = []
     p = Path(INPUT_FILE)
     if p.exists():
@@ -25,28 +149,104 @@ async def main():
             cnpjs = [line.strip() for line in f if line.strip()]
 
     if not cnpjs:
-        print("⚠ Nenhum CNPJ encontrado no arquivo autocnpjs.txt")
+        print(f"⚠ Nenhum CNPJ encontrado no arquivo {INPUT_FILE}")
         return
 
-    resultados = []
-    async with async_playwright() as pw:
-        browser = await pw.chromium.launch(headless=False, slow_mo=500)
-        page = await browser.new_page()
+    fila = asyncio.Queue()
+    for item in enumerate(cnpjs):
+        fila.put_nowait(item)
+    resultados = [None] * len(cnpjs)
 
-        for cnpj in cnpjs:
-            print(f"🔎 Consultando {cnpj}...")
-            try:
-                content = await consultar_cnpj(page, cnpj)
-                resultados.append({"CNPJ": cnpj, "Resultado_HTML": content[:1000]})
-            except Exception as e:
-                print(f"❌ Erro consultando {cnpj}: {e}")
-                resultados.append({"CNPJ": cnpj, "Resultado_HTML": f"ERRO: {e}"})
+    if SALVAR_HTML:
+        Path(SALVAR_HTML).mkdir(parents=True, exist_ok=True)
 
+    from playwright.async_api import async_playwright
+
+    t0 = time.perf_counter()
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=headless, slow_mo=slow_mo)
+        n = max(1, min(workers, len(cnpjs)))
+        await asyncio.gather(*(worker(i + 1, browser, fila, resultados, intervalo) for i in range(n)))
         await browser.close()
+    dur = time.perf_counter() - t0
 
-    df = pd.DataFrame(resultados)
+    salvar(cnpjs, resultados)
+    print(f"\n⏱️  {len(cnpjs)} CNPJs em {dur:.1f}s ({len(cnpjs) / dur:.2f} CNPJs/s) com {n} contexto(s)")
+
+
+def salvar(cnpjs, resultados):
+    df = pd.DataFrame([linha for linha, _ in resultados])
     df.to_excel(OUTPUT_FILE, index=False)
-    print(f"\n✅ Resultados salvos em {OUTPUT_FILE}")
+    if RESPOSTAS_FILE:
+        with open(RESPOSTAS_FILE, "w", encoding="utf-8") as f:
+            for cnpj, (_, resposta) in zip(cnpjs, resultados):
+                status = 200 if resposta is not None else None
+                f.write(json.dumps({"cnpj": cnpj, "status": status, "resposta": resposta}, ensure_ascii=False) + "\n")
+        print(f"🧾 Respostas (formato InfoSimples) em {RESPOSTAS_FILE}")
+    print(f"✅ Resultados salvos em {OUTPUT_FILE}")
+
+
+def _periodos_json(periodos):
+    return [{"start": p["start"].isoformat(), "end": p["end"].isoformat() if p["end"] else None,
+             "detalhe": p["detalhe"]} for p in periodos]
+
+
+def processar_html(pasta):
+    """
+    Modo offline: lê <pasta>/<cnpj>.html salvos (--salvar-html), gera as mesmas saídas
+    e, quando existe <cnpj>.esperado.json ao lado, confere a extração com ele.
+    Devolve o número de divergências.
+    """
+    arquivos = sorted(Path(pasta).glob("*.html"))
+    if not arquivos:
+        print(f"⚠ Nenhum .html em {pasta}")
+        return 0
+    cnpjs, resultados, divergencias = [], [], 0
+    for arq in arquivos:
+        html = arq.read_text(encoding="utf-8")
+        cnpjs.append(arq.stem)
+        resultados.append(linha_resultado(arq.stem, html))
+
+        esperado_path = arq.with_suffix(".esperado.json")
+        if esperado_path.exists():
+            parsed = parse_resultado_html(html)
+            obtido = dict(parsed, periodos=_periodos_json(parsed["periodos"]),
+                          periodos_simei=_periodos_json(parsed["periodos_simei"]))
+            esperado = json.loads(esperado_path.read_text(encoding="utf-8"))
+            if obtido != esperado:
+                divergencias += 1
+                print(f"❌ {arq.name}: extração difere de {esperado_path.name}")
+                print(f"   obtido:   {json.dumps(obtido, ensure_ascii=False)}")
+                print(f"   esperado: {json.dumps(esperado, ensure_ascii=False)}")
+            else:
+                print(f"✔ {arq.name}")
+    salvar(cnpjs, resultados)
+    return divergencias
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Consulta de optantes do Simples no site da Receita (Playwright)")
+    ap.add_argument("--entrada", default=INPUT_FILE, help="arquivo .txt com um CNPJ por linha")
+    ap.add_argument("--saida", default=OUTPUT_FILE)
+    ap.add_argument("--workers", type=int, default=WORKERS, help=f"contextos de navegador em paralelo (padrão {WORKERS})")
+    ap.add_argument("--intervalo", type=float, default=INTERVALO,
+                    help=f"segundos mínimos entre consultas de cada contexto (padrão {INTERVALO})")
+    ap.add_argument("--visivel", action="store_true", help="abre o navegador com janela (depuração)")
+    ap.add_argument("--slow-mo", type=int, default=0, help="atraso em ms entre ações (depuração)")
+    ap.add_argument("--respostas", default=None,
+                    help="grava também um .jsonl com as respostas no formato InfoSimples")
+    ap.add_argument("--salvar-html", default=None, metavar="PASTA", help="guarda o HTML de cada resultado")
+    ap.add_argument("--html", default=None, metavar="PASTA",
+                    help="não abre o navegador: extrai dos .html salvos (e confere com *.esperado.json)")
+    return ap.parse_args(argv)
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    INPUT_FILE = args.entrada
+    OUTPUT_FILE = args.saida
+    RESPOSTAS_FILE = args.respostas
+    SALVAR_HTML = args.salvar_html
+    if args.html:
+        raise SystemExit(1 if processar_html(args.html) else 0)
+    asyncio.run(main(args.workers, args.intervalo, headless=not args.visivel, slow_mo=args.slow_mo))
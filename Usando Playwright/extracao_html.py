@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Extração estruturada da página de resultado do consultaoptantes (Receita Federal).
+
+import re
+from datetime import datetime
+
+from lxml import html as lxml_html
+
+DATE_RE = re.compile(r"\d{2}/\d{2}/\d{4}")
+
+# Rótulos da página (comparados sem acento/caixa)
+LABEL_SIMPLES = "situacao no simples nacional"
+LABEL_SIMEI = "situacao no simei"
+
+
+def _norm(texto):
+    texto = " ".join((texto or "").split()).lower()
+    return texto.translate(str.maketrans("áàâãéêíóôõúç", "aaaaeeiooouc"))
+
+
+def _text(el):
+    return " ".join(el.text_content().split()) if el is not None else ""
+
+
+def _parse_br(s):
+    m = DATE_RE.search(s or "")
+    if not m:
+        return None
+    try:
+        return datetime.strptime(m.group(0), "%d/%m/%Y").date()
+    except ValueError:
+        return None
+
+
+def _valor_do_rotulo(doc, rotulo):
+    """Texto que vem logo depois do rótulo (span/label/td/dt irmão) ou no mesmo nó após os dois-pontos."""
+    for el in doc.iter("span", "label", "td", "th", "dt", "strong", "b", "div", "p"):
+        own = _norm(el.text or "")
+        if not own.startswith(rotulo):
+            continue
+        resto = (el.text or "").split(":", 1)
+        if len(resto) == 2 and resto[1].strip():
+            return " ".join(resto[1].split())
+        sib = el.getnext()
+        while sib is not None and not _text(sib):
+            sib = sib.getnext()
+        if sib is not None:
+            return _text(sib)
+        if el.tail and el.tail.strip():
+            return " ".join(el.tail.split())
+    return None
+
+
+def _titulo_da_tabela(table):
+    """Título mais próximo antes da tabela (h1..h6, legend, caption ou span de seção)."""
+    cap = table.find("caption")
+    if cap is not None and _text(cap):
+        return _text(cap)
+    for prev in table.itersiblings(preceding=True):
+        if prev.tag in ("h1", "h2", "h3", "h4", "h5", "h6", "legend", "span", "div", "p", "strong", "b") and _text(prev):
+            return _text(prev)
+    parent = table.getparent()
+    while parent is not None:
+        for prev in parent.itersiblings(preceding=True):
+            if prev.tag in ("h1", "h2", "h3", "h4", "h5", "h6", "legend") and _text(prev):
+                return _text(prev)
+        parent = parent.getparent()
+    return ""
+
+
+def _linhas_periodos(table):
+    periodos = []
+    for tr in table.iter("tr"):
+        cells = [_text(td) for td in tr if td.tag in ("td", "th")]
+        inicio = _parse_br(cells[0]) if len(cells) >= 2 else None
+        if not inicio:
+            continue  # cabeçalho ou linha "Não Existem"
+        fim = _parse_br(cells[1])
+        detalhe = cells[2] if len(cells) > 2 else ""
+        periodos.append({"start": inicio, "end": fim, "detalhe": detalhe})
+    return periodos
+
+
+def parse_resultado_html(html):
+    """
+    Lê o HTML do resultado e devolve:
+      {"erro", "situacao_simples", "situacao_simei", "periodos", "periodos_simei"}
+    com os períodos no mesmo formato do extract_periods_from_response
+    ({"start": date, "end": date|None, "detalhe": str}).
+    """
+    doc = lxml_html.fromstring(html) if isinstance(html, (str, bytes)) else html
+    out = {"erro": None, "situacao_simples": None, "situacao_simei": None,
+           "periodos": [], "periodos_simei": []}
+
+    erro = doc.xpath("//*[contains(concat(' ', normalize-space(@class), ' '), ' msgErro ')]")
+    if erro and _text(erro[0]):
+        out["erro"] = _text(erro[0])
+        return out
+
+    out["situacao_simples"] = _valor_do_rotulo(doc, LABEL_SIMPLES)
+    out["situacao_simei"] = _valor_do_rotulo(doc, LABEL_SIMEI)
+
+    for table in doc.iter("table"):
+        titulo = _norm(_titulo_da_tabela(table))
+        if "periodo" not in titulo:
+            continue
+        destino = "periodos_simei" if "simei" in titulo else "periodos"
+        out[destino].extend(_linhas_periodos(table))
+    return out
+
+
+def cnpj_do_resultado(html):
+    """
+    CNPJ (só dígitos) que a página mostra: o valor ao lado do rótulo "CNPJ:" no
+    resultado ou o campo do formulário na página de erro. None se não achar.
+    """
+    doc = lxml_html.fromstring(html) if isinstance(html, (str, bytes)) else html
+    for valor in [_valor_do_rotulo(doc, "cnpj")] + doc.xpath("//input[@name='Cnpj']/@value"):
+        digitos = re.sub(r"\D", "", valor or "")
+        if len(digitos) == 14:
+            return digitos
+    return None
+
+
+def extract_periods_from_html(html):
+    """Só os períodos anteriores do Simples Nacional (mesmo formato do extract_periods_from_response)."""
+    return parse_resultado_html(html)["periodos"]
+
+
+def to_infosimples_json(parsed):
+    """
+    Converte o resultado para o formato da InfoSimples, para alimentar os motores
+    mensal/anual (detect_periods, build_rows) sem mudar nada neles.
+    """
+    if parsed.get("erro"):
+        return {"code": 612, "code_message": parsed["erro"], "data": [], "errors": [parsed["erro"]]}
+
+    def br(d):
+        return d.strftime("%d/%m/%Y") if d else ""
+
+    return {
+        "code": 200,
+        "code_message": "Extraído do site da Receita (consultaoptantes).",
+        "data": [{
+            "simples_nacional_situacao": parsed.get("situacao_simples") or "",
+            "simei_situacao": parsed.get("situacao_simei") or "",
+            "simples_nacional_periodos_anteriores": [
+                {"inicio_data": br(p["start"]), "fim_data": br(p["end"]), "detalhamento": p["detalhe"]}
+                for p in parsed.get("periodos", [])
+            ],
+        }],
+    }
+
+
+def periods_to_string(periods):
+    parts = []
+    for p in periods:
+        s = p["start"].isoformat() if p.get("start") else ""
+        e = p["end"].isoformat() if p.get("end") else "até hoje"
+        parts.append(f"{s} - {e} [{p.get('detalhe') or ''}]")
+    return "; ".join(parts)
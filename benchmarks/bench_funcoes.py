@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks do caminho de CPU por CNPJ.
+
+Mede, isoladamente e em cada script que tem a sua cópia:
+  parse_date_any, _get_value, extract_periods_from_response,
+  is_month_fully_covered, covers_year_with_rules, periods_to_string
+
+As entradas vêm de um gerador de respostas sintéticas que cobre todos os formatos
+tratados hoje: InfoSimples (data em lista), data em dict, chaves na raiz, ReceitaWS
+(sem listas), erro da API e o fallback profundo do find_lists.
+
+Uso (da raiz do repositório):
+    python benchmarks/bench_funcoes.py
+    python benchmarks/bench_funcoes.py --funcoes parse_date_any,extract_periods_from_response
+    python benchmarks/bench_funcoes.py --gravar-baseline
+"""
+
+import argparse
+import importlib
+import json
+import platform
+import random
+import statistics
+import sys
+import timeit
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline_funcoes.json"
+
+sys.path.insert(0, str(ROOT))
+
+# Scripts com cópias das funções (Interface/app.py importa streamlit e fica de fora)
+MODULOS = [
+    "consulta_simples_mensal",
+    "consulta_simples_anual",
+    "consulta_simples_mensal_planilha",
+    "consulta_simples_add_planilha",
+]
+
+FUNCOES = [
+    "parse_date_any",
+    "_get_value",
+    "extract_periods_from_response",
+    "is_month_fully_covered",
+    "covers_year_with_rules",
+    "periods_to_string",
+]
+
+# ==========================
+# GERADOR SINTÉTICO
+# ==========================
+FORMATOS_RESPOSTA = ("infosimples", "data_dict", "raiz", "profundo", "receitaws", "erro")
+
+DATAS = {
+    "br": "15/03/2019",
+    "iso": "2019-03-15",
+    "br_hifen": "15-03-2019",
+    "iso_barra": "2019/03/15",
+    "timestamp": "2019-03-15T00:00:00.000Z",   # cai no dateutil
+    "invalida": "sem data",
+    "vazia": "",
+}
+
+
+def _periodos_aleatorios(rng, qtd):
+    periodos = []
+    inicio = date(2007, 7, 1) + timedelta(days=rng.randint(0, 2000))
+    for i in range(qtd):
+        fim = inicio + timedelta(days=rng.randint(180, 1500))
+        aberto = i == qtd - 1 and rng.random() < 0.6
+        periodos.append((inicio, None if aberto else fim, "" if aberto else "Excluída por Comunicação Obrigatória"))
+        inicio = fim + timedelta(days=rng.randint(30, 700))
+    return periodos
+
+
+def resposta_sintetica(formato, rng, qtd_periodos=3):
+    """Monta uma resposta no formato pedido com `qtd_periodos` períodos."""
+    periodos = _periodos_aleatorios(rng, qtd_periodos)
+    br = lambda d: d.strftime("%d/%m/%Y") if d else ""  # noqa: E731
+    iso = lambda d: d.isoformat() if d else None  # noqa: E731
+
+    if formato == "infosimples":
+        return {"code": 200, "data": [{
+            "cnpj": "00000000000191",
+            "simples_nacional_situacao": "NÃO optante pelo Simples Nacional",
+            "simples_nacional_periodos_anteriores": [
+                {"inicio_data": br(i), "fim_data": br(f), "detalhamento": d} for i, f, d in periodos
+            ],
+        }]}
+    if formato == "data_dict":
+        return {"code": 200, "data": {
+            "periodos": [{"data_inicio": iso(i), "data_fim": iso(f), "motivo": d} for i, f, d in periodos],
+        }}
+    if formato == "raiz":
+        return {"periodos_simples": [{"inicio": br(i), "fim": br(f), "detalhe": d} for i, f, d in periodos]}
+    if formato == "profundo":
+        # nenhuma chave conhecida: só o find_lists (anual) desce até a lista de períodos
+        return {"code": 200, "data": {
+            "empresa": {"cadastro": {"regimes": {"historico_simples": [
+                {"inicio_data": br(i), "fim_data": br(f), "detalhamento": d} for i, f, d in periodos
+            ]}}},
+            "socios": [{"nome": "SOCIO", "qualificacao": "49"}],
+        }}
+    if formato == "receitaws":
+        return {"status": "OK", "opcao_pelo_simples": True,
+                "data_opcao_pelo_simples": br(periodos[0][0]),
+                "simples": {"optante": True, "data_opcao": br(periodos[0][0]), "data_exclusao": None}}
+    if formato == "erro":
+        return {"code": 612, "code_message": "CNPJ não encontrado.", "data": [], "errors": []}
+    raise ValueError(formato)
+
+
+def periodos_sinteticos(rng, qtd=3):
+    return [{"start": i, "end": f, "detalhe": d} for i, f, d in _periodos_aleatorios(rng, qtd)]
+
+
+# ==========================
+# CASOS
+# ==========================
+def casos(funcao, rng):
+    """Lista de (nome_do_caso, args) para a função."""
+    if funcao == "parse_date_any":
+        return [(nome, (valor,)) for nome, valor in DATAS.items()]
+    if funcao == "_get_value":
+        item = {"inicio_data": "", "data_inicio": None, "inicio": "01/01/2020", "fim": "31/12/2020"}
+        return [
+            ("primeira_chave", ({"inicio_data": "01/01/2020"}, ["inicio_data", "data_inicio", "inicio", "data"])),
+            ("terceira_chave", (item, ["inicio_data", "data_inicio", "inicio", "data"])),
+            ("ausente", (item, ["detalhamento", "detalhe", "motivo"])),
+        ]
+    if funcao == "extract_periods_from_response":
+        return [(f, (resposta_sintetica(f, rng),)) for f in FORMATOS_RESPOSTA] + [
+            ("infosimples_20_periodos", (resposta_sintetica("infosimples", rng, 20),)),
+        ]
+    if funcao == "is_month_fully_covered":
+        periodos = periodos_sinteticos(rng, 4)
+        return [("4_periodos_mes_2021_06", (periodos, 2021, 6)),
+                ("20_periodos_mes_2023_02", (periodos_sinteticos(rng, 20), 2023, 2))]
+    if funcao == "covers_year_with_rules":
+        hoje = date.today()
+        return [("4_periodos_ano_fechado", (periodos_sinteticos(rng, 4), 2021, hoje)),
+                ("4_periodos_ano_atual", (periodos_sinteticos(rng, 4), hoje.year, hoje)),
+                ("20_periodos", (periodos_sinteticos(rng, 20), 2022, hoje))]
+    if funcao == "periods_to_string":
+        return [("4_periodos", (periodos_sinteticos(rng, 4),)),
+                ("20_periodos", (periodos_sinteticos(rng, 20),))]
+    raise ValueError(funcao)
+
+
+def medir(fn, args, repeticoes):
+    """Mediana de ns por chamada entre `repeticoes` rodadas calibradas pelo timeit."""
+    timer = timeit.Timer(lambda: fn(*args))
+    numero, _ = timer.autorange()
+    tempos = timer.repeat(repeat=repeticoes, number=numero)
+    return statistics.median(tempos) / numero * 1e9, min(tempos) / numero * 1e9
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--funcoes", default=",".join(FUNCOES))
+    ap.add_argument("--modulos", default=",".join(MODULOS))
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--tolerancia", type=float, default=0.25, help="piora relativa aceita antes de falhar")
+    ap.add_argument("--baseline", default=str(BASELINE_FILE))
+    ap.add_argument("--gravar-baseline", action="store_true")
+    args = ap.parse_args(argv)
+
+    funcoes = [f.strip() for f in args.funcoes.split(",") if f.strip()]
+    modulos = {nome: importlib.import_module(nome) for nome in args.modulos.split(",") if nome.strip()}
+
+    resultados = {}
+    print(f"{'função / caso':<58} {'módulo':<34} {'mediana':>11} {'melhor':>11}")
+    for funcao in funcoes:
+        # mesma semente por função: todas as cópias recebem as mesmas entradas
+        for caso, fargs in casos(funcao, random.Random(args.semente)):
+            for nome_mod, mod in modulos.items():
+                fn = getattr(mod, funcao, None)
+                if fn is None:
+                    continue
+                mediana, melhor = medir(fn, fargs, args.repeticoes)
+                chave = f"{funcao}[{caso}]@{nome_mod}"
+                resultados[chave] = {"mediana_ns": round(mediana, 1), "melhor_ns": round(melhor, 1)}
+                print(f"{funcao + '[' + caso + ']':<58} {nome_mod:<34} "
+                      f"{mediana / 1000:>9.2f}µs {melhor / 1000:>9.2f}µs")
+
+    baseline_path = Path(args.baseline)
+    if args.gravar_baseline:
+        atual = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+        atual.setdefault("casos", {}).update(resultados)
+        atual["maquina"] = f"{platform.machine()} • Python {platform.python_version()}"
+        baseline_path.write_text(json.dumps(atual, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\n💾 Baseline gravado em {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"\n⚠️  Sem baseline em {baseline_path}; rode com --gravar-baseline.")
+        return 0
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")).get("casos", {})
+    falhas = []
+    for chave, r in resultados.items():
+        b = baseline.get(chave)
+        # compara o melhor tempo: é o menos sensível a ruído da máquina
+        if b and r["melhor_ns"] > b["melhor_ns"] * (1 + args.tolerancia):
+            falhas.append(f"{chave}: {r['melhor_ns'] / 1000:.2f}µs (baseline {b['melhor_ns'] / 1000:.2f}µs)")
+    if falhas:
+        print(f"\n❌ Regressão nas funções (tolerância {args.tolerancia:.0%}):")
+        for f in falhas:
+            print(f"  - {f}")
+        return 1
+    print(f"\n✅ Dentro de {args.tolerancia:.0%} do baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
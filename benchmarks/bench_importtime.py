@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Orçamento de tempo de inicialização dos scripts de consulta.
+
+Roda cada entry point com `python -X importtime` (o --help, ou só o import para quem
+não tem CLI), soma o tempo de import além do interpretador "vazio" e falha quando:
+  - o tempo passa de --limite-ms, ou
+  - alguma biblioteca pesada (pandas, requests, openpyxl...) é carregada só para isso.
+
+Uso (da raiz do repositório):
+    python benchmarks/bench_importtime.py
+    python benchmarks/bench_importtime.py --limite-ms 200 --repeticoes 7
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# (descrição, argumentos do python)
+ENTRY_POINTS = [
+    ("consulta_simples_mensal.py --help", ["consulta_simples_mensal.py", "--help"]),
+    ("consulta_simples_anual.py --help", ["consulta_simples_anual.py", "--help"]),
+    ("consulta_simples_mensal_planilha.py --help", ["consulta_simples_mensal_planilha.py", "--help"]),
+    ("import consulta_simples_add_planilha", ["-c", "import consulta_simples_add_planilha"]),
+]
+
+# Só devem ser carregadas no caminho que realmente as usa (consulta/gravação)
+HEAVY_MODULES = ("pandas", "numpy", "requests", "urllib3", "openpyxl", "pyarrow", "tqdm", "dateutil")
+
+
+def run_importtime(args):
+    """Executa o python com -X importtime e devolve (tempo_import_ms, módulos_top_level, wall_ms)."""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"'{' '.join(args)}' terminou com código {proc.returncode}:\n{proc.stderr[-2000:]}")
+
+    total_us = 0
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _cumulative, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        modules.add(name.strip().split(".")[0])
+    return total_us / 1000, modules, wall_ms
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--limite-ms", type=float, default=150.0,
+                    help="tempo máximo de import além do interpretador vazio (mediana)")
+    ap.add_argument("--repeticoes", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    base = [run_importtime(["-c", "pass"]) for _ in range(args.repeticoes)]
+    base_import_ms = statistics.median(b[0] for b in base)
+    base_wall_ms = statistics.median(b[2] for b in base)
+    base_modules = base[0][1]
+
+    print(f"Interpretador vazio: import {base_import_ms:.1f} ms, wall {base_wall_ms:.1f} ms")
+    print(f"{'entry point':<45} {'import (ms)':>12} {'wall (ms)':>10}  pesados")
+
+    failures = []
+    for label, cmd in ENTRY_POINTS:
+        runs = [run_importtime(cmd) for _ in range(args.repeticoes)]
+        import_ms = statistics.median(r[0] for r in runs) - base_import_ms
+        wall_ms = statistics.median(r[2] for r in runs) - base_wall_ms
+        heavy = sorted(m for m in runs[0][1] - base_modules if m in HEAVY_MODULES)
+        print(f"{label:<45} {import_ms:>12.1f} {wall_ms:>10.1f}  {', '.join(heavy) or '-'}")
+
+        if import_ms > args.limite_ms:
+            failures.append(f"{label}: {import_ms:.1f} ms de import (limite {args.limite_ms:.0f} ms)")
+        if heavy:
+            failures.append(f"{label}: carrega {', '.join(heavy)} na inicialização")
+
+    if failures:
+        print("\n❌ Regressão no tempo de inicialização:")
+        for f in failures:
+            print(f"  - {f}")
+        return 1
+    print("\n✅ Inicialização dentro do orçamento.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
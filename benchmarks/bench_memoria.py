@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Regressão de memória do pipeline da página (Interface/processamento.py).
+
+Para cada tamanho, roda num python novo o mesmo caminho de um upload:
+  upload     bytes do .xlsx enviado
+  leitura    pd.read_excel dos bytes
+  consulta   process_dataframe contra o provedor local (linhas + DataFrame)
+  planilha   add_sheet_into_excel_bytes (workbook openpyxl + bytes de saída)
+
+e registra, por etapa, o pico de RSS do processo, o pico do tracemalloc e os
+principais pontos de alocação que continuam vivos no fim da etapa.
+
+Falha (código 1) quando a memória por CNPJ passa de --orcamento-kb-por-cnpj. Com dois
+ou mais tamanhos vale a inclinação entre o menor e o maior (desconta o custo fixo
+de imports); com um só, o pico dividido pelo número de CNPJs.
+
+Uso (da raiz do repositório):
+    python benchmarks/bench_memoria.py
+    python benchmarks/bench_memoria.py --tamanhos 500,2000 --top 15 --json memoria.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Interface"))
+
+from bench_throughput import iniciar_provedor  # noqa: E402
+from provedor_local import gerar_corpus  # noqa: E402
+
+ETAPAS = ("upload", "leitura", "consulta", "planilha")
+
+
+# ==========================
+# RSS (Linux: /proc; demais: só o pico do processo)
+# ==========================
+def _status_kb(campo):
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(campo + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    kb = _status_kb("VmRSS")
+    return kb / 1024 if kb is not None else None
+
+
+def pico_rss_mb():
+    kb = _status_kb("VmHWM")
+    if kb is None:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        kb = maxrss / 1024 if sys.platform == "darwin" else maxrss
+    return kb / 1024
+
+
+def zerar_pico_rss():
+    # "5" em clear_refs zera o VmHWM (Linux >= 4.0); sem isso o pico vira cumulativo
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# ==========================
+# PROCESSO FILHO: roda as etapas de um tamanho
+# ==========================
+def medir_etapas(entrada, api_url, top):
+    import pandas as pd
+    from io import BytesIO
+    from consulta_http import build_session
+    from processamento import add_sheet_into_excel_bytes, process_dataframe
+
+    # session (e o import do requests) criada antes das medições, como a página faz no
+    # LookupService: assim ela não aparece como alocação da etapa "consulta"
+    session = build_session()
+
+    resultado = {"rss_base_mb": round(rss_mb() or pico_rss_mb(), 1), "etapas": {}}
+    vivos = {}
+    # 1 frame por alocação basta para o agrupamento por linha e deixa o tracemalloc bem mais leve
+    tracemalloc.start(1)
+
+    def etapa(nome, fn):
+        por_etapa = zerar_pico_rss()
+        tracemalloc.reset_peak()
+        antes = tracemalloc.take_snapshot()
+        t0 = time.perf_counter()
+        vivos[nome] = fn()
+        dur = time.perf_counter() - t0
+        _, pico_traced = tracemalloc.get_traced_memory()
+        depois = tracemalloc.take_snapshot()
+        sites = []
+        for st in depois.compare_to(antes, "lineno")[:top]:
+            frame = st.traceback[0]
+            sites.append({
+                "local": f"{os.path.relpath(frame.filename, ROOT) if frame.filename.startswith(str(ROOT)) else frame.filename}:{frame.lineno}",
+                "kb": round(st.size_diff / 1024, 1),
+                "blocos": st.count_diff,
+            })
+        resultado["etapas"][nome] = {
+            "duracao_s": round(dur, 3),
+            "rss_mb": round(rss_mb() or 0, 1),
+            "pico_rss_mb": round(pico_rss_mb(), 1),
+            "pico_rss_e_da_etapa": por_etapa,
+            "pico_tracemalloc_mb": round(pico_traced / 1024 / 1024, 1),
+            "top_alocacoes": sites,
+        }
+
+    # mesma sequência do JobRunner da página: tudo fica vivo até o fim do job
+    etapa("upload", lambda: Path(entrada).read_bytes())
+    etapa("leitura", lambda: pd.read_excel(BytesIO(vivos["upload"])))
+    etapa("consulta", lambda: process_dataframe(vivos["leitura"], api_url, "bench", sleep_seconds=0,
+                                                    session=session))
+    etapa("planilha", lambda: add_sheet_into_excel_bytes(vivos["upload"], vivos["consulta"]))
+    tracemalloc.stop()
+    resultado["pico_rss_mb"] = round(max(e["pico_rss_mb"] for e in resultado["etapas"].values()), 1)
+    return resultado
+
+
+# ==========================
+# PROCESSO PAI
+# ==========================
+def gerar_upload(n, pasta, semente):
+    from openpyxl import Workbook
+    path = pasta / f"upload_{n}.xlsx"
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Notas")
+    ws.append(["cnpj_part", "chave_nfe", "valor"])
+    for i, cnpj in enumerate(gerar_corpus(n, semente)):
+        # algumas colunas extras, como nas planilhas de EFD reais
+        ws.append([cnpj, f"{i:044d}", round(i * 1.37, 2)])
+    wb.save(path)
+    return path
+
+
+def rodar_tamanho(n, api_url, pasta, semente, top):
+    entrada = gerar_upload(n, pasta, semente)
+    proc = subprocess.run(
+        [sys.executable, __file__, "--_filho", str(entrada), "--api-url", api_url, "--top", str(top)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"tamanho {n} terminou com código {proc.returncode}:\n{proc.stderr[-3000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tamanhos", default="200,500,1000")
+    ap.add_argument("--orcamento-kb-por-cnpj", type=float, default=1000.0)
+    ap.add_argument("--top", type=int, default=8, help="pontos de alocação listados por etapa")
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--json", default=None, help="grava o relatório completo neste arquivo")
+    ap.add_argument("--api-url", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--_filho", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args._filho:
+        print(json.dumps(medir_etapas(args._filho, args.api_url, args.top), ensure_ascii=False))
+        return 0
+
+    tamanhos = sorted(int(t) for t in args.tamanhos.split(",") if t.strip())
+    provedor, base = iniciar_provedor("zero", args.semente)
+    relatorio = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_memoria_") as tmp:
+            for n in tamanhos:
+                r = rodar_tamanho(n, base + "/", Path(tmp), args.semente, args.top)
+                relatorio[n] = r
+                print(f"\n=== {n} CNPJs • pico RSS {r['pico_rss_mb']:.1f} MB (base {r['rss_base_mb']:.1f} MB) ===")
+                for nome in ETAPAS:
+                    e = r["etapas"][nome]
+                    print(f"  {nome:<9} pico RSS {e['pico_rss_mb']:>7.1f} MB  RSS fim {e['rss_mb']:>7.1f} MB  "
+                          f"pico tracemalloc {e['pico_tracemalloc_mb']:>7.1f} MB  ({e['duracao_s']:.1f}s)")
+                    for s in e["top_alocacoes"][:args.top]:
+                        print(f"      {s['kb']:>10.1f} KB  {s['blocos']:>8} blocos  {s['local']}")
+    finally:
+        provedor.terminate()
+        provedor.wait()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(relatorio, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if len(tamanhos) >= 2:
+        menor, maior = tamanhos[0], tamanhos[-1]
+        kb_por_cnpj = ((relatorio[maior]["pico_rss_mb"] - relatorio[menor]["pico_rss_mb"]) * 1024
+                       / (maior - menor))
+        como = f"inclinação entre {menor} e {maior} CNPJs"
+    else:
+        n = tamanhos[0]
+        kb_por_cnpj = (relatorio[n]["pico_rss_mb"] - relatorio[n]["rss_base_mb"]) * 1024 / n
+        como = f"pico acima da base com {n} CNPJs"
+
+    print(f"\nMemória por CNPJ: {kb_por_cnpj:.1f} KB ({como}); orçamento {args.orcamento_kb_por_cnpj:.0f} KB")
+    if kb_por_cnpj > args.orcamento_kb_por_cnpj:
+        print("❌ Acima do orçamento de memória.")
+        return 1
+    print("✅ Dentro do orçamento de memória.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
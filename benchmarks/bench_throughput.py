@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput ponta a ponta dos pipelines de consulta contra o provedor local.
+
+Sobe o provedor_local.py num processo próprio, roda cada pipeline (mensal, anual e
+a escrita na planilha) num subprocesso com SLEEP=0 e mede, por cenário:
+  - CNPJs/s e tempo de parede
+  - tempo de CPU (usuário + sistema) do subprocesso
+  - pico de memória (RSS máximo)
+
+Os números são comparados com o baseline gravado (benchmarks/baseline_throughput.json);
+queda de CNPJs/s ou aumento de CPU/RSS acima de --tolerancia faz o script sair com código 1.
+
+Por padrão roda as três faixas (1k, 10k e 100k CNPJs; o 100k leva dezenas de minutos).
+--rapido roda só a de 1k, para conferir uma mudança antes de rodar tudo.
+
+CNPJs/s e CPU dependem da máquina. Por isso cada execução (e o baseline) mede antes
+um trabalho fixo de CPU em Python puro (calibração), e a comparação usa a razão entre
+as duas calibrações: um baseline gravado numa máquina 2x mais rápida espera metade
+dos CNPJs/s aqui. O pico de RSS é comparado direto.
+
+Uso (da raiz do repositório):
+    python benchmarks/bench_throughput.py                       # 1k/10k/100k, compara com o baseline
+    python benchmarks/bench_throughput.py --rapido              # só 1k
+    python benchmarks/bench_throughput.py --gravar-baseline     # atualiza o baseline
+    python benchmarks/bench_throughput.py --pipelines mensal --latencia fixa:20
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline_throughput.json"
+
+sys.path.insert(0, str(ROOT))
+from provedor_local import gerar_corpus  # noqa: E402
+
+# A escrita na planilha grava tudo numa aba do .xlsx: ~82 linhas por CNPJ estouram o
+# limite de linhas do Excel acima de ~12k CNPJs, então o cenário de 100k fica de fora.
+ADD_PLANILHA_MAX_CNPJS = 10_000
+
+TAMANHOS_PADRAO = "1000,10000,100000"
+TAMANHOS_RAPIDO = "1000"
+
+# Trabalho fixo para medir a velocidade da máquina (o mesmo tipo de custo dos pipelines:
+# JSON, datas e dicts em Python puro); imprime só o tempo do laço, sem a partida do python
+CALIBRACAO = (
+    "import json, time\n"
+    "from datetime import date, datetime\n"
+    "t0 = time.perf_counter()\n"
+    "for i in range(30000):\n"
+    "    d = date(2020 + i % 6, 1 + i % 12, 1 + i % 28).strftime('%d/%m/%Y')\n"
+    "    j = json.loads(json.dumps({'inicio_data': d, 'i': i, 'detalhe': 'x' * (i % 20)}))\n"
+    "    datetime.strptime(j['inicio_data'], '%d/%m/%Y')\n"
+    "print(time.perf_counter() - t0)\n"
+)
+
+# Cada pipeline roda num python novo; as globais do módulo fazem o papel do .env
+RUNNERS = {
+    "mensal": (
+        "import consulta_simples_mensal as m\n"
+        "m.API_URL, m.API_KEY, m.SLEEP, m.DEBUG = {api_url!r}, 'bench', 0, False\n"
+        "m.INPUT_FILE, m.OUTPUT_FILE = {entrada!r}, {saida!r}\n"
+        "m.main(formato={formato!r})\n"
+    ),
+    "anual": (
+        "import consulta_simples_anual as m\n"
+        "m.API_URL, m.API_KEY, m.SLEEP, m.DEBUG = {api_url!r}, 'bench', 0, False\n"
+        "m.INPUT_FILE, m.OUTPUT_FILE = {entrada!r}, {saida!r}\n"
+        "m.main(formato={formato!r})\n"
+    ),
+    "add_planilha": (
+        "import consulta_simples_add_planilha as m\n"
+        "m.API_URL, m.API_KEY, m.SLEEP, m.DEBUG = {api_url!r}, 'bench', 0, False\n"
+        "m.main({entrada!r})\n"
+    ),
+}
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_provedor(latencia, semente):
+    porta = _porta_livre()
+    proc = subprocess.Popen(
+        [sys.executable, str(ROOT / "provedor_local.py"), "--porta", str(porta),
+         "--latencia", latencia, "--semente", str(semente)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{porta}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + "/status", timeout=1).read()
+            return proc, base
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("provedor local não subiu")
+
+
+def preparar_entrada(pipeline, cnpjs, pasta):
+    if pipeline == "add_planilha":
+        from openpyxl import Workbook
+        path = pasta / f"entrada_{len(cnpjs)}.xlsx"
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Dados")
+        ws.append(["cnpj_part"])
+        for c in cnpjs:
+            ws.append([c])
+        wb.save(path)
+        return path
+    path = pasta / f"entrada_{len(cnpjs)}.txt"
+    if not path.exists():
+        path.write_text("\n".join(cnpjs) + "\n", encoding="utf-8")
+    return path
+
+
+def calibrar(repeticoes=5):
+    """Segundos do trabalho fixo de CALIBRACAO nesta máquina (melhor de N)."""
+    tempos = []
+    for _ in range(repeticoes):
+        out = subprocess.run([sys.executable, "-c", CALIBRACAO], capture_output=True, text=True, check=True)
+        tempos.append(float(out.stdout.strip()))
+    return round(min(tempos), 4)
+
+
+def rodar_cenario(pipeline, n, api_url, pasta, formato, semente):
+    """Roda um pipeline num subprocesso e devolve as medições do cenário."""
+    cnpjs = gerar_corpus(n, semente)
+    entrada = preparar_entrada(pipeline, cnpjs, pasta)
+    saida = pasta / f"saida_{pipeline}_{n}.{'csv.gz' if formato == 'csv' else formato}"
+    code = RUNNERS[pipeline].format(api_url=api_url, entrada=str(entrada), saida=str(saida), formato=formato)
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # wait4 devolve o rusage só deste filho (CPU e RSS máximo)
+    stderr_tail = b""
+    while True:
+        chunk = proc.stderr.read(65536)
+        if not chunk:
+            break
+        stderr_tail = (stderr_tail + chunk)[-4000:]
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{pipeline}@{n} terminou com código {proc.returncode}:\n"
+                           f"{stderr_tail.decode('utf-8', 'replace')}")
+
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    rss_mb = rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {
+        "cnpjs": n,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(rusage.ru_utime + rusage.ru_stime, 3),
+        "pico_rss_mb": round(rss_mb, 1),
+        "cnpjs_por_s": round(n / wall, 2) if wall > 0 else 0.0,
+    }
+
+
+def comparar(resultados, baseline, tolerancia, escala=1.0):
+    """
+    `escala` = calibração desta máquina / calibração do baseline (>1: máquina mais
+    lenta). CNPJs/s esperado = baseline / escala; CPU esperada = baseline * escala.
+    """
+    falhas = []
+    for chave, r in resultados.items():
+        b = baseline.get(chave)
+        if not b:
+            continue
+        esperado_cps, esperado_cpu = b["cnpjs_por_s"] / escala, b["cpu_s"] * escala
+        if r["cnpjs_por_s"] < esperado_cps * (1 - tolerancia):
+            falhas.append(f"{chave}: {r['cnpjs_por_s']:.1f} CNPJs/s (esperado {esperado_cps:.1f} "
+                          f"= baseline {b['cnpjs_por_s']:.1f} ÷ {escala:.2f})")
+        if r["cpu_s"] > esperado_cpu * (1 + tolerancia):
+            falhas.append(f"{chave}: CPU {r['cpu_s']:.2f}s (esperado {esperado_cpu:.2f}s "
+                          f"= baseline {b['cpu_s']:.2f}s × {escala:.2f})")
+        if r["pico_rss_mb"] > b["pico_rss_mb"] * (1 + tolerancia):
+            falhas.append(f"{chave}: pico RSS {r['pico_rss_mb']:.0f} MB (baseline {b['pico_rss_mb']:.0f} MB)")
+    return falhas
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tamanhos", default=None,
+                    help=f"lista de quantidades de CNPJs (padrão {TAMANHOS_PADRAO})")
+    ap.add_argument("--rapido", action="store_true", help=f"só a faixa de {TAMANHOS_RAPIDO} CNPJs")
+    ap.add_argument("--pipelines", default=",".join(RUNNERS), help=f"subconjunto de {', '.join(RUNNERS)}")
+    ap.add_argument("--latencia", default="zero",
+                    help="latência do provedor local (padrão zero: mede só o custo do lado do cliente)")
+    ap.add_argument("--formato", default="csv", choices=("xlsx", "parquet", "csv", "jsonl"),
+                    help="formato de saída de mensal/anual")
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--repeticoes", type=int, default=3, help="runs por cenário (vale o melhor valor de cada métrica)")
+    ap.add_argument("--tolerancia", type=float, default=0.20, help="piora relativa aceita antes de falhar")
+    ap.add_argument("--baseline", default=str(BASELINE_FILE))
+    ap.add_argument("--gravar-baseline", action="store_true")
+    args = ap.parse_args(argv)
+
+    spec = args.tamanhos or (TAMANHOS_RAPIDO if args.rapido else TAMANHOS_PADRAO)
+    tamanhos = [int(t) for t in spec.split(",") if t.strip()]
+    pipelines = [p.strip() for p in args.pipelines.split(",") if p.strip()]
+    desconhecidos = set(pipelines) - set(RUNNERS)
+    if desconhecidos:
+        ap.error(f"pipeline desconhecido: {', '.join(sorted(desconhecidos))}")
+
+    calibracao = calibrar()
+    print(f"Calibração da máquina: {calibracao:.3f}s")
+    provedor, base = iniciar_provedor(args.latencia, args.semente)
+    resultados = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_throughput_") as tmp:
+            pasta = Path(tmp)
+            print(f"Provedor local em {base} (latência {args.latencia})")
+            print(f"{'cenário':<22} {'CNPJs/s':>10} {'wall (s)':>10} {'CPU (s)':>10} {'pico RSS (MB)':>14}")
+            for pipeline in pipelines:
+                for n in tamanhos:
+                    chave = f"{pipeline}@{n}"
+                    if pipeline == "add_planilha" and n > ADD_PLANILHA_MAX_CNPJS:
+                        print(f"{chave:<22} {'-':>10}  (acima do limite de linhas do Excel)")
+                        continue
+                    # melhor de N por métrica: o ruído da máquina só piora os números, nunca melhora
+                    runs = [rodar_cenario(pipeline, n, base + "/", pasta, args.formato, args.semente)
+                            for _ in range(args.repeticoes)]
+                    r = {
+                        "cnpjs": n,
+                        "wall_s": min(x["wall_s"] for x in runs),
+                        "cpu_s": min(x["cpu_s"] for x in runs),
+                        "pico_rss_mb": min(x["pico_rss_mb"] for x in runs),
+                        "cnpjs_por_s": max(x["cnpjs_por_s"] for x in runs),
+                    }
+                    resultados[chave] = r
+                    print(f"{chave:<22} {r['cnpjs_por_s']:>10.1f} {r['wall_s']:>10.2f} "
+                          f"{r['cpu_s']:>10.2f} {r['pico_rss_mb']:>14.1f}")
+    finally:
+        provedor.terminate()
+        provedor.wait()
+
+    baseline_path = Path(args.baseline)
+    if args.gravar_baseline:
+        atual = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+        atual.setdefault("cenarios", {}).update(resultados)
+        atual["maquina"] = f"{platform.machine()} • {os.cpu_count()} CPUs • Python {platform.python_version()}"
+        atual["calibracao_s"] = calibracao
+        atual["latencia"] = args.latencia
+        atual["formato"] = args.formato
+        baseline_path.write_text(json.dumps(atual, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\n💾 Baseline gravado em {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"\n⚠️  Sem baseline em {baseline_path}; rode com --gravar-baseline.")
+        return 0
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if (baseline.get("latencia"), baseline.get("formato")) != (args.latencia, args.formato):
+        print(f"\n⚠️  Baseline gravado com latência {baseline.get('latencia')} / formato {baseline.get('formato')}; "
+              "a comparação pode não fazer sentido.")
+    escala = 1.0
+    if baseline.get("calibracao_s"):
+        escala = calibracao / baseline["calibracao_s"]
+        print(f"\nEsta máquina: {escala:.2f}x o tempo de calibração do baseline ({baseline.get('maquina')}).")
+    else:
+        print("\n⚠️  Baseline sem calibração: CNPJs/s e CPU comparados em valor absoluto.")
+    falhas = comparar(resultados, baseline.get("cenarios", {}), args.tolerancia, escala)
+    if falhas:
+        print(f"\n❌ Regressão de throughput (tolerância {args.tolerancia:.0%}):")
+        for f in falhas:
+            print(f"  - {f}")
+        return 1
+    print(f"\n✅ Dentro de {args.tolerancia:.0%} do baseline (ajustado pela calibração).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Limite de requisições e cota compartilhados entre processos (SQLite com lock).
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from metricas import METRICS
+
+# Menor número passa na frente: consulta da página (interativa) antes de lote
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_LOTE = 10
+
+BROKER_ENV = "CONSULTA_BROKER"            # caminho do .sqlite3 compartilhado ("1" = padrão)
+DEFAULT_BROKER_PATH = os.path.join(os.path.expanduser("~"), ".consulta_broker.sqlite3")
+
+# Ritmo por provedor: "N/s", "N/min" ou "N/h". Sobrescreva com CONSULTA_LIMITE_<PROVEDOR>
+DEFAULT_LIMITS = {
+    "receitaws": "3/min",
+    "infosimples": None,
+}
+# Cota diária opcional por provedor: CONSULTA_COTA_<PROVEDOR>=1000
+WAITER_STALE_SECONDS = 15.0
+POLL_MAX_SECONDS = 0.5
+
+_UNITS = {"s": 1.0, "seg": 1.0, "min": 60.0, "h": 3600.0}
+
+
+class QuotaExceeded(RuntimeError):
+    """A cota diária do provedor/chave acabou."""
+
+
+def parse_rate(spec):
+    """"3/min" -> (tokens_por_segundo, rajada). None/"" -> None (sem limite)."""
+    if not spec:
+        return None
+    n, _, unit = str(spec).partition("/")
+    n = float(n)
+    return n / _UNITS[(unit or "s").strip().lower()], max(1.0, n)
+
+
+def key_id(provider, api_key):
+    # a chave da API nunca vai para o arquivo: só um hash curto dela
+    h = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+    return f"{provider}:{h}"
+
+
+class RateBroker:
+    """
+    Token bucket por (provedor, API_KEY) guardado num SQLite que todos os processos
+    abrem (scripts de lote, página Streamlit, upload local). Quem quer fazer uma
+    requisição entra na fila de espera com uma prioridade; só a cabeça da fila
+    (menor prioridade, depois o mais antigo) pode pegar a ficha quando houver.
+
+        broker = RateBroker("~/.consulta_broker.sqlite3")
+        broker.acquire("receitaws", api_key, priority=PRIORIDADE_LOTE)
+    """
+
+    def __init__(self, path=None, limits=None, quotas=None):
+        self.path = os.path.expanduser(str(path or DEFAULT_BROKER_PATH))
+        self.limits = {p: parse_rate(os.getenv(f"CONSULTA_LIMITE_{p.upper()}", spec))
+                       for p, spec in DEFAULT_LIMITS.items()}
+        self.limits.update({p: parse_rate(spec) for p, spec in (limits or {}).items()})
+        self.quotas = {p: int(os.getenv(f"CONSULTA_COTA_{p.upper()}")) for p in DEFAULT_LIMITS
+                       if os.getenv(f"CONSULTA_COTA_{p.upper()}")}
+        self.quotas.update(quotas or {})
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS fichas ("
+            " chave TEXT PRIMARY KEY, tokens REAL NOT NULL, atualizado REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS espera ("
+            " id TEXT PRIMARY KEY, chave TEXT NOT NULL, prioridade INTEGER NOT NULL,"
+            " criado REAL NOT NULL, visto REAL NOT NULL, pid INTEGER);"
+            "CREATE TABLE IF NOT EXISTS cota ("
+            " chave TEXT NOT NULL, dia TEXT NOT NULL, usados INTEGER NOT NULL,"
+            " PRIMARY KEY (chave, dia));"
+        )
+
+    # ---------- API ----------
+    def acquire(self, provider, api_key=None, priority=PRIORIDADE_LOTE, timeout=None):
+        """Bloqueia até haver ficha para este processo. Devolve o tempo esperado (s)."""
+        rate = self.limits.get(provider)
+        quota = self.quotas.get(provider)
+        if rate is None and quota is None:
+            return 0.0
+        chave = key_id(provider, api_key)
+        waiter = uuid.uuid4().hex
+        t0 = time.monotonic()
+        try:
+            while True:
+                wait = self._try_take(chave, waiter, priority, rate, quota)
+                if wait <= 0:
+                    waited = time.monotonic() - t0
+                    METRICS.observe("broker_espera", waited, provider=provider)
+                    return waited
+                if timeout is not None and time.monotonic() - t0 + wait > timeout:
+                    raise TimeoutError(f"sem ficha para {provider} em {timeout:.0f}s")
+                time.sleep(min(wait, POLL_MAX_SECONDS))
+        finally:
+            self._leave(waiter)
+
+    def usage(self, provider, api_key=None):
+        """Requisições já contadas hoje para a cota desta chave."""
+        with self._lock:
+            row = self._conn.execute("SELECT usados FROM cota WHERE chave = ? AND dia = ?",
+                                     (key_id(provider, api_key), time.strftime("%Y-%m-%d"))).fetchone()
+        return row[0] if row else 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------- fila + balde (uma transação por tentativa) ----------
+    def _try_take(self, chave, waiter, priority, rate, quota):
+        now = time.time()
+        with self._lock:
+            c = self._conn
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                c.execute("DELETE FROM espera WHERE visto < ?", (now - WAITER_STALE_SECONDS,))
+                c.execute(
+                    "INSERT INTO espera (id, chave, prioridade, criado, visto, pid) VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(id) DO UPDATE SET visto = excluded.visto",
+                    (waiter, chave, priority, now, now, os.getpid()),
+                )
+                head = c.execute(
+                    "SELECT id FROM espera WHERE chave = ? ORDER BY prioridade, criado LIMIT 1", (chave,)
+                ).fetchone()
+                if head[0] != waiter:
+                    c.execute("COMMIT")
+                    return POLL_MAX_SECONDS / 5
+
+                if quota is not None:
+                    dia = time.strftime("%Y-%m-%d")
+                    row = c.execute("SELECT usados FROM cota WHERE chave = ? AND dia = ?", (chave, dia)).fetchone()
+                    if row and row[0] >= quota:
+                        c.execute("DELETE FROM espera WHERE id = ?", (waiter,))
+                        c.execute("COMMIT")
+                        raise QuotaExceeded(f"cota diária de {quota} requisições esgotada para {chave}")
+
+                if rate is not None:
+                    per_s, burst = rate
+                    row = c.execute("SELECT tokens, atualizado FROM fichas WHERE chave = ?", (chave,)).fetchone()
+                    tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * per_s)
+                    if tokens < 1.0:
+                        c.execute("INSERT OR REPLACE INTO fichas (chave, tokens, atualizado) VALUES (?, ?, ?)",
+                                  (chave, tokens, now))
+                        c.execute("COMMIT")
+                        return (1.0 - tokens) / per_s
+                    c.execute("INSERT OR REPLACE INTO fichas (chave, tokens, atualizado) VALUES (?, ?, ?)",
+                              (chave, tokens - 1.0, now))
+
+                if quota is not None:
+                    c.execute(
+                        "INSERT INTO cota (chave, dia, usados) VALUES (?, ?, 1)"
+                        " ON CONFLICT(chave, dia) DO UPDATE SET usados = usados + 1",
+                        (chave, time.strftime("%Y-%m-%d")),
+                    )
+                c.execute("DELETE FROM espera WHERE id = ?", (waiter,))
+                c.execute("COMMIT")
+                return 0.0
+            except QuotaExceeded:
+                raise
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+
+    def _leave(self, waiter):
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM espera WHERE id = ?", (waiter,))
+            except sqlite3.Error:
+                pass
+
+
+_default_broker = None
+_default_broker_loaded = False
+_default_broker_lock = threading.Lock()
+
+
+def default_broker():
+    """Broker do processo, ligado pela variável CONSULTA_BROKER (None se não definida)."""
+    global _default_broker, _default_broker_loaded
+    if not _default_broker_loaded:
+        with _default_broker_lock:
+            if not _default_broker_loaded:
+                path = os.getenv(BROKER_ENV)
+                if path:
+                    _default_broker = RateBroker(None if path == "1" else path)
+                _default_broker_loaded = True
+    return _default_broker
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Cache persistente (SQLite) das respostas por CNPJ, com validade (TTL).
+
+import json
+import sqlite3
+import threading
+import time
+
+from metricas import METRICS
+
+
+class ConsultaCache:
+    """
+    Guarda o JSON devolvido pelo provedor para cada (origem, CNPJ); a origem é
+    consulta_http.source_key (provedor + URL), então endpoints diferentes não se misturam.
+    Pode ser compartilhado entre threads; entradas mais velhas que `ttl_seconds`
+    são ignoradas (e sobrescritas na próxima consulta).
+    """
+
+    def __init__(self, path, ttl_seconds=24 * 3600):
+        self.path = str(path)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            " provedor TEXT NOT NULL,"
+            " cnpj TEXT NOT NULL,"
+            " status INTEGER,"
+            " resposta TEXT NOT NULL,"
+            " gravado_em REAL NOT NULL,"
+            " PRIMARY KEY (provedor, cnpj))"
+        )
+        self._conn.commit()
+
+    def get(self, provider, cnpj):
+        """Devolve (status, json) se houver resposta válida no cache, senão None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, resposta, gravado_em FROM respostas WHERE provedor = ? AND cnpj = ?",
+                (provider, cnpj),
+            ).fetchone()
+            if row is None or time.time() - row[2] > self.ttl_seconds:
+                self.misses += 1
+                METRICS.inc("cache", resultado="miss")
+                return None
+            self.hits += 1
+        METRICS.inc("cache", resultado="hit")
+        return row[0], json.loads(row[1])
+
+    def set(self, provider, cnpj, status, resp_json):
+        payload = json.dumps(resp_json, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respostas (provedor, cnpj, status, resposta, gravado_em) VALUES (?, ?, ?, ?, ?)",
+                (provider, cnpj, status, payload, time.time()),
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM respostas WHERE gravado_em >= ?",
+                (time.time() - self.ttl_seconds,),
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# Pool de tokens da InfoSimples: distribui as consultas pelo saldo de cada chave.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from metricas import METRICS
+
+KEYS_ENV = "API_KEYS"                      # "tok1,tok2:500:10000,..." (token[:diário[:mensal]])
+DB_ENV = "CONSULTA_CHAVES_DB"
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".consulta_chaves.sqlite3")
+BENCH_SECONDS = 15 * 60                    # quanto tempo a chave fica de fora depois de esgotar
+
+# Sinais de chave sem saldo/limite: HTTP 402/429 ou code_message falando em limite/saldo
+EXHAUSTED_HTTP = (402, 429)
+EXHAUSTED_WORDS = ("limite", "saldo", "credito", "crédito", "cota", "quota", "excedid")
+
+
+class KeysExhausted(RuntimeError):
+    """Todas as chaves do pool bateram o limite diário/mensal."""
+
+
+def key_label(key):
+    # identificação das chaves em métricas, logs e no .sqlite3 (o token em si não é gravado)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+
+def parse_keys(spec):
+    """"a,b:500:10000" -> [("a", None, None), ("b", 500, 10000)]"""
+    out = []
+    for item in (spec or "").split(","):
+        token, *limites = [p.strip() for p in item.strip().split(":")]
+        if not token:
+            continue
+        limites = [int(x) if x else None for x in limites] + [None, None]
+        out.append((token, limites[0], limites[1]))
+    return out
+
+
+def is_exhausted(status, resp_json):
+    if status in EXHAUSTED_HTTP:
+        return True
+    if isinstance(resp_json, dict) and resp_json.get("code") not in (None, 200, 612):
+        msg = str(resp_json.get("code_message") or "").lower()
+        return any(w in msg for w in EXHAUSTED_WORDS)
+    return False
+
+
+class KeyPool:
+    """
+    Várias API_KEY usadas como uma só. Cada consulta sai pela chave com mais saldo
+    restante no dia/mês (empate: a menos usada hoje); chave que o provedor diz estar
+    esgotada fica de banco por `bench_seconds`. O uso por chave fica num SQLite
+    compartilhado, então os limites valem entre execuções e entre processos.
+
+        pool = KeyPool([("tok1", 500, None), ("tok2", None, 10000)])
+        key = pool.pick()                    # reserva 1 no dia/mês da chave
+        ... requisição com key ...
+        pool.report(key, status, resp_json)  # confirma; sem resposta (ou 5xx) devolve
+
+    Toda chave devolvida pelo pick() precisa de um report(), inclusive quando a
+    requisição nem saiu (prazo, broker, erro de conexão): status=None.
+    """
+
+    def __init__(self, keys, path=None, bench_seconds=BENCH_SECONDS):
+        if not keys:
+            raise ValueError("KeyPool precisa de pelo menos uma chave")
+        self.keys = [(k, None, None) if isinstance(k, str) else tuple(k) for k in keys]
+        self.bench_seconds = bench_seconds
+        self.path = os.path.expanduser(str(path or os.getenv(DB_ENV) or DEFAULT_DB_PATH))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS uso ("
+            " chave TEXT NOT NULL, periodo TEXT NOT NULL, usados INTEGER NOT NULL,"
+            " PRIMARY KEY (chave, periodo));"
+            "CREATE TABLE IF NOT EXISTS banco ("
+            " chave TEXT PRIMARY KEY, ate REAL NOT NULL, motivo TEXT);"
+        )
+
+    @classmethod
+    def from_env(cls):
+        keys = parse_keys(os.getenv(KEYS_ENV))
+        return cls(keys) if keys else None
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ---------- API ----------
+    def pick(self, timeout=None):
+        """
+        Reserva uma requisição na chave com mais saldo. Espera se todas estão no banco;
+        com `timeout` (segundos), TimeoutError logo que a saída do banco passar dele.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            key, espera = self._try_pick()
+            if key is not None:
+                return key
+            if espera is None:
+                raise KeysExhausted("todas as API_KEY do pool atingiram o limite diário/mensal")
+            if limite is not None and time.monotonic() + espera > limite:
+                raise TimeoutError(f"todas as API_KEY no banco; a primeira só volta em {espera:.0f}s")
+            time.sleep(min(espera, 5.0))
+
+    def report(self, key, status, resp_json, reached=None):
+        """
+        Resultado da requisição reservada no pick(). Se não chegou à InfoSimples
+        (status None, 5xx ou reached=False) a reserva volta para o saldo da chave; se o
+        provedor indicou limite/saldo esgotado, a chave vai para o banco.
+        """
+        if reached is None:
+            reached = status is not None and status < 500
+        if not reached:
+            self._release(key_label(key))
+            return False
+        if not is_exhausted(status, resp_json):
+            return False
+        motivo = f"HTTP {status}" if status in EXHAUSTED_HTTP else str(resp_json.get("code"))
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO banco (chave, ate, motivo) VALUES (?, ?, ?)",
+                               (key_label(key), time.time() + self.bench_seconds, motivo))
+        METRICS.inc("chave_api_banco", chave=key_label(key), motivo=motivo)
+        return True
+
+    def usage(self):
+        """{label: (usados_hoje, usados_no_mes, no_banco_ate)} de cada chave."""
+        dia, mes = self._periods()
+        with self._lock:
+            return {key_label(k): self._state(key_label(k), dia, mes) for k, _, _ in self.keys}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------- escolha ----------
+    @staticmethod
+    def _periods():
+        hoje = date.today()
+        return f"D:{hoje.isoformat()}", f"M:{hoje:%Y-%m}"
+
+    def _state(self, label, dia, mes):
+        c = self._conn
+        usos = dict(c.execute("SELECT periodo, usados FROM uso WHERE chave = ? AND periodo IN (?, ?)",
+                              (label, dia, mes)).fetchall())
+        row = c.execute("SELECT ate FROM banco WHERE chave = ?", (label,)).fetchone()
+        return usos.get(dia, 0), usos.get(mes, 0), (row[0] if row else 0.0)
+
+    def _release(self, label):
+        dia, mes = self._periods()
+        with self._lock:
+            self._conn.execute("UPDATE uso SET usados = usados - 1"
+                               " WHERE chave = ? AND periodo IN (?, ?) AND usados > 0", (label, dia, mes))
+        METRICS.inc("chave_api_devolvida", chave=label)
+
+    def _try_pick(self):
+        """(chave, None) | (None, segundos até sair alguém do banco) | (None, None) se acabou tudo."""
+        dia, mes = self._periods()
+        agora = time.time()
+        with self._lock:
+            c = self._conn
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                melhor, saida_do_banco = None, None
+                for key, lim_dia, lim_mes in self.keys:
+                    label = key_label(key)
+                    usados_dia, usados_mes, banco_ate = self._state(label, dia, mes)
+                    saldo = min(float("inf") if lim_dia is None else lim_dia - usados_dia,
+                                float("inf") if lim_mes is None else lim_mes - usados_mes)
+                    if saldo <= 0:
+                        continue
+                    if banco_ate > agora:
+                        saida_do_banco = min(saida_do_banco or banco_ate, banco_ate)
+                        continue
+                    ordem = (saldo, -usados_dia)
+                    if melhor is None or ordem > melhor[0]:
+                        melhor = (ordem, key, label)
+                if melhor is None:
+                    c.execute("COMMIT")
+                    return None, (saida_do_banco - agora if saida_do_banco else None)
+                _, key, label = melhor
+                for periodo in (dia, mes):
+                    c.execute("INSERT INTO uso (chave, periodo, usados) VALUES (?, ?, 1)"
+                              " ON CONFLICT(chave, periodo) DO UPDATE SET usados = usados + 1",
+                              (label, periodo))
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+        METRICS.inc("chave_api_uso", chave=label)
+        return key, None
+
+
+def api_key_from_env():
+    """KeyPool quando API_KEYS está definido; senão a API_KEY única do .env."""
+    return KeyPool.from_env() or os.getenv("API_KEY")
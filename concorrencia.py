@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Controle adaptativo de concorrência (AIMD) em volta das requisições ao provedor.
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import METRICS
+
+# Erros de rede que indicam provedor sobrecarregado (nomes das exceções do requests/urllib3)
+OVERLOAD_ERRORS = ("Timeout", "ConnectionError", "ConnectTimeout", "ReadTimeout", "ChunkedEncodingError")
+
+
+class AdaptiveLimiter:
+    """
+    Limite de requisições em voo que se ajusta sozinho (AIMD):
+
+      - resposta saudável: sobe devagar, +1 a cada `limite` respostas (aditivo)
+      - 429/5xx, timeout ou latência acima de `spike_factor` x a latência típica:
+        corta pela metade (multiplicativo), no máximo um corte por janela de latência
+
+        limiter = AdaptiveLimiter(initial=2, max_limit=16)
+        limiter.acquire()
+        ... requisição ...
+        limiter.release(latencia, status=429)       # ou error=exc
+        limiter.release(skipped=True)               # vaga devolvida sem requisição
+
+    O limite atual vai para METRICS como gauge `concorrencia_limite`.
+    """
+
+    def __init__(self, initial=2, min_limit=1, max_limit=16, backoff=0.5, spike_factor=3.0,
+                 min_samples=5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.spike_factor = spike_factor
+        self.min_samples = min_samples
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.latency_ewma = None
+        self._samples = 0
+        self._inflight = 0
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+        self._publish()
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def acquire(self):
+        with self._cond:
+            while self._inflight >= max(self.min_limit, int(self.limit)):
+                self._cond.wait()
+            self._inflight += 1
+            self._publish()
+
+    def release(self, latency=None, status=None, error=None, skipped=False):
+        with self._cond:
+            self._inflight -= 1
+            if not skipped:
+                motivo = self._overload_reason(latency, status, error)
+                if error is None:
+                    # toda resposta entra na latência típica, inclusive as lentas: depois de uma
+                    # mudança duradoura de patamar a referência acompanha e o limite volta a subir
+                    self._observe(latency)
+                if motivo:
+                    self._cut(motivo)
+                elif error is None:
+                    # erro que não é de sobrecarga (SSL, JSON inválido...) não diz nada
+                    # sobre a capacidade do provedor: o limite fica como está
+                    self._grow()
+            self._publish()
+            self._cond.notify_all()
+
+    # ---------- regras ----------
+    def _overload_reason(self, latency, status, error):
+        if error is not None:
+            nome = type(error).__name__
+            return "timeout" if any(e in nome for e in OVERLOAD_ERRORS) else None
+        if status == 429:
+            return "429"
+        if status is not None and status >= 500:
+            return "5xx"
+        if (self.latency_ewma is not None and self._samples >= self.min_samples
+                and latency > self.spike_factor * self.latency_ewma):
+            return "latencia"
+        return None
+
+    def _cut(self, motivo):
+        # respostas que já estavam em voo quando o primeiro corte aconteceu não cortam de novo
+        agora = time.monotonic()
+        janela = max(self.latency_ewma or 0.0, 0.5)
+        if agora - self._last_cut < janela:
+            return
+        self._last_cut = agora
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        METRICS.inc("concorrencia_cortes", motivo=motivo)
+
+    def _observe(self, latency):
+        self._samples += 1
+        self.latency_ewma = latency if self.latency_ewma is None else 0.9 * self.latency_ewma + 0.1 * latency
+
+    def _grow(self):
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def _publish(self):
+        METRICS.set_gauge("concorrencia_limite", round(self.limit, 2))
+        METRICS.set_gauge("concorrencia_em_voo", self._inflight)
+
+
+def map_ordered(fn, items, workers, prefetch=None):
+    """
+    Aplica `fn` em paralelo (até `workers` threads) e devolve os resultados na ordem
+    da entrada, com no máximo `prefetch` itens adiantados para não segurar memória.
+    """
+    prefetch = prefetch or workers * 2
+    it = iter(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="consulta") as pool:
+        for item in it:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            yield pending.popleft().result()
+            for item in it:
+                pending.append(pool.submit(fn, item))
+                break
+
+
+class SingleFlight:
+    """
+    Junta chamadas iguais que acontecem ao mesmo tempo: a primeira executa `fn`,
+    as outras com a mesma chave esperam e recebem o mesmo resultado (ou a mesma
+    exceção). Terminada a chamada, a chave sai da tabela: não é cache.
+
+        flights = SingleFlight()
+        status, j = flights.do(("infosimples", cnpj), lambda: fetch(cnpj))
+    """
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+        if not leader:
+            METRICS.inc(f"{self.name}_compartilhadas")
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+# Cliente HTTP compartilhado para as consultas de CNPJ (InfoSimples / ReceitaWS).
+
+import atexit
+import gzip
+import json
+import os
+import re
+import threading
+import time
+
+from broker_limites import PRIORIDADE_LOTE, default_broker
+from chaves_api import KeyPool
+from concorrencia import AdaptiveLimiter, SingleFlight, map_ordered
+from metricas import METRICS
+
+# RECEITAWS_URL no ambiente permite apontar para o provedor local (provedor_local.py)
+RECEITAWS_URL = os.getenv("RECEITAWS_URL") or "https://www.receitaws.com.br/v1/cnpj/{cnpj}"
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def build_session(pool_size=10):
+    """
+    Session com pool de conexões keep-alive: reaproveita TCP/TLS entre consultas
+    em vez de abrir uma conexão nova a cada requests.get/post.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def default_session():
+    """Session única do processo, criada no primeiro uso (scripts de linha de comando)."""
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = build_session()
+        return _default_session
+
+
+# ==========================
+# CASSETES (gravar / reproduzir)
+# ==========================
+# CONSULTA_CASSETTE=run.cassette.jsonl.gz CONSULTA_CASSETTE_MODO=gravar     -> grava cada resposta bruta
+# CONSULTA_CASSETTE=run.cassette.jsonl.gz CONSULTA_CASSETTE_MODO=reproduzir -> roda offline a partir dele
+CASSETTE_ENV = "CONSULTA_CASSETTE"
+CASSETTE_MODE_ENV = "CONSULTA_CASSETTE_MODO"
+CASSETTE_MODES = ("gravar", "reproduzir")
+
+
+class CassetteMiss(LookupError):
+    """O CNPJ pedido não está no cassete em modo reproduzir."""
+
+
+class ReplayedRequestError(Exception):
+    """Erro de rede que foi gravado no cassete e está sendo reproduzido."""
+
+
+class Cassette:
+    """
+    Arquivo .jsonl.gz com uma linha por requisição: provedor, método, URL, CNPJ,
+    status, corpo bruto da resposta (ou o erro de rede) e o tempo que levou.
+    O token nunca é gravado. Em modo reproduzir, cada CNPJ devolve as respostas
+    na ordem em que foram gravadas (a última se repete).
+    """
+
+    def __init__(self, path, mode):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"modo de cassete inválido: {mode!r} (use {' ou '.join(CASSETTE_MODES)})")
+        self.path = str(path)
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._file = None
+        self._entries = {}
+        self._cursor = {}
+        if mode == "gravar":
+            # "at" acrescenta um novo membro gzip: gravações sucessivas se somam no mesmo arquivo
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+        else:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        e = json.loads(line)
+                        self._entries.setdefault((e["provider"], e["cnpj"]), []).append(e)
+
+    def record(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def play(self, provider, cnpj):
+        with self._lock:
+            entries = self._entries.get((provider, cnpj))
+            if not entries:
+                raise CassetteMiss(f"{provider}:{cnpj} não está no cassete {self.path}")
+            i = self._cursor.get((provider, cnpj), 0)
+            self._cursor[(provider, cnpj)] = i + 1
+            return entries[min(i, len(entries) - 1)]
+
+    def __len__(self):
+        return sum(len(v) for v in self._entries.values())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_cassette = None
+_cassette_loaded = False
+_cassette_lock = threading.Lock()
+
+
+def set_cassette(path, mode):
+    """Liga (ou desliga, com path=None) o cassete do processo."""
+    global _cassette, _cassette_loaded
+    with _cassette_lock:
+        if _cassette is not None:
+            _cassette.close()
+        _cassette = Cassette(path, mode) if path else None
+        _cassette_loaded = True
+    return _cassette
+
+
+def active_cassette():
+    global _cassette, _cassette_loaded
+    if not _cassette_loaded:
+        with _cassette_lock:
+            if not _cassette_loaded:
+                path = os.getenv(CASSETTE_ENV)
+                if path:
+                    _cassette = Cassette(path, os.getenv(CASSETTE_MODE_ENV) or "reproduzir")
+                _cassette_loaded = True
+    return _cassette
+
+
+def replaying():
+    """True quando as respostas vêm do cassete (os scripts pulam a pausa entre CNPJs)."""
+    c = active_cassette()
+    return c is not None and c.mode == "reproduzir"
+
+
+@atexit.register
+def _close_cassette():
+    if _cassette is not None:
+        _cassette.close()
+
+
+def _replay(cassette, provider, cnpj):
+    e = cassette.play(provider, cnpj)
+    METRICS.inc("cassete", modo="reproduzir")
+    if e.get("erro"):
+        raise ReplayedRequestError(e["erro"])
+    try:
+        j = json.loads(e["body"])
+    except Exception:
+        j = None
+        METRICS.inc("json_invalido", provider=provider)
+    return e["status"], j
+
+
+# Consultas do mesmo provedor+CNPJ em voo ao mesmo tempo no processo viram uma só
+_flights = SingleFlight("fetch_singleflight")
+
+
+# ==========================
+# PRAZO DA EXECUÇÃO (--max-duration)
+# ==========================
+PENDENTE = "PENDENTE"   # status de quem não terminou dentro do prazo
+INFOSIMPLES_TIMEOUT = 300
+
+
+class DeadlineExceeded(TimeoutError):
+    """O prazo da execução acabou antes (ou durante) a consulta."""
+
+
+def parse_duration(spec):
+    """"90" / "90s" / "45m" / "2h" / "1h30m" -> segundos."""
+    m = re.fullmatch(r"\s*(?:(\d+(?:\.\d+)?)h)?\s*(?:(\d+(?:\.\d+)?)m)?\s*(?:(\d+(?:\.\d+)?)s?)?\s*", str(spec))
+    if not m or not any(m.groups()):
+        raise ValueError(f"duração inválida: {spec!r} (ex.: 3600, 45m, 2h, 1h30m)")
+    h, mi, se = (float(g or 0) for g in m.groups())
+    return h * 3600 + mi * 60 + se
+
+
+def deadline_after(seconds):
+    """Prazo absoluto (time.monotonic) daqui a `seconds`; None = sem prazo."""
+    return None if seconds is None else time.monotonic() + seconds
+
+
+def time_left(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_passed(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+# ==========================
+# PRIORIDADE NO BROKER DE LIMITES (broker_limites.py, ligado por CONSULTA_BROKER)
+# ==========================
+_priority = PRIORIDADE_LOTE
+
+
+def set_priority(priority):
+    """Prioridade deste processo na fila do broker (a página usa PRIORIDADE_INTERATIVA)."""
+    global _priority
+    _priority = priority
+
+
+def provider_for(api_url):
+    return "infosimples" if api_url and api_url.strip() else "receitaws"
+
+
+def source_key(api_url):
+    """
+    Origem da resposta: provedor + URL normalizada. Dois endpoints da InfoSimples
+    (produção e homologação, p.ex.) não dividem requisição em voo nem cache.
+    """
+    url = (api_url or "").strip()
+    provider = provider_for(url)
+    return f"{provider}@{url}" if url else provider
+
+
+def fetch_cnpj(cnpj, api_url, api_key, session=None, timeout=60, limiter=None, priority=None, deadline=None):
+    """
+    Faz a requisição e devolve (status_code, json). Sem API_URL consulta a ReceitaWS.
+    Erros de rede sobem como exceção; JSON inválido vira None.
+    Registra em METRICS a latência por provedor e a contagem por status HTTP.
+    Com cassete ativo, grava a resposta bruta ou a reproduz sem tocar na rede.
+    Com `limiter` (concorrencia.AdaptiveLimiter), espera vaga antes de enviar e
+    devolve a latência/status para ele ajustar o número de requisições em voo.
+    Com CONSULTA_BROKER definido, pega antes uma ficha no broker compartilhado entre
+    processos (limite por minuto e cota diária por provedor/API_KEY).
+    `api_key` pode ser um chaves_api.KeyPool: cada requisição sai pela chave com mais
+    saldo e a resposta volta para o pool (chave esgotada vai para o banco).
+    Chamadas simultâneas para o mesmo provedor+CNPJ (jobs da página, CNPJ repetido
+    no .txt) compartilham uma única requisição e recebem o mesmo resultado.
+    Com `deadline` (time.monotonic), o timeout da requisição e o "timeout" pedido à
+    InfoSimples encolhem para caber no que resta; sem tempo, DeadlineExceeded.
+    """
+    provider = provider_for(api_url)
+    cassette = active_cassette()
+    if cassette is not None and cassette.mode == "reproduzir":
+        return _replay(cassette, provider, cnpj)
+
+    return _flights.do(
+        (source_key(api_url), cnpj),
+        lambda: _fetch_live(cnpj, api_url, api_key, session, timeout, limiter, priority, deadline,
+                            provider, cassette),
+    )
+
+
+def _check_deadline(deadline, provider, cnpj):
+    restante = time_left(deadline)
+    if restante is not None and restante <= 0:
+        METRICS.inc("prazo_esgotado", provider=provider)
+        raise DeadlineExceeded(f"prazo da execução esgotado antes de consultar {cnpj}")
+    return restante
+
+
+def _fetch_live(cnpj, api_url, api_key, session, timeout, limiter, priority, deadline, provider, cassette):
+    _check_deadline(deadline, provider, cnpj)
+
+    if session is None:
+        import requests
+        session = requests
+
+    if api_url and api_url.strip():
+        method, url = "POST", api_url
+    else:
+        method, url = "GET", RECEITAWS_URL.format(cnpj=cnpj)
+
+    pool = api_key if isinstance(api_key, KeyPool) else None
+    if pool is not None and method == "POST":
+        try:
+            api_key = pool.pick(timeout=time_left(deadline))
+        except TimeoutError as e:
+            if deadline is None:
+                raise
+            METRICS.inc("prazo_esgotado", provider=provider)
+            raise DeadlineExceeded(f"prazo da execução esgotado esperando chave para {cnpj}") from e
+    elif pool is not None:
+        api_key = None
+
+    if pool is None or api_key is None:
+        return _send(cnpj, method, url, api_key, session, timeout, limiter, priority, deadline, provider, cassette)
+    # a chave foi reservada no pick(): só conta no saldo se a requisição chegou à InfoSimples
+    try:
+        status, j = _send(cnpj, method, url, api_key, session, timeout, limiter, priority, deadline,
+                          provider, cassette)
+    except Exception as e:
+        pool.report(api_key, None, None, reached=_reached_server(e))
+        raise
+    pool.report(api_key, status, j)
+    return status, j
+
+
+def _reached_server(error):
+    # ReadTimeout: o pedido já tinha sido enviado (e pode ter sido cobrado); prazo,
+    # broker e erros de conexão acontecem antes de ele sair daqui
+    return type(error).__name__ == "ReadTimeout"
+
+
+def _send(cnpj, method, url, api_key, session, timeout, limiter, priority, deadline, provider, cassette):
+    broker = default_broker()
+    if broker is not None:
+        try:
+            # a ReceitaWS não usa chave (o limite dela é por IP): todo GET cai no mesmo balde
+            broker.acquire(provider, api_key if method == "POST" else None,
+                           _priority if priority is None else priority, timeout=time_left(deadline))
+        except TimeoutError as e:
+            if deadline is None:
+                raise
+            METRICS.inc("prazo_esgotado", provider=provider)
+            raise DeadlineExceeded(f"prazo da execução esgotado esperando ficha para {cnpj}") from e
+    if limiter is not None:
+        limiter.acquire()
+
+    # a espera no broker/limiter também conta: os timeouts saem do que sobrou do prazo
+    remote_timeout = INFOSIMPLES_TIMEOUT
+    try:
+        restante = _check_deadline(deadline, provider, cnpj)
+    except DeadlineExceeded:
+        if limiter is not None:
+            limiter.release(skipped=True)   # não houve requisição: nada a medir
+        raise
+    if restante is not None:
+        timeout = min(timeout, restante)
+        remote_timeout = max(1, min(INFOSIMPLES_TIMEOUT, int(restante)))
+    t0 = time.perf_counter()
+    try:
+        if method == "POST":
+            args = {"cnpj": cnpj, "token": api_key, "timeout": remote_timeout}
+            r = session.post(url, data=args, timeout=timeout)
+        else:
+            r = session.get(url, timeout=timeout)
+    except Exception as e:
+        elapsed = time.perf_counter() - t0
+        if limiter is not None:
+            limiter.release(elapsed, error=e)
+        METRICS.observe("fetch", elapsed, provider=provider)
+        METRICS.inc("http_erros", provider=provider, erro=type(e).__name__)
+        if cassette is not None:
+            cassette.record({"provider": provider, "method": method, "url": url, "cnpj": cnpj,
+                             "status": None, "erro": f"{type(e).__name__}: {e}",
+                             "elapsed_s": round(elapsed, 4), "gravado_em": time.time()})
+        raise
+    elapsed = time.perf_counter() - t0
+    try:
+        j, json_error = r.json(), None
+    except Exception as e:
+        j, json_error = None, e
+        METRICS.inc("json_invalido", provider=provider)
+    if limiter is not None:
+        limiter.release(elapsed, status=r.status_code, error=json_error)
+    METRICS.observe("fetch", elapsed, provider=provider)
+    METRICS.inc("http_respostas", provider=provider, status=r.status_code)
+    if cassette is not None:
+        # só o CNPJ identifica a requisição; token fica de fora
+        cassette.record({"provider": provider, "method": method, "url": url, "cnpj": cnpj,
+                         "status": r.status_code, "content_type": r.headers.get("Content-Type"),
+                         "body": r.text, "elapsed_s": round(elapsed, 4), "gravado_em": time.time()})
+        METRICS.inc("cassete", modo="gravar")
+    return r.status_code, j
+
+
+def is_cacheable(status, resp_json):
+    """
+    Só guarda respostas completas: HTTP 200 e, na InfoSimples, code 200. A ReceitaWS
+    devolve HTTP 200 com {"status": "ERROR"} para CNPJ inválido/limite: não guarda.
+    """
+    if status != 200 or not isinstance(resp_json, dict):
+        return False
+    if str(resp_json.get("status") or "").upper() == "ERROR":
+        return False
+    code = resp_json.get("code")
+    return code is None or code == 200
+
+
+# ==========================
+# LAÇO DE CONSULTA E OPÇÕES COMUNS DOS SCRIPTS DE LOTE (mensal / anual)
+# ==========================
+def responses(query, cnpjs, limiter=None, sleep=0.0, deadline=None):
+    """
+    (cnpj, query(cnpj)) na ordem da entrada. Sem `limiter`, um por vez com `sleep`
+    entre eles; com `limiter`, em paralelo até limiter.max_limit threads.
+    """
+    if limiter is None:
+        for cnpj in cnpjs:
+            yield cnpj, query(cnpj)
+            if not replaying() and not deadline_passed(deadline):  # cassete: sem rede, sem pausa
+                time.sleep(min(sleep, time_left(deadline) or sleep))
+        return
+    # o limiter decide quantas requisições ficam em voo; as threads só dão o teto
+    yield from zip(cnpjs, map_ordered(query, cnpjs, workers=limiter.max_limit))
+
+
+def add_run_args(ap, sleep, max_concorrencia):
+    """Opções de execução iguais nos scripts de lote (provedor, ritmo, cassete, prazo, perfil)."""
+    ap.add_argument("--api-url", default=None,
+                    help="sobrescreve API_URL do .env (ex.: provedor local para testes de desempenho)")
+    ap.add_argument("--sleep", type=float, default=None, help=f"pausa entre CNPJs em segundos (padrão {sleep})")
+    ap.add_argument("--adaptativo", action="store_true",
+                    help="consultas em paralelo com limite AIMD (sobe com respostas boas, cai com 429/timeout)")
+    ap.add_argument("--max-concorrencia", type=int, default=max_concorrencia,
+                    help=f"teto de requisições em voo no modo --adaptativo (padrão {max_concorrencia})")
+    cas = ap.add_mutually_exclusive_group()
+    cas.add_argument("--gravar", metavar="CASSETE", default=None,
+                     help="grava cada resposta bruta em um cassete .jsonl.gz (sem o token)")
+    cas.add_argument("--reproduzir", metavar="CASSETE", default=None,
+                     help="roda offline a partir de um cassete gravado (sem rede e sem pausa)")
+    ap.add_argument("--max-duration", type=parse_duration, default=None, metavar="DURACAO",
+                    help="prazo da execução (ex.: 3600, 45m, 2h): o que não terminar vira PENDENTE "
+                         "e vai para <saida>.pendentes.txt")
+    ap.add_argument("--profile", action="store_true",
+                    help="roda com cProfile + amostragem de pilhas e grava <saida>.perfil.{prof,collapsed,top.txt}")
+
+
+def apply_run_args(mod, args):
+    """Aplica as opções de add_run_args nas globais do script (API_URL, SLEEP, LIMITER, DEADLINE) e no cassete."""
+    if args.api_url is not None:
+        mod.API_URL = args.api_url
+    if args.sleep is not None:
+        mod.SLEEP = args.sleep
+    if args.adaptativo:
+        mod.LIMITER = AdaptiveLimiter(initial=2, max_limit=args.max_concorrencia)
+    if args.max_duration is not None:
+        mod.DEADLINE = deadline_after(args.max_duration)
+    if args.gravar or args.reproduzir:
+        set_cassette(args.gravar or args.reproduzir, "gravar" if args.gravar else "reproduzir")
+
+
+def profiled(args, output_file):
+    """Profiler (perfil.py) em volta da execução com --profile; sem ele, não faz nada."""
+    if not args.profile:
+        from contextlib import nullcontext
+        return nullcontext()
+    from perfil import Profiler
+    from saidas import output_base
+    return Profiler(output_base(output_file))
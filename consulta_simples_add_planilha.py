@@ -3,17 +3,19 @@ import re
 import time
 from datetime import datetime, date, timedelta
 from dotenv import load_dotenv
-import requests
-import pandas as pd
-from tqdm import tqdm
 from pathlib import Path
-from dateutil import parser as dparser
 import calendar
+from chaves_api import api_key_from_env
+from consulta_http import default_session, fetch_cnpj, replaying
+from metricas import METRICS
+from saidas import export_metrics
+# requests, pandas, tqdm e dateutil são importados dentro das funções que os usam:
+# carregar o módulo (ou rodar --help) não paga o import dessas bibliotecas.
 
 load_dotenv()
 
 API_URL = os.getenv("API_URL")
-API_KEY = os.getenv("API_KEY")
+API_KEY = api_key_from_env()   # KeyPool se API_KEYS estiver no .env
 INPUT_FILE = "PIS-Cofins - 865 - C100, C170 - Notas-Itens Sem Crédito - EFD-Contribuições e EFD-ICMS-IPI - teste.xlsx"
 SLEEP = 0.5
 DEBUG = True
@@ -25,6 +27,7 @@ def read_cnpjs(path):
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(f"{path} não encontrado.")
+    import pandas as pd
     df = pd.read_excel(path)
     if 'cnpj_part' not in df.columns:
         raise ValueError("A planilha deve conter a coluna 'cnpj_part'")
@@ -33,16 +36,7 @@ def read_cnpjs(path):
 
 def query_infosimples(cnpj):
     try:
-        if API_URL and API_URL.strip():
-            args = {"cnpj": cnpj, "token": API_KEY, "timeout": 300}
-            r = requests.post(API_URL, data=args, timeout=60)
-        else:
-            r = requests.get(f"https://www.receitaws.com.br/v1/cnpj/{cnpj}", timeout=60)
-
-        try:
-            j = r.json()
-        except Exception:
-            j = None
+        status, j = fetch_cnpj(cnpj, API_URL, API_KEY, session=default_session())
 
         if DEBUG:
             print("=" * 80)
@@ -52,7 +46,7 @@ def query_infosimples(cnpj):
             import json
             print(json.dumps(j, indent=2, ensure_ascii=False))
 
-        return r.status_code, j
+        return status, j
     except Exception as e:
         if DEBUG:
             print(f"[DEBUG] Erro na requisição para {cnpj}: {e}")
@@ -69,6 +63,7 @@ def parse_date_any(s):
         except Exception:
             pass
     try:
+        from dateutil import parser as dparser
         return dparser.parse(s, dayfirst=True).date()
     except Exception:
         return None
@@ -157,15 +152,25 @@ def is_month_fully_covered(periods, year, month):
 
     return False, "Não optante/Nunca esteve no Simples Nacional neste mês."
 
-def main():
-    cnpjs = read_cnpjs(INPUT_FILE)
+def main(input_file=None, progress_cb=None):
+    import pandas as pd
+    from tqdm import tqdm
+
+    # progress_cb(feitos, total) é chamado a cada CNPJ (usado pela página de upload)
+    input_file = input_file or INPUT_FILE
+    METRICS.reset()
+    cnpjs = read_cnpjs(input_file)
     rows = []
     start_year = 2020
     hoje = date.today()
+    total = len(cnpjs)
+    if progress_cb:
+        progress_cb(0, total)
 
-    for cnpj in tqdm(cnpjs, desc="Consultando CNPJs"):
+    for idx, cnpj in enumerate(tqdm(cnpjs, desc="Consultando CNPJs"), start=1):
         status, resp_json = query_infosimples(cnpj)
-        periods = extract_periods_from_response(resp_json)
+        with METRICS.timer("extracao"):
+            periods = extract_periods_from_response(resp_json)
 
         situacao_atual = None
 
@@ -201,6 +206,7 @@ def main():
                     "detalhe": "Situação Atual: Optante pelo Simples Nacional"
                 })
 
+        t0 = time.perf_counter()
         for year in range(start_year, hoje.year + 1):
             for month in range(1, 13):
                 if year == hoje.year and month > hoje.month:
@@ -226,19 +232,26 @@ def main():
                     "Períodos_detectados": periods_str,
                     "Situacao_Atual": situacao_atual or ""
                 })
+        METRICS.observe("cobertura", time.perf_counter() - t0)
+        METRICS.inc("cnpjs")
 
-
-        time.sleep(SLEEP)
+        if progress_cb:
+            progress_cb(idx, total)
+        if not replaying():  # cassete: sem rede, sem pausa
+            time.sleep(SLEEP)
 
     df = pd.DataFrame(rows, columns=[
         "CNPJ", "MÊS", "REGIME", "MOTIVO", "Períodos_detectados", "Situacao_Atual"
     ])
 
     # --- ALTERAÇÃO ÚNICA: adiciona a aba "CONSULTA" na planilha de entrada ---
-    with pd.ExcelWriter(INPUT_FILE, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name="CONSULTA", index=False)
+    with METRICS.timer("escrita", formato="xlsx"):
+        with pd.ExcelWriter(input_file, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+            df.to_excel(writer, sheet_name="CONSULTA", index=False)
 
-    print(f"\n✅ Consulta finalizada. Aba 'CONSULTA' adicionada em {INPUT_FILE}")
+    print(f"\n✅ Consulta finalizada. Aba 'CONSULTA' adicionada em {input_file}")
+    # a saída é a própria planilha de entrada: métricas em <entrada>.metricas.{json,prom}
+    export_metrics(input_file)
 
 if __name__ == "__main__":
     main()
@@ -1,23 +1,35 @@
 import os
 import re
+import sys
 import time
 from datetime import datetime, date
 from dotenv import load_dotenv
-import requests
-import pandas as pd
-from tqdm import tqdm
 from pathlib import Path
-from dateutil import parser as dparser
+from saidas import (OUTPUT_FORMATS, export_metrics, infer_format, merge_resume, output_base, output_path_for,
+                    patch_output, report_pending, resume_path_for, resume_target, StreamingWriter)
+from chaves_api import api_key_from_env
+from consulta_http import (PENDENTE, DeadlineExceeded, add_run_args, apply_run_args, deadline_passed,
+                           default_session, fetch_cnpj, profiled, replaying, responses)
+from metricas import METRICS
+from fila_erros import DeadLetterQueue, resumo as resumo_fila
+# requests, pandas, tqdm e dateutil são importados dentro das funções que os usam:
+# carregar o módulo (ou rodar --help) não paga o import dessas bibliotecas.
 
 load_dotenv()
 API_URL = os.getenv("API_URL")   
-API_KEY = os.getenv("API_KEY")
+API_KEY = api_key_from_env()   # KeyPool se API_KEYS estiver no .env
 
 INPUT_FILE = "cnpjs.txt"
 OUTPUT_FILE = ".xlsx"
 YEARS = list(range(2020, 2026))
 SLEEP = 0.5
+LIMITER = None           # AdaptiveLimiter com --adaptativo: substitui o SLEEP fixo
+MAX_CONCORRENCIA = 8
+DEADLINE = None          # time.monotonic() em que a execução para (--max-duration)
 DEBUG = False  
+OUTPUT_FORMAT = None  # xlsx | parquet | csv | jsonl (None = pela extensão de OUTPUT_FILE)
+
+COLUMNS = ["CNPJ+ANO", "CNPJ", "Ano", "Regime", "Motivo", "Períodos_detectados", "Situacao_Atual"]
 
 def clean_cnpj(s):
     return re.sub(r'\D', '', str(s)).zfill(14)
@@ -31,17 +43,13 @@ def read_cnpjs(path):
 
 def query_infosimples(cnpj):
     try:
-        if API_URL and API_URL.strip():
-            args = {"cnpj": cnpj, "token": API_KEY, "timeout": 300}
-            r = requests.post(API_URL, data=args, timeout=60)
-        else:
-            r = requests.get(f"https://www.receitaws.com.br/v1/cnpj/{cnpj}", timeout=60)
-        try:
-            j = r.json()
-        except Exception:
-            j = None
-        return r.status_code, j
+        status, j = fetch_cnpj(cnpj, API_URL, API_KEY, session=default_session(), limiter=LIMITER,
+                               deadline=DEADLINE)
+        return status, j
     except Exception as e:
+        if isinstance(e, DeadlineExceeded) or deadline_passed(DEADLINE):
+            # acabou o prazo: fica para a próxima execução em vez de virar erro
+            return PENDENTE, None
         if DEBUG:
             print(f"[DEBUG] Erro na requisição para {cnpj}: {e}")
         return None, None
@@ -58,6 +66,7 @@ def parse_date_any(s):
             pass
     # tentar remover timezone e parse via dateutil
     try:
+        from dateutil import parser as dparser
         return dparser.parse(s, dayfirst=True).date()
     except Exception:
         return None
@@ -183,89 +192,209 @@ def covers_year_with_rules(periods, year, consulta_date=None):
     return False, ("nao_cobre_periodo_exigido; " + "; ".join(motivos)) if motivos else ("nenhum_periodo_encontrado")
 
 
-def main():
-    cnpjs = read_cnpjs(INPUT_FILE)
+def build_rows(cnpj, status, resp_json):
+    """Linhas (uma por ano de YEARS) com o regime de um CNPJ já consultado."""
     rows = []
 
-    for cnpj in tqdm(cnpjs, desc="Consultando CNPJs"):
-        status, resp_json = query_infosimples(cnpj)
-
-        if status is None or resp_json is None:
-            # erro de conexão / API
-            for year in YEARS:
-                rows.append({
-                    "CNPJ+ANO": f"{cnpj}/{year}",
-                    "CNPJ": cnpj,
-                    "Ano": year,
-                    "Regime": "ERRO_CONSULTA",
-                    "Motivo": "erro_requisicao_ou_resp",
-                    "Períodos_detectados": ""
-                })
-            continue
-
-        # API pode devolver code interno
-        code = resp_json.get("code") if isinstance(resp_json, dict) else None
-        if code is not None and code != 200:
-            msg = resp_json.get("code_message", "sem mensagem")
-            for year in YEARS:
-                rows.append({
-                    "CNPJ+ANO": f"{cnpj}/{year}",
-                    "CNPJ": cnpj,
-                    "Ano": year,
-                    "Regime": f"API_CODE_{code}",
-                    "Motivo": msg,
-                    "Períodos_detectados": ""
-                })
-            continue
-
-        data_item = None
-        if isinstance(resp_json.get("data"), list) and resp_json["data"]:
-            data_item = resp_json["data"][0]
-        elif isinstance(resp_json.get("data"), dict):
-            data_item = resp_json["data"]
-        else:
-            data_item = resp_json  
-
-        situacao_atual = None
-        if isinstance(data_item, dict):
-            situacao_atual = data_item.get("simples_nacional_situacao") or data_item.get("situacao_simples") or data_item.get("situacao")
-
-
-        periods = extract_periods_from_response(resp_json)
-
-        if (not periods) and situacao_atual and "não optante" not in str(situacao_atual).lower():
-            m = re.search(r"desde (\d{2}/\d{2}/\d{4})", str(situacao_atual))
-            if m:
-                start = parse_date_any(m.group(1))
-                if start:
-                    periods.append({"start": start, "end": None, "detalhe": "situação_atual"})
-
-        periods_str = periods_to_string(periods) if periods else ""
+    if status == PENDENTE:
+        for year in YEARS:
+            rows.append({
+                "CNPJ+ANO": f"{cnpj}/{year}",
+                "CNPJ": cnpj,
+                "Ano": year,
+                "Regime": PENDENTE,
+                "Motivo": "prazo_da_execucao_esgotado",
+                "Períodos_detectados": ""
+            })
+        return rows
 
-        if DEBUG:
-            print(f"\n[DEBUG] CNPJ: {cnpj}")
-            print("  situacao_atual:", situacao_atual)
-            print("  periods_detected:", periods_str)
+    if status is None or resp_json is None:
+        # erro de conexão / API
+        for year in YEARS:
+            rows.append({
+                "CNPJ+ANO": f"{cnpj}/{year}",
+                "CNPJ": cnpj,
+                "Ano": year,
+                "Regime": "ERRO_CONSULTA",
+                "Motivo": "erro_requisicao_ou_resp",
+                "Períodos_detectados": ""
+            })
+        return rows
 
+    # API pode devolver code interno
+    code = resp_json.get("code") if isinstance(resp_json, dict) else None
+    if code is not None and code != 200:
+        msg = resp_json.get("code_message", "sem mensagem")
         for year in YEARS:
-            is_opt, motivo = covers_year_with_rules(periods, year, consulta_date=date.today())
-            regime = "Simples Nacional" if is_opt else "Outro Regime"
             rows.append({
                 "CNPJ+ANO": f"{cnpj}/{year}",
                 "CNPJ": cnpj,
                 "Ano": year,
-                "Regime": regime,
-                "Motivo": motivo,
-                "Períodos_detectados": periods_str,
-                "Situacao_Atual": situacao_atual or ""
+                "Regime": f"API_CODE_{code}",
+                "Motivo": msg,
+                "Períodos_detectados": ""
             })
+        return rows
+
+    data_item = None
+    if isinstance(resp_json.get("data"), list) and resp_json["data"]:
+        data_item = resp_json["data"][0]
+    elif isinstance(resp_json.get("data"), dict):
+        data_item = resp_json["data"]
+    else:
+        data_item = resp_json  
+
+    situacao_atual = None
+    if isinstance(data_item, dict):
+        situacao_atual = data_item.get("simples_nacional_situacao") or data_item.get("situacao_simples") or data_item.get("situacao")
+
+
+    with METRICS.timer("extracao"):
+        periods = extract_periods_from_response(resp_json)
 
-        time.sleep(SLEEP)
+    if (not periods) and situacao_atual and "não optante" not in str(situacao_atual).lower():
+        m = re.search(r"desde (\d{2}/\d{2}/\d{4})", str(situacao_atual))
+        if m:
+            start = parse_date_any(m.group(1))
+            if start:
+                periods.append({"start": start, "end": None, "detalhe": "situação_atual"})
+
+    periods_str = periods_to_string(periods) if periods else ""
+
+    if DEBUG:
+        print(f"\n[DEBUG] CNPJ: {cnpj}")
+        print("  situacao_atual:", situacao_atual)
+        print("  periods_detected:", periods_str)
+
+    t0 = time.perf_counter()
+    for year in YEARS:
+        is_opt, motivo = covers_year_with_rules(periods, year, consulta_date=date.today())
+        regime = "Simples Nacional" if is_opt else "Outro Regime"
+        rows.append({
+            "CNPJ+ANO": f"{cnpj}/{year}",
+            "CNPJ": cnpj,
+            "Ano": year,
+            "Regime": regime,
+            "Motivo": motivo,
+            "Períodos_detectados": periods_str,
+            "Situacao_Atual": situacao_atual or ""
+        })
+    METRICS.observe("cobertura", time.perf_counter() - t0)
+    return rows
+
+def failure_of(rows):
+    """(classe, detalhe) quando as linhas do CNPJ são de erro (ERRO_CONSULTA / API_CODE_x)."""
+    regime = rows[0]["Regime"] if rows else ""
+    if regime == "ERRO_CONSULTA" or regime.startswith("API_CODE_"):
+        return regime, rows[0].get("Motivo", "")
+    return None
 
-    # grava Excel
-    df = pd.DataFrame(rows, columns=["CNPJ+ANO", "CNPJ", "Ano", "Regime", "Motivo", "Períodos_detectados", "Situacao_Atual"])
-    df.to_excel(OUTPUT_FILE, index=False)
-    print(f"\n✅ Consulta finalizada. Planilha salva em {OUTPUT_FILE}")
+def main(formato=None, limpar_dlq=False):
+    from tqdm import tqdm
+    formato = formato or OUTPUT_FORMAT
+    METRICS.reset()
+    cnpjs = read_cnpjs(INPUT_FILE)
+    destino, existente = OUTPUT_FILE, resume_target(INPUT_FILE, OUTPUT_FILE, formato)
+    if existente:
+        # retomada do .pendentes.txt: grava à parte e mescla na saída no fim, sem truncar o que já existe
+        formato = formato or infer_format(OUTPUT_FILE)
+        destino = resume_path_for(OUTPUT_FILE)
+
+    # grava resultado (Excel por padrão) à medida que cada CNPJ termina
+    pendentes = []
+    dlq = DeadLetterQueue.for_output(OUTPUT_FILE)
+    with StreamingWriter(destino, COLUMNS, formato, partition_col="Ano") as writer:
+        saida = existente or writer.path
+        respostas = responses(query_infosimples, cnpjs, LIMITER, SLEEP, DEADLINE)
+        for cnpj, (status, resp_json) in tqdm(respostas, total=len(cnpjs), desc="Consultando CNPJs"):
+            rows = build_rows(cnpj, status, resp_json)
+            falha = failure_of(rows)
+            if falha:
+                dlq.add(cnpj, "anual", *falha, saida=saida)
+            elif status == PENDENTE:
+                pendentes.append(cnpj)
+            else:
+                dlq.resolve(cnpj)
+            METRICS.inc("cnpjs")
+            writer.put([[r.get(c, "") for c in COLUMNS] for r in rows])
+    if limpar_dlq:
+        # só a pedido: numa execução parcial (ex.: .pendentes.txt) isso apagaria falhas de outros CNPJs
+        dlq.keep_only(cnpjs)
+
+    if existente:
+        merge_resume(existente, writer.path, writer.formato)
+
+    print(f"\n✅ Consulta finalizada. Resultado salvo em {saida}")
+    report_pending(saida, pendentes)
+    if len(dlq):
+        print(f"🧯 {resumo_fila(dlq)}. Para tentar só esses: --reprocessar")
+    export_metrics(saida)
+
+def reprocessar(formato=None, forcar=False):
+    """
+    Tenta de novo só os CNPJs da fila de erros desta saída (respeitando o backoff
+    da fila, ou não, com forcar) e corrige as linhas deles no arquivo existente.
+    """
+    import pandas as pd
+    dlq = DeadLetterQueue.for_output(OUTPUT_FILE)
+    itens = dlq.due(force=forcar)
+    if not itens:
+        print(f"Nada liberado para reprocessar. {resumo_fila(dlq) or 'Fila de erros vazia.'}")
+        return
+    saida = itens[0]["saida"] or output_path_for(OUTPUT_FILE, formato or infer_format(OUTPUT_FILE))
+    METRICS.reset()
+
+    corrigidos, linhas = [], []
+    for i, item in enumerate(itens):
+        cnpj = item["cnpj"]
+        status, resp_json = query_infosimples(cnpj)
+        rows = build_rows(cnpj, status, resp_json)
+        falha = failure_of(rows)
+        if falha:
+            tentativas = dlq.add(cnpj, "anual", *falha, saida=saida)
+            METRICS.inc("retentativas", classe=item["classe"], resultado="falhou")
+            print(f"❌ {cnpj}: {falha[0]} de novo (tentativa {tentativas})")
+        elif status != PENDENTE:
+            METRICS.inc("retentativas", classe=item["classe"], resultado="corrigido")
+            print(f"✔ {cnpj}: corrigido")
+            corrigidos.append(cnpj)
+            linhas.extend([r.get(c, "") for c in COLUMNS] for r in rows)
+        if i + 1 < len(itens) and not replaying():
+            time.sleep(SLEEP)
+
+    # só sai da fila depois que a correção foi gravada na saída
+    patch_output(saida, pd.DataFrame(linhas, columns=COLUMNS))
+    for cnpj in corrigidos:
+        dlq.resolve(cnpj)
+    print(f"\n✅ {len(corrigidos)} de {len(itens)} CNPJs corrigidos em {saida}")
+    print(resumo_fila(dlq) or "Fila de erros vazia.")
+    # arquivo próprio: não sobrescreve as métricas da execução completa
+    json_path, _ = METRICS.export(output_base(saida) + ".reprocessar")
+    print(f"📊 Métricas salvas em {json_path}")
+
+
+def parse_args(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Consulta anual do Simples Nacional por CNPJ.")
+    ap.add_argument("--entrada", default=INPUT_FILE, help="arquivo .txt com 1 CNPJ por linha")
+    ap.add_argument("--saida", default=OUTPUT_FILE, help="arquivo de saída")
+    ap.add_argument("--formato", choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT,
+                    help="xlsx, parquet (particionado por ano), csv (gzip) ou jsonl; padrão: pela extensão de --saida")
+    add_run_args(ap, SLEEP, MAX_CONCORRENCIA)
+    ap.add_argument("--reprocessar", action="store_true",
+                    help="consulta de novo só os CNPJs da fila de erros de --saida e corrige as linhas no arquivo")
+    ap.add_argument("--forcar", action="store_true", help="com --reprocessar: ignora a espera (backoff) da fila")
+    ap.add_argument("--limpar-dlq", action="store_true",
+                    help="tira da fila de erros os CNPJs que não estão em --entrada (use só com a lista completa)")
+    return ap.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    INPUT_FILE = args.entrada
+    OUTPUT_FILE = args.saida
+    apply_run_args(sys.modules[__name__], args)
+    if args.reprocessar:
+        reprocessar(formato=args.formato, forcar=args.forcar)
+    else:
+        with profiled(args, OUTPUT_FILE):
+            main(formato=args.formato, limpar_dlq=args.limpar_dlq)
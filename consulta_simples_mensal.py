@@ -1,14 +1,18 @@
 import os
 import re
-import time
+import sys
 from datetime import datetime, date, timedelta
 from dotenv import load_dotenv
-import requests
-import pandas as pd
-from tqdm import tqdm
 from pathlib import Path
-from dateutil import parser as dparser
 import calendar
+from saidas import (OUTPUT_FORMATS, export_metrics, infer_format, merge_resume, report_pending, resume_path_for,
+                    resume_target, WIDE_FIXED_COLUMNS, WIDE_LEGEND, StreamingWriter, wide_row)
+from chaves_api import api_key_from_env
+from consulta_http import (PENDENTE, DeadlineExceeded, add_run_args, apply_run_args, deadline_passed,
+                           default_session, fetch_cnpj, profiled, responses)
+from metricas import METRICS
+# requests, pandas, tqdm e dateutil são importados dentro das funções que os usam:
+# carregar o módulo (ou rodar --help) não paga o import dessas bibliotecas.
 
 # ============================================================
 # CONFIGURAÇÕES
@@ -16,11 +20,18 @@ import calendar
 load_dotenv()
 
 API_URL = os.getenv("API_URL")
-API_KEY = os.getenv("API_KEY")
+API_KEY = api_key_from_env()   # KeyPool se API_KEYS estiver no .env
 INPUT_FILE = "cnpjs.txt"
 OUTPUT_FILE = "resultado_simples1.xlsx"
 SLEEP = 0.5
+LIMITER = None           # AdaptiveLimiter com --adaptativo: substitui o SLEEP fixo
+MAX_CONCORRENCIA = 8
+DEADLINE = None          # time.monotonic() em que a execução para (--max-duration)
 DEBUG = True
+OUTPUT_LAYOUT = "longo"   # "longo" (1 linha por CNPJ/mês) ou "largo" (1 linha por CNPJ)
+OUTPUT_FORMAT = None      # xlsx | parquet | csv | jsonl (None = pela extensão de OUTPUT_FILE)
+
+LONG_COLUMNS = ["CNPJ", "MÊS", "REGIME", "MOTIVO", "Períodos_detectados", "Situacao_Atual"]
 
 
 # ============================================================
@@ -40,16 +51,8 @@ def read_cnpjs(path):
 
 def query_infosimples(cnpj):
     try:
-        if API_URL and API_URL.strip():
-            args = {"cnpj": cnpj, "token": API_KEY, "timeout": 300}
-            r = requests.post(API_URL, data=args, timeout=60)
-        else:
-            r = requests.get(f"https://www.receitaws.com.br/v1/cnpj/{cnpj}", timeout=60)
-
-        try:
-            j = r.json()
-        except Exception:
-            j = None
+        status, j = fetch_cnpj(cnpj, API_URL, API_KEY, session=default_session(), limiter=LIMITER,
+                               deadline=DEADLINE)
 
         if DEBUG:
             print("=" * 80)
@@ -59,8 +62,11 @@ def query_infosimples(cnpj):
             import json
             print(json.dumps(j, indent=2, ensure_ascii=False))
 
-        return r.status_code, j
+        return status, j
     except Exception as e:
+        if isinstance(e, DeadlineExceeded) or deadline_passed(DEADLINE):
+            # acabou o prazo: fica para a próxima execução em vez de virar erro
+            return PENDENTE, None
         if DEBUG:
             print(f"[DEBUG] Erro na requisição para {cnpj}: {e}")
         return None, None
@@ -77,6 +83,7 @@ def parse_date_any(s):
         except Exception:
             pass
     try:
+        from dateutil import parser as dparser
         return dparser.parse(s, dayfirst=True).date()
     except Exception:
         return None
@@ -176,91 +183,165 @@ def is_month_fully_covered(periods, year, month):
 # ============================================================
 # PROCESSAMENTO PRINCIPAL
 # ============================================================
-def main():
-    cnpjs = read_cnpjs(INPUT_FILE)
-    rows = []
-    start_year = 2020
-    hoje = date.today()
+def detect_periods(resp_json, hoje):
+    periods = extract_periods_from_response(resp_json)
+
+    # ==========================
+    # SITUAÇÃO ATUAL + COMPLETAR PERÍODOS
+    # ==========================
+    situacao_atual = None
+
+    if resp_json and "data" in resp_json:
+        data_field = resp_json["data"]
+        if isinstance(data_field, list) and len(data_field) > 0:
+            data_item = data_field[0]
+        elif isinstance(data_field, dict):
+            data_item = data_field
+        else:
+            data_item = {}
+
+        situacao_atual = (
+            data_item.get("simples_nacional_situacao")
+            or data_item.get("situacao_simples")
+            or data_item.get("situacao")
+        )
+
+    texto_situacao = (situacao_atual or "").lower()
+
+    if (
+        "optante pelo simples nacional" in texto_situacao
+        and "não optante" not in texto_situacao
+        and "nao optante" not in texto_situacao
+    ):
+        m = re.search(r"desde\s+(\d{2}/\d{2}/\d{4})", texto_situacao)
+        if m:
+            start_date = parse_date_any(m.group(1))
+        else:
+            start_date = date(hoje.year, 1, 1)
+
+        has_open_period = any(p.get("end") is None for p in periods)
+        if not has_open_period:
+            periods.append({
+                "start": start_date,
+                "end": None,
+                "detalhe": "Situação Atual: Optante pelo Simples Nacional"
+            })
+
+    return periods, situacao_atual
 
-    for cnpj in tqdm(cnpjs, desc="Consultando CNPJs"):
-        status, resp_json = query_infosimples(cnpj)
-        periods = extract_periods_from_response(resp_json)
-
-        # ==========================
-        # SITUAÇÃO ATUAL + COMPLETAR PERÍODOS
-        # ==========================
-        situacao_atual = None
-
-        if resp_json and "data" in resp_json:
-            data_field = resp_json["data"]
-            if isinstance(data_field, list) and len(data_field) > 0:
-                data_item = data_field[0]
-            elif isinstance(data_field, dict):
-                data_item = data_field
-            else:
-                data_item = {}
-
-            situacao_atual = (
-                data_item.get("simples_nacional_situacao")
-                or data_item.get("situacao_simples")
-                or data_item.get("situacao")
-            )
-
-        texto_situacao = (situacao_atual or "").lower()
-
-        if (
-            "optante pelo simples nacional" in texto_situacao
-            and "não optante" not in texto_situacao
-            and "nao optante" not in texto_situacao
-        ):
-            m = re.search(r"desde\s+(\d{2}/\d{2}/\d{4})", texto_situacao)
-            if m:
-                start_date = parse_date_any(m.group(1))
-            else:
-                start_date = date(hoje.year, 1, 1)
-
-            has_open_period = any(p.get("end") is None for p in periods)
-            if not has_open_period:
-                periods.append({
-                    "start": start_date,
-                    "end": None,
-                    "detalhe": "Situação Atual: Optante pelo Simples Nacional"
-                })
-
-        # ==========================
-        # GERA LINHAS POR MÊS
-        # ==========================
-        for year in range(start_year, hoje.year + 1):
-            for month in range(1, 13):
-                if year == hoje.year and month > hoje.month:
-                    continue
 
-                regime, motivo = is_month_fully_covered(periods, year, month)
-                regime_str = "Simples Nacional" if regime else "Outro Regime"
-                mes_str = f"{year}-{str(month).zfill(2)}"
+def months_in_range(start_year, hoje):
+    for year in range(start_year, hoje.year + 1):
+        for month in range(1, 13):
+            if year == hoje.year and month > hoje.month:
+                continue
+            yield year, month
 
-                periods_str = "; ".join([
-                    f"{p['start']} - {p.get('end', 'até hoje')} [{p.get('detalhe', '')}]"
-                    for p in periods
-                ])
 
-                rows.append({
-                    "CNPJ": cnpj,
-                    "MÊS": mes_str,
-                    "REGIME": regime_str,
-                    "MOTIVO": motivo,
-                    "Períodos_detectados": periods_str,
-                    "Situacao_Atual": situacao_atual or ""
-                })
+def month_coverage(periods, start_year, hoje):
+    """Lista [(mes_str, regime, motivo), ...] de start_year até o mês atual."""
+    coverage = []
+    for year, month in months_in_range(start_year, hoje):
+        regime, motivo = is_month_fully_covered(periods, year, month)
+        coverage.append((f"{year}-{str(month).zfill(2)}", regime, motivo))
+    return coverage
 
-        time.sleep(SLEEP)
 
-    df = pd.DataFrame(rows, columns=[
-        "CNPJ", "MÊS", "REGIME", "MOTIVO", "Períodos_detectados", "Situacao_Atual"
-    ])
-    df.to_excel(OUTPUT_FILE, index=False)
-    print(f"\n✅ Consulta finalizada. Planilha salva em {OUTPUT_FILE}")
+def main(layout=None, formato=None):
+    from tqdm import tqdm
+    layout = layout or OUTPUT_LAYOUT
+    formato = formato or OUTPUT_FORMAT
+    METRICS.reset()
+    cnpjs = read_cnpjs(INPUT_FILE)
+    destino, existente = OUTPUT_FILE, resume_target(INPUT_FILE, OUTPUT_FILE, formato)
+    if existente:
+        # retomada do .pendentes.txt: grava à parte e mescla na saída no fim, sem truncar o que já existe
+        formato = formato or infer_format(OUTPUT_FILE)
+        destino = resume_path_for(OUTPUT_FILE)
+    start_year = 2020
+    hoje = date.today()
+
+    pendentes = []
+    respostas = responses(query_infosimples, cnpjs, LIMITER, SLEEP, DEADLINE)
+
+    def consultar():
+        for cnpj, (status, resp_json) in tqdm(respostas, total=len(cnpjs), desc="Consultando CNPJs"):
+            if status == PENDENTE:
+                # regime None = pendente (código PD no layout largo)
+                pendentes.append(cnpj)
+                yield cnpj, [], "", [(f"{y}-{str(m).zfill(2)}", None, "Prazo da execução esgotado.")
+                                     for y, m in months_in_range(start_year, hoje)]
+                continue
+            with METRICS.timer("extracao"):
+                periods, situacao_atual = detect_periods(resp_json, hoje)
+            with METRICS.timer("cobertura"):
+                coverage = month_coverage(periods, start_year, hoje)
+            METRICS.inc("cnpjs")
+            yield cnpj, periods, situacao_atual, coverage
+
+    # ==========================
+    # LAYOUT LARGO: 1 LINHA POR CNPJ
+    # ==========================
+    if layout == "largo":
+        months = [f"{y}-{str(m).zfill(2)}" for y, m in months_in_range(start_year, hoje)]
+        with StreamingWriter(destino, WIDE_FIXED_COLUMNS + months, formato,
+                             freeze_panes="B2", legend=WIDE_LEGEND) as writer:
+            for cnpj, periods, situacao_atual, coverage in consultar():
+                writer.put([wide_row(cnpj, coverage, situacao_atual)])
+        finish(writer, existente, pendentes)
+        return
+
+    # ==========================
+    # GERA LINHAS POR MÊS
+    # ==========================
+    # cada CNPJ vai para a thread de escrita assim que termina
+    with StreamingWriter(destino, LONG_COLUMNS, formato, partition_col="MÊS") as writer:
+        for cnpj, periods, situacao_atual, coverage in consultar():
+            periods_str = "; ".join([
+                f"{p['start']} - {p.get('end', 'até hoje')} [{p.get('detalhe', '')}]"
+                for p in periods
+            ])
+            writer.put([
+                [
+                    cnpj,
+                    mes_str,
+                    PENDENTE if regime is None else ("Simples Nacional" if regime else "Outro Regime"),
+                    motivo,
+                    periods_str,
+                    situacao_atual or "",
+                ]
+                for mes_str, regime, motivo in coverage
+            ])
+    finish(writer, existente, pendentes)
+
+
+def finish(writer, existente, pendentes):
+    saida = writer.path
+    if existente:
+        merge_resume(existente, writer.path, writer.formato)
+        saida = existente
+    print(f"\n✅ Consulta finalizada. Resultado salvo em {saida}")
+    report_pending(saida, pendentes)
+    export_metrics(saida)
+
+
+def parse_args(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Consulta mensal do Simples Nacional por CNPJ.")
+    ap.add_argument("--entrada", default=INPUT_FILE, help="arquivo .txt com 1 CNPJ por linha")
+    ap.add_argument("--saida", default=OUTPUT_FILE, help="planilha de saída")
+    ap.add_argument("--layout", choices=["longo", "largo"], default=OUTPUT_LAYOUT,
+                    help="longo: 1 linha por CNPJ e mês; largo: 1 linha por CNPJ e 1 coluna por mês")
+    ap.add_argument("--formato", choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT,
+                    help="xlsx, parquet (particionado por ano), csv (gzip) ou jsonl; padrão: pela extensão de --saida")
+    add_run_args(ap, SLEEP, MAX_CONCORRENCIA)
+    return ap.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    INPUT_FILE = args.entrada
+    OUTPUT_FILE = args.saida
+    apply_run_args(sys.modules[__name__], args)
+    with profiled(args, OUTPUT_FILE):
+        main(layout=args.layout, formato=args.formato)
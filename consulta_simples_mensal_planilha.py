@@ -3,21 +3,26 @@ import re
 import time
 from datetime import datetime, date, timedelta
 from dotenv import load_dotenv
-import requests
-import pandas as pd
-from tqdm import tqdm
 from pathlib import Path
-from dateutil import parser as dparser
 import calendar
+from saidas import OUTPUT_FORMATS, StreamingWriter, export_metrics
+from chaves_api import api_key_from_env
+from consulta_http import default_session, fetch_cnpj, replaying
+from metricas import METRICS
+# requests, pandas, tqdm e dateutil são importados dentro das funções que os usam:
+# carregar o módulo (ou rodar --help) não paga o import dessas bibliotecas.
 
 load_dotenv()
 
 API_URL = os.getenv("API_URL")
-API_KEY = os.getenv("API_KEY")
+API_KEY = api_key_from_env()   # KeyPool se API_KEYS estiver no .env
 INPUT_FILE = "PIS-Cofins - 865 - C100, C170 - Notas-Itens Sem Crédito - EFD-Contribuições e EFD-ICMS-IPI - teste.xlsx"
 OUTPUT_FILE = "resultado_simples_sem_duplicações.xlsx"
 SLEEP = 0.5
 DEBUG = True
+OUTPUT_FORMAT = None  # xlsx | parquet | csv | jsonl (None = pela extensão de OUTPUT_FILE)
+
+COLUMNS = ["CNPJ", "MÊS", "REGIME", "MOTIVO", "Períodos_detectados", "Situacao_Atual"]
 
 def clean_cnpj(s):
     return re.sub(r'\D', '', str(s)).zfill(14)
@@ -26,6 +31,7 @@ def read_cnpjs(path):
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(f"{path} não encontrado.")
+    import pandas as pd
     df = pd.read_excel(path)
     if 'cnpj_part' not in df.columns:
         raise ValueError("A planilha deve conter a coluna 'cnpj_part'")
@@ -34,16 +40,7 @@ def read_cnpjs(path):
 
 def query_infosimples(cnpj):
     try:
-        if API_URL and API_URL.strip():
-            args = {"cnpj": cnpj, "token": API_KEY, "timeout": 300}
-            r = requests.post(API_URL, data=args, timeout=60)
-        else:
-            r = requests.get(f"https://www.receitaws.com.br/v1/cnpj/{cnpj}", timeout=60)
-
-        try:
-            j = r.json()
-        except Exception:
-            j = None
+        status, j = fetch_cnpj(cnpj, API_URL, API_KEY, session=default_session())
 
         if DEBUG:
             print("=" * 80)
@@ -53,7 +50,7 @@ def query_infosimples(cnpj):
             import json
             print(json.dumps(j, indent=2, ensure_ascii=False))
 
-        return r.status_code, j
+        return status, j
     except Exception as e:
         if DEBUG:
             print(f"[DEBUG] Erro na requisição para {cnpj}: {e}")
@@ -71,6 +68,7 @@ def parse_date_any(s):
         except Exception:
             pass
     try:
+        from dateutil import parser as dparser
         return dparser.parse(s, dayfirst=True).date()
     except Exception:
         return None
@@ -161,86 +159,109 @@ def is_month_fully_covered(periods, year, month):
 
     return False, "Não optante/Nunca esteve no Simples Nacional neste mês."
 
-def main():
-    cnpjs = read_cnpjs(INPUT_FILE)
-    rows = []
-    start_year = 2020
-    hoje = date.today()
 
-    for cnpj in tqdm(cnpjs, desc="Consultando CNPJs"):
-        status, resp_json = query_infosimples(cnpj)
+def rows_for(cnpj, resp_json, start_year, hoje):
+    """Linhas (uma por mês) de um CNPJ a partir da resposta da API."""
+    with METRICS.timer("extracao"):
         periods = extract_periods_from_response(resp_json)
 
-        situacao_atual = None
-
-        if resp_json and "data" in resp_json:
-            data_field = resp_json["data"]
-            if isinstance(data_field, list) and len(data_field) > 0:
-                data_item = data_field[0]
-            elif isinstance(data_field, dict):
-                data_item = data_field
-            else:
-                data_item = {}
-
-            situacao_atual = (
-                data_item.get("simples_nacional_situacao")
-                or data_item.get("situacao_simples")
-                or data_item.get("situacao")
-            )
-
-        texto_situacao = (situacao_atual or "").lower()
-
-        if (
-            "optante pelo simples nacional" in texto_situacao
-            and "não optante" not in texto_situacao
-            and "nao optante" not in texto_situacao
-        ):
-            m = re.search(r"desde\s+(\d{2}/\d{2}/\d{4})", texto_situacao)
-            if m:
-                start_date = parse_date_any(m.group(1))
-            else:
-                start_date = date(hoje.year, 1, 1)
-
-            has_open_period = any(p.get("end") is None for p in periods)
-            if not has_open_period:
-                periods.append({
-                    "start": start_date,
-                    "end": None,
-                    "detalhe": "Situação Atual: Optante pelo Simples Nacional"
-                })
-
-
-        for year in range(start_year, hoje.year + 1):
-            for month in range(1, 13):
-                if year == hoje.year and month > hoje.month:
-                    continue
+    situacao_atual = None
 
-                regime, motivo = is_month_fully_covered(periods, year, month)
-                regime_str = "Simples Nacional" if regime else "Outro Regime"
-                mes_str = f"{year}-{str(month).zfill(2)}"
+    if resp_json and "data" in resp_json:
+        data_field = resp_json["data"]
+        if isinstance(data_field, list) and len(data_field) > 0:
+            data_item = data_field[0]
+        elif isinstance(data_field, dict):
+            data_item = data_field
+        else:
+            data_item = {}
+
+        situacao_atual = (
+            data_item.get("simples_nacional_situacao")
+            or data_item.get("situacao_simples")
+            or data_item.get("situacao")
+        )
+
+    texto_situacao = (situacao_atual or "").lower()
+
+    if (
+        "optante pelo simples nacional" in texto_situacao
+        and "não optante" not in texto_situacao
+        and "nao optante" not in texto_situacao
+    ):
+        m = re.search(r"desde\s+(\d{2}/\d{2}/\d{4})", texto_situacao)
+        if m:
+            start_date = parse_date_any(m.group(1))
+        else:
+            start_date = date(hoje.year, 1, 1)
+
+        has_open_period = any(p.get("end") is None for p in periods)
+        if not has_open_period:
+            periods.append({
+                "start": start_date,
+                "end": None,
+                "detalhe": "Situação Atual: Optante pelo Simples Nacional"
+            })
+
+    t0 = time.perf_counter()
+    for year in range(start_year, hoje.year + 1):
+        for month in range(1, 13):
+            if year == hoje.year and month > hoje.month:
+                continue
+
+            regime, motivo = is_month_fully_covered(periods, year, month)
+            regime_str = "Simples Nacional" if regime else "Outro Regime"
+            mes_str = f"{year}-{str(month).zfill(2)}"
+
+            periods_str = "; ".join([
+                f"{p['start']} - {p.get('end', 'até hoje')} [{p.get('detalhe', '')}]"
+                for p in periods
+            ])
+
+            yield {
+                "CNPJ": cnpj,
+                "MÊS": mes_str,
+                "REGIME": regime_str,
+                "MOTIVO": motivo,
+                "Períodos_detectados": periods_str,
+                "Situacao_Atual": situacao_atual or ""
+            }
+    METRICS.observe("cobertura", time.perf_counter() - t0)
+
+
+def main(formato=None):
+    from tqdm import tqdm
+    formato = formato or OUTPUT_FORMAT
+    METRICS.reset()
+    cnpjs = read_cnpjs(INPUT_FILE)
+    start_year = 2020
+    hoje = date.today()
 
-                periods_str = "; ".join([
-                    f"{p['start']} - {p.get('end', 'até hoje')} [{p.get('detalhe', '')}]"
-                    for p in periods
-                ])
+    # cada CNPJ vai para a thread de escrita assim que termina
+    with StreamingWriter(OUTPUT_FILE, COLUMNS, formato, partition_col="MÊS") as writer:
+        for cnpj in tqdm(cnpjs, desc="Consultando CNPJs"):
+            status, resp_json = query_infosimples(cnpj)
+            writer.put([[r[c] for c in COLUMNS] for r in rows_for(cnpj, resp_json, start_year, hoje)])
+            METRICS.inc("cnpjs")
+            if not replaying():  # cassete: sem rede, sem pausa
+                time.sleep(SLEEP)
 
-                rows.append({
-                    "CNPJ": cnpj,
-                    "MÊS": mes_str,
-                    "REGIME": regime_str,
-                    "MOTIVO": motivo,
-                    "Períodos_detectados": periods_str,
-                    "Situacao_Atual": situacao_atual or ""
-                })
+    print(f"\n✅ Consulta finalizada. Resultado salvo em {writer.path}")
+    export_metrics(writer.path)
 
-        time.sleep(SLEEP)
 
-    df = pd.DataFrame(rows, columns=[
-        "CNPJ", "MÊS", "REGIME", "MOTIVO", "Períodos_detectados", "Situacao_Atual"
-    ])
-    df.to_excel(OUTPUT_FILE, index=False)
-    print(f"\n✅ Consulta finalizada. Planilha salva em {OUTPUT_FILE}")
+def parse_args(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Consulta mensal do Simples Nacional a partir da coluna 'cnpj_part' de uma planilha.")
+    ap.add_argument("--entrada", default=INPUT_FILE, help="planilha com a coluna 'cnpj_part'")
+    ap.add_argument("--saida", default=OUTPUT_FILE, help="arquivo de saída")
+    ap.add_argument("--formato", choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT,
+                    help="xlsx, parquet (particionado por ano), csv (gzip) ou jsonl; padrão: pela extensão de --saida")
+    return ap.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    INPUT_FILE = args.entrada
+    OUTPUT_FILE = args.saida
+    main(formato=args.formato)
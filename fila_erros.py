@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Fila de CNPJs que falharam (dead-letter): guarda a classe do erro e as tentativas
+# para reprocessar só eles depois, sem rodar a lista inteira de novo.
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from saidas import output_base
+
+# Política própria do reprocessamento: espera exponencial por CNPJ, com teto
+BACKOFF_BASE = 60.0          # 1ª nova tentativa liberada 1 min depois da falha
+BACKOFF_MAX = 6 * 3600.0
+MAX_TENTATIVAS = 6           # depois disso o CNPJ fica na fila como "desistido"
+
+
+def backoff(tentativas):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, tentativas - 1))
+
+
+def queue_path_for(output_path):
+    """<saida>.fila_erros.sqlite3, ao lado do arquivo que o reprocessamento vai corrigir."""
+    return output_base(output_path) + ".fila_erros.sqlite3"
+
+
+class DeadLetterQueue:
+    """
+    Um registro por CNPJ com falha: origem (script), classe do erro (ERRO_CONSULTA,
+    API_CODE_605, HTTP_429...), detalhe, tentativas e quando pode tentar de novo.
+
+        dlq = DeadLetterQueue.for_output("resultado.xlsx")
+        dlq.add(cnpj, "anual", "ERRO_CONSULTA", "timeout", saida="resultado.xlsx")
+        for item in dlq.due():
+            ... consulta de novo ...
+            dlq.resolve(item["cnpj"])      # ou dlq.add(...) de novo se falhar
+
+    O arquivo só é criado na primeira falha.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @classmethod
+    def for_output(cls, output_path):
+        return cls(queue_path_for(output_path))
+
+    def _db(self, create=True):
+        if self._conn is None:
+            if not create and not os.path.exists(self.path):
+                return None
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS erros ("
+                " cnpj TEXT PRIMARY KEY, origem TEXT, saida TEXT, classe TEXT, detalhe TEXT,"
+                " tentativas INTEGER NOT NULL, primeira_falha REAL, ultima_falha REAL,"
+                " proxima_tentativa REAL)"
+            )
+        return self._conn
+
+    # ---------- API ----------
+    def add(self, cnpj, origem, classe, detalhe="", saida=""):
+        """Registra (mais) uma falha do CNPJ e agenda a próxima tentativa. Devolve as tentativas."""
+        agora = time.time()
+        with self._lock:
+            c = self._db()
+            row = c.execute("SELECT tentativas FROM erros WHERE cnpj = ?", (cnpj,)).fetchone()
+            tentativas = (row[0] if row else 0) + 1
+            c.execute(
+                "INSERT INTO erros (cnpj, origem, saida, classe, detalhe, tentativas, primeira_falha,"
+                " ultima_falha, proxima_tentativa) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(cnpj) DO UPDATE SET origem = excluded.origem, saida = excluded.saida,"
+                " classe = excluded.classe, detalhe = excluded.detalhe, tentativas = excluded.tentativas,"
+                " ultima_falha = excluded.ultima_falha, proxima_tentativa = excluded.proxima_tentativa",
+                (cnpj, origem, str(saida), classe, str(detalhe)[:500], tentativas, agora, agora,
+                 agora + backoff(tentativas)),
+            )
+            c.commit()
+        return tentativas
+
+    def resolve(self, cnpj):
+        """Tira o CNPJ da fila (consulta deu certo)."""
+        with self._lock:
+            c = self._db(create=False)
+            if c is not None:
+                c.execute("DELETE FROM erros WHERE cnpj = ?", (cnpj,))
+                c.commit()
+
+    def items(self):
+        with self._lock:
+            c = self._db(create=False)
+            if c is None:
+                return []
+            cur = c.execute("SELECT * FROM erros ORDER BY primeira_falha, cnpj")
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def due(self, now=None, force=False):
+        """CNPJs liberados para nova tentativa (force ignora o agendamento, não o limite)."""
+        now = time.time() if now is None else now
+        return [i for i in self.items() if i["tentativas"] < MAX_TENTATIVAS
+                and (force or i["proxima_tentativa"] <= now)]
+
+    def keep_only(self, cnpjs):
+        """Tira da fila quem não está em `cnpjs` (só com a lista completa: --limpar-dlq)."""
+        manter = set(cnpjs)
+        with self._lock:
+            c = self._db(create=False)
+            if c is None:
+                return
+            fora = [(r[0],) for r in c.execute("SELECT cnpj FROM erros") if r[0] not in manter]
+            c.executemany("DELETE FROM erros WHERE cnpj = ?", fora)
+            c.commit()
+
+    def __len__(self):
+        return len(self.items())
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def resumo(dlq):
+    """Texto curto com o estado da fila, para o fim das execuções."""
+    itens = dlq.items()
+    if not itens:
+        return None
+    agora = time.time()
+    liberados = sum(1 for i in itens if i["tentativas"] < MAX_TENTATIVAS and i["proxima_tentativa"] <= agora)
+    desistidos = sum(1 for i in itens if i["tentativas"] >= MAX_TENTATIVAS)
+    return (f"{len(itens)} CNPJs na fila de erros ({liberados} liberados para reprocessar, "
+            f"{desistidos} desistidos) em {dlq.path}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Mostra a fila de erros de uma saída.")
+    ap.add_argument("saida", help="arquivo de saída (ou o próprio .fila_erros.sqlite3)")
+    args = ap.parse_args(argv)
+    path = args.saida if args.saida.endswith(".sqlite3") else queue_path_for(args.saida)
+    dlq = DeadLetterQueue(path)
+    itens = dlq.items()
+    if not itens:
+        print(f"Fila vazia ({path}).")
+        return 0
+    agora = time.time()
+    for i in itens:
+        if i["tentativas"] >= MAX_TENTATIVAS:
+            quando = "desistido"
+        else:
+            falta = i["proxima_tentativa"] - agora
+            quando = "liberado" if falta <= 0 else f"em {falta / 60:.0f} min"
+        print(f"{i['cnpj']}  {i['origem']:<9} {i['classe']:<16} tentativas={i['tentativas']}  {quando}  {i['detalhe']}")
+    print(resumo(dlq))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
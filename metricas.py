@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# Métricas de execução: tempos por etapa (p50/p95/p99), contadores e export no fim do run.
+
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites superiores (segundos) dos baldes dos histogramas: memória fixa por etapa,
+# não importa quantos CNPJs o lote tenha. O último balde (+Inf) fica implícito.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Histogram:
+    __slots__ = ("counts", "n", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.n += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def copy(self):
+        h = _Histogram()
+        h.counts, h.n, h.total, h.max = list(self.counts), self.n, self.total, self.max
+        return h
+
+    def percentile(self, q):
+        # interpolação linear dentro do balde (como o histogram_quantile do Prometheus),
+        # limitada ao maior valor visto
+        if not self.n:
+            return 0.0
+        alvo = q * self.n
+        acumulado = 0
+        for i, c in enumerate(self.counts):
+            if c and acumulado + c >= alvo:
+                baixo = BUCKETS[i - 1] if i > 0 else 0.0
+                alto = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(self.max, baixo + (alto - baixo) * (alvo - acumulado) / c)
+            acumulado += c
+        return self.max
+
+
+class Metrics:
+    """
+    Registro de métricas do processo (thread-safe).
+
+      METRICS.observe("fetch", 0.42, provider="infosimples")
+      with METRICS.timer("extracao"):
+          ...
+      METRICS.inc("http_respostas", provider="receitaws", status=429)
+      METRICS.export("resultado.xlsx")  # -> resultado.metricas.json / .prom
+    """
+
+    def __init__(self, prefix="consulta"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._hist = {}
+            self._counters = {}
+            self._gauges = {}
+
+    # ---------- coleta ----------
+    def observe(self, name, seconds, **labels):
+        k = _key(name, labels)
+        with self._lock:
+            h = self._hist.get(k)
+            if h is None:
+                h = self._hist[k] = _Histogram()
+            h.add(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def inc(self, name, value=1, **labels):
+        k = _key(name, labels)
+        with self._lock:
+            self._counters[k] = self._counters.get(k, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    # ---------- resumo / export ----------
+    def summary(self):
+        with self._lock:
+            hist = {k: h.copy() for k, h in self._hist.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            elapsed = time.time() - self.started_at
+
+        def fmt(k):
+            name, labels = k
+            return {"nome": name, "labels": dict(labels)}
+
+        etapas = []
+        for k, h in sorted(hist.items()):
+            item = fmt(k)
+            item.update({
+                "n": h.n,
+                "total_s": round(h.total, 6),
+                "p50_s": round(h.percentile(0.50), 6),
+                "p95_s": round(h.percentile(0.95), 6),
+                "p99_s": round(h.percentile(0.99), 6),
+                "max_s": round(h.max, 6),
+                "baldes": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], h.counts)),
+            })
+            etapas.append(item)
+
+        cnpjs = sum(v for (name, _), v in counters.items() if name == "cnpjs")
+        return {
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "duracao_s": round(elapsed, 3),
+            "cnpjs": cnpjs,
+            "cnpjs_por_s": round(cnpjs / elapsed, 3) if elapsed > 0 else 0.0,
+            "etapas": etapas,
+            "contadores": [dict(fmt(k), valor=v) for k, v in sorted(counters.items())],
+            "gauges": [dict(fmt(k), valor=v) for k, v in sorted(gauges.items())],
+        }
+
+    def to_prometheus(self):
+        s = self.summary()
+        lines = []
+
+        def labels_str(labels, extra=None):
+            items = list(labels.items()) + list((extra or {}).items())
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+        seen = set()
+        for e in s["etapas"]:
+            metric = f"{self.prefix}_{e['nome']}_seconds"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} histogram")
+                seen.add(metric)
+            acumulado = 0
+            for le, c in e["baldes"].items():
+                acumulado += c
+                lines.append(f"{metric}_bucket{labels_str(e['labels'], {'le': le})} {acumulado}")
+            lines.append(f"{metric}_sum{labels_str(e['labels'])} {e['total_s']}")
+            lines.append(f"{metric}_count{labels_str(e['labels'])} {e['n']}")
+        for c in s["contadores"]:
+            metric = f"{self.prefix}_{c['nome']}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{labels_str(c['labels'])} {c['valor']}")
+        for g in s["gauges"]:
+            metric = f"{self.prefix}_{g['nome']}"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} gauge")
+                seen.add(metric)
+            lines.append(f"{metric}{labels_str(g['labels'])} {g['valor']}")
+        lines.append(f"# TYPE {self.prefix}_duracao_seconds gauge")
+        lines.append(f"{self.prefix}_duracao_seconds {s['duracao_s']}")
+        lines.append(f"# TYPE {self.prefix}_cnpjs_por_segundo gauge")
+        lines.append(f"{self.prefix}_cnpjs_por_segundo {s['cnpjs_por_s']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, output_path):
+        """Grava <saida>.metricas.json e <saida>.metricas.prom ao lado do arquivo de saída."""
+        from saidas import output_base   # saidas importa este módulo
+        base = output_base(output_path)
+        json_path = f"{base}.metricas.json"
+        prom_path = f"{base}.metricas.prom"
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        with open(prom_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"\n⏱️  {s['cnpjs']} CNPJs em {s['duracao_s']:.1f}s ({s['cnpjs_por_s']:.2f} CNPJs/s)")
+        for e in s["etapas"]:
+            labels = ",".join(f"{k}={v}" for k, v in e["labels"].items())
+            nome = f"{e['nome']}[{labels}]" if labels else e["nome"]
+            print(f"   {nome:<32} n={e['n']:<7} p50={e['p50_s'] * 1000:8.1f}ms "
+                  f"p95={e['p95_s'] * 1000:8.1f}ms p99={e['p99_s'] * 1000:8.1f}ms")
+
+
+# Registro único do processo, compartilhado pelos módulos (consulta_http, saidas, scripts)
+METRICS = Metrics()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Modo --profile: cProfile + amostragem de pilhas (flamegraph) de um run inteiro.
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class Profiler:
+    """
+    Envolve o pipeline inteiro (leitura → consulta → extração → cobertura → gravação):
+
+        with Profiler("resultado"):
+            main()
+
+    Gera, a partir do prefixo informado:
+      - <prefixo>.perfil.prof       dump do cProfile (abrir com pstats/snakeviz)
+      - <prefixo>.perfil.collapsed  pilhas amostradas no formato "a;b;c N"
+                                    (flamegraph.pl, speedscope, inferno)
+      - <prefixo>.perfil.top.txt    top-N funções por tempo próprio e acumulado
+
+    O cProfile cobre a thread principal; o amostrador olha todas as threads
+    (inclusive a de gravação do StreamingWriter) a cada `interval` segundos.
+    """
+
+    def __init__(self, prefix, interval=0.005, top=25):
+        self.prefix = str(prefix)
+        self.interval = interval
+        self.top = top
+        self.samples = Counter()
+        self._profile = cProfile.Profile()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="perfil-amostrador", daemon=True)
+
+    # ---------- amostragem de pilhas ----------
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.samples[";".join(reversed(stack))] += 1
+
+    # ---------- ciclo de vida ----------
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._sampler.start()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        self.elapsed = time.perf_counter() - self._started
+        self.write()
+        return False
+
+    def write(self):
+        prof_path = f"{self.prefix}.perfil.prof"
+        collapsed_path = f"{self.prefix}.perfil.collapsed"
+        top_path = f"{self.prefix}.perfil.top.txt"
+
+        self._profile.dump_stats(prof_path)
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        report = self.top_report()
+        with open(top_path, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(report)
+        print(f"🔬 Perfil salvo em {prof_path}, {collapsed_path} e {top_path}")
+        return prof_path, collapsed_path, top_path
+
+    def top_report(self):
+        out = io.StringIO()
+        out.write(f"Tempo total: {self.elapsed:.2f}s • {sum(self.samples.values())} amostras de pilha\n")
+        for sort_key, title in (("tottime", "tempo próprio"), ("cumulative", "tempo acumulado")):
+            out.write(f"\n=== Top {self.top} por {title} ===\n")
+            stats = pstats.Stats(self._profile, stream=out)
+            stats.strip_dirs().sort_stats(sort_key).print_stats(self.top)
+        return out.getvalue()
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Provedor local (stand-in) para testes de desempenho, sem gastar InfoSimples nem
+esbarrar no limite da ReceitaWS/BrasilAPI.
+
+Responde no mesmo formato que os scripts já entendem:
+  POST /                      InfoSimples (form cnpj/token) -> data[0].simples_nacional_*
+  GET  /v1/cnpj/<cnpj>        ReceitaWS -> opcao_pelo_simples / data_opcao_pelo_simples / simples{}
+  GET  /api/cnpj/v1/<cnpj>    BrasilAPI -> opcao_pelo_simples / data_*_do_simples
+
+Cada CNPJ gera sempre a mesma resposta (semente + CNPJ), então dois runs são comparáveis.
+Latência e falhas (429, timeout, JSON quebrado, code de erro da API) são sorteadas por requisição.
+
+Uso:
+    python provedor_local.py --porta 8765 --latencia lognormal:80,0.5 --taxa-429 0.02
+    API_URL=http://127.0.0.1:8765/ python consulta_simples_mensal.py --sleep 0
+    RECEITAWS_URL=http://127.0.0.1:8765/v1/cnpj/{cnpj} API_URL= python consulta_simples_anual.py
+
+    python provedor_local.py --gerar-corpus 10000 --corpus-saida cnpjs_sinteticos.txt
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# ==========================
+# CORPUS SINTÉTICO
+# ==========================
+PESOS_DV1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+PESOS_DV2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+
+# (perfil, peso) — distribuição aproximada de uma carteira de clientes
+PERFIS = [
+    ("optante", 45),
+    ("excluido", 20),
+    ("nunca", 20),
+    ("multiplos", 15),
+]
+
+MOTIVOS_EXCLUSAO = [
+    "Excluída por Comunicação Obrigatória",
+    "Excluída de Ofício",
+    "Excluída por Opção",
+    "Excluída por Débito",
+]
+
+
+def _digito(nums, pesos):
+    resto = sum(n * p for n, p in zip(nums, pesos)) % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def cnpj_com_dv(base12):
+    """Completa os 12 primeiros dígitos com os dígitos verificadores."""
+    nums = [int(c) for c in base12]
+    nums.append(_digito(nums, PESOS_DV1))
+    nums.append(_digito(nums, PESOS_DV2))
+    return "".join(str(n) for n in nums)
+
+
+def gerar_corpus(n, semente=42):
+    """Lista de `n` CNPJs válidos (matriz 0001), únicos e determinísticos pela semente."""
+    rng = random.Random(semente)
+    vistos = set()
+    corpus = []
+    while len(corpus) < n:
+        raiz = f"{rng.randrange(10 ** 8):08d}"
+        if raiz in vistos:
+            continue
+        vistos.add(raiz)
+        corpus.append(cnpj_com_dv(raiz + "0001"))
+    return corpus
+
+
+def _rng_do_cnpj(cnpj, semente):
+    h = hashlib.sha256(f"{semente}:{cnpj}".encode()).digest()
+    return random.Random(int.from_bytes(h[:8], "big"))
+
+
+def _data_aleatoria(rng, inicio, fim):
+    dias = (fim - inicio).days
+    return inicio + timedelta(days=rng.randint(0, max(dias, 0)))
+
+
+def _primeiro_dia(d):
+    return d.replace(day=1)
+
+
+def perfil_do_cnpj(cnpj, semente=42, hoje=None):
+    """
+    Histórico sintético do CNPJ no Simples:
+      {"perfil", "periodos": [(inicio, fim_ou_None, detalhe)], "optante_desde": date|None}
+    O último período aberto (fim None) é a opção vigente.
+    """
+    hoje = hoje or date.today()
+    rng = _rng_do_cnpj(cnpj, semente)
+    perfil = rng.choices([p for p, _ in PERFIS], weights=[w for _, w in PERFIS])[0]
+
+    periodos = []
+    if perfil == "nunca":
+        return {"perfil": perfil, "periodos": periodos, "optante_desde": None}
+
+    qtd = rng.randint(2, 4) if perfil == "multiplos" else 1
+    cursor = date(2007, 7, 1)
+    for i in range(qtd):
+        inicio = _primeiro_dia(_data_aleatoria(rng, cursor, hoje - timedelta(days=400)))
+        ultimo = i == qtd - 1
+        if ultimo and perfil in ("optante", "multiplos"):
+            periodos.append((inicio, None, ""))
+            break
+        fim = _data_aleatoria(rng, inicio + timedelta(days=180), min(inicio + timedelta(days=365 * 6), hoje))
+        if fim <= inicio:
+            fim = inicio + timedelta(days=180)
+        periodos.append((inicio, fim, rng.choice(MOTIVOS_EXCLUSAO)))
+        cursor = fim + timedelta(days=rng.randint(30, 720))
+        if cursor >= hoje - timedelta(days=400):
+            break
+
+    aberto = next((p for p in periodos if p[1] is None), None)
+    return {"perfil": perfil, "periodos": periodos, "optante_desde": aberto[0] if aberto else None}
+
+
+def _br(d):
+    return d.strftime("%d/%m/%Y") if d else ""
+
+
+def resposta_infosimples(cnpj, perfil):
+    desde = perfil["optante_desde"]
+    situacao = (
+        f"Optante pelo Simples Nacional desde {_br(desde)}" if desde
+        else "NÃO optante pelo Simples Nacional"
+    )
+    anteriores = [
+        {"inicio_data": _br(i), "fim_data": _br(f), "detalhamento": det}
+        for i, f, det in perfil["periodos"] if f is not None
+    ]
+    return {
+        "code": 200,
+        "code_message": "A requisição foi processada com sucesso.",
+        "header": {"api_version": "v2", "service": "receita-federal/simples", "billable": True},
+        "data_count": 1,
+        "data": [{
+            "cnpj": cnpj,
+            "razao_social": f"EMPRESA SINTETICA {cnpj[:8]} LTDA",
+            "simples_nacional_situacao": situacao,
+            "simei_situacao": "NÃO optante pelo SIMEI",
+            "simples_nacional_periodos_anteriores": anteriores,
+        }],
+        "errors": [],
+    }
+
+
+def resposta_receitaws(cnpj, perfil):
+    desde = perfil["optante_desde"]
+    fechados = [p for p in perfil["periodos"] if p[1] is not None]
+    ultimo = perfil["periodos"][-1] if perfil["periodos"] else None
+    return {
+        "status": "OK",
+        "cnpj": f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}",
+        "nome": f"EMPRESA SINTETICA {cnpj[:8]} LTDA",
+        "situacao": "ATIVA",
+        "opcao_pelo_simples": desde is not None,
+        "data_opcao_pelo_simples": _br(desde) if desde else None,
+        "simples": {
+            "optante": desde is not None,
+            "data_opcao": _br(ultimo[0]) if ultimo else None,
+            "data_exclusao": _br(fechados[-1][1]) if fechados and desde is None else None,
+            "ultima_atualizacao": date.today().isoformat() + "T00:00:00.000Z",
+        },
+    }
+
+
+def resposta_brasilapi(cnpj, perfil):
+    desde = perfil["optante_desde"]
+    fechados = [p for p in perfil["periodos"] if p[1] is not None]
+    ultimo = perfil["periodos"][-1] if perfil["periodos"] else None
+    return {
+        "cnpj": cnpj,
+        "razao_social": f"EMPRESA SINTETICA {cnpj[:8]} LTDA",
+        "opcao_pelo_simples": desde is not None,
+        "data_opcao_pelo_simples": ultimo[0].isoformat() if ultimo else None,
+        "data_exclusao_do_simples": fechados[-1][1].isoformat() if fechados and desde is None else None,
+        "regime_tributario": [],
+    }
+
+
+# ==========================
+# LATÊNCIA / FALHAS
+# ==========================
+def parse_latencia(spec):
+    """
+    "zero", "fixa:50", "uniforme:20,200", "lognormal:80,0.5" (mediana ms, sigma)
+    ou "exponencial:100" (média ms). Devolve função rng -> segundos.
+    """
+    nome, _, params = spec.partition(":")
+    vals = [float(v) for v in params.split(",") if v.strip()]
+    nome = nome.strip().lower()
+    if nome == "zero":
+        return lambda rng: 0.0
+    if nome == "fixa" and len(vals) == 1:
+        return lambda rng: vals[0] / 1000
+    if nome == "uniforme" and len(vals) == 2:
+        return lambda rng: rng.uniform(vals[0], vals[1]) / 1000
+    if nome == "lognormal" and len(vals) == 2:
+        mu = math.log(max(vals[0], 1e-3))
+        return lambda rng: rng.lognormvariate(mu, vals[1]) / 1000
+    if nome == "exponencial" and len(vals) == 1:
+        return lambda rng: rng.expovariate(1000 / vals[0]) if vals[0] > 0 else 0.0
+    raise ValueError(f"latência inválida: {spec!r}")
+
+
+class ProvedorConfig:
+    def __init__(self, latencia="lognormal:80,0.5", taxa_429=0.0, taxa_timeout=0.0,
+                 taxa_json_invalido=0.0, taxa_erro_api=0.0, timeout_pausa=65.0,
+                 semente=42, corpus=None):
+        self.latencia_spec = latencia
+        self.latencia = parse_latencia(latencia)
+        self.taxa_429 = taxa_429
+        self.taxa_timeout = taxa_timeout
+        self.taxa_json_invalido = taxa_json_invalido
+        self.taxa_erro_api = taxa_erro_api
+        self.timeout_pausa = timeout_pausa
+        self.semente = semente
+        self.corpus = set(corpus) if corpus else None
+
+
+class ProvedorLocal(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, endereco, config):
+        super().__init__(endereco, ProvedorHandler)
+        self.config = config
+        self._rng = random.Random(config.semente)
+        self._lock = threading.Lock()
+        self.contagem = {}
+
+    def sortear(self):
+        """Sorteia (latência, falha) da próxima requisição."""
+        c = self.config
+        with self._lock:
+            atraso = c.latencia(self._rng)
+            x = self._rng.random()
+        falha = None
+        for nome, taxa in (("429", c.taxa_429), ("timeout", c.taxa_timeout),
+                           ("json_invalido", c.taxa_json_invalido), ("erro_api", c.taxa_erro_api)):
+            if x < taxa:
+                falha = nome
+                break
+            x -= taxa
+        return atraso, falha
+
+    def contar(self, chave):
+        with self._lock:
+            self.contagem[chave] = self.contagem.get(chave, 0) + 1
+
+
+class ProvedorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # cabeçalho e corpo saem em writes separados; sem isso o Nagle + ACK atrasado somam ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _responder(self, provedor, cnpj, montar):
+        srv = self.server
+        atraso, falha = srv.sortear()
+        srv.contar(f"{provedor}:{falha or 'ok'}")
+        if atraso:
+            time.sleep(atraso)
+
+        if falha == "timeout":
+            # segura a conexão além do timeout do cliente e fecha sem resposta
+            time.sleep(srv.config.timeout_pausa)
+            self.close_connection = True
+            return
+        if falha == "429":
+            self._send(429, {"code": 429, "code_message": "Too Many Requests"}, {"Retry-After": "1"})
+            return
+
+        cnpj = re.sub(r"\D", "", cnpj or "")
+        if len(cnpj) != 14 or (srv.config.corpus is not None and cnpj not in srv.config.corpus):
+            if provedor == "infosimples":
+                self._send(200, {"code": 612, "code_message": "CNPJ não encontrado.", "data": [], "errors": []})
+            elif provedor == "receitaws":
+                self._send(200, {"status": "ERROR", "message": "CNPJ inválido"})
+            else:
+                self._send(404, {"message": "CNPJ não encontrado", "type": "not_found"})
+            return
+
+        if falha == "erro_api" and provedor == "infosimples":
+            self._send(200, {"code": 600, "code_message": "Erro inesperado no site de origem.", "data": [], "errors": []})
+            return
+
+        body = json.dumps(montar(cnpj, perfil_do_cnpj(cnpj, srv.config.semente)), ensure_ascii=False).encode("utf-8")
+        if falha == "json_invalido":
+            body = body[: max(1, len(body) // 2)]
+        self._send(200, body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        m = re.fullmatch(r"/v1/cnpj/([^/]+)/?", path)
+        if m:
+            return self._responder("receitaws", m.group(1), resposta_receitaws)
+        m = re.fullmatch(r"/api/cnpj/v1/([^/]+)/?", path)
+        if m:
+            return self._responder("brasilapi", m.group(1), resposta_brasilapi)
+        if path == "/status":
+            c = self.server.config
+            return self._send(200, {
+                "latencia": c.latencia_spec, "taxa_429": c.taxa_429, "taxa_timeout": c.taxa_timeout,
+                "taxa_json_invalido": c.taxa_json_invalido, "taxa_erro_api": c.taxa_erro_api,
+                "semente": c.semente, "contagem": dict(self.server.contagem),
+            })
+        self._send(404, {"message": "rota desconhecida"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8", "replace")) if length else {}
+        cnpj = (form.get("cnpj") or [""])[0]
+        self._responder("infosimples", cnpj, resposta_infosimples)
+
+
+def iniciar_servidor(config=None, host="127.0.0.1", porta=0):
+    """Sobe o provedor em uma thread daemon. Devolve (servidor, url_base); porta 0 = livre."""
+    srv = ProvedorLocal((host, porta), config or ProvedorConfig())
+    threading.Thread(target=srv.serve_forever, name="provedor-local", daemon=True).start()
+    return srv, f"http://{host}:{srv.server_address[1]}"
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--porta", type=int, default=8765)
+    ap.add_argument("--latencia", default="lognormal:80,0.5",
+                    help="zero | fixa:MS | uniforme:MIN,MAX | lognormal:MEDIANA,SIGMA | exponencial:MEDIA")
+    ap.add_argument("--taxa-429", type=float, default=0.0)
+    ap.add_argument("--taxa-timeout", type=float, default=0.0)
+    ap.add_argument("--timeout-pausa", type=float, default=65.0,
+                    help="segundos que uma requisição 'timeout' fica pendurada (cliente usa 60)")
+    ap.add_argument("--taxa-json-invalido", type=float, default=0.0)
+    ap.add_argument("--taxa-erro-api", type=float, default=0.0, help="InfoSimples code 600 com HTTP 200")
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--corpus", default=None, help="se informado, só CNPJs deste arquivo são encontrados")
+    ap.add_argument("--gerar-corpus", type=int, default=None, metavar="N", help="gera N CNPJs e sai")
+    ap.add_argument("--corpus-saida", default="cnpjs_sinteticos.txt")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.gerar_corpus:
+        with open(args.corpus_saida, "w", encoding="utf-8") as f:
+            f.write("\n".join(gerar_corpus(args.gerar_corpus, args.semente)) + "\n")
+        print(f"📄 {args.gerar_corpus} CNPJs sintéticos em {args.corpus_saida}")
+        return
+
+    corpus = None
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [re.sub(r"\D", "", l) for l in f if l.strip()]
+    config = ProvedorConfig(
+        latencia=args.latencia, taxa_429=args.taxa_429, taxa_timeout=args.taxa_timeout,
+        taxa_json_invalido=args.taxa_json_invalido, taxa_erro_api=args.taxa_erro_api,
+        timeout_pausa=args.timeout_pausa, semente=args.semente, corpus=corpus,
+    )
+    srv = ProvedorLocal((args.host, args.porta), config)
+    base = f"http://{args.host}:{srv.server_address[1]}"
+    print(f"🧪 Provedor local em {base}")
+    print(f"   InfoSimples: API_URL={base}/")
+    print(f"   ReceitaWS:   RECEITAWS_URL={base}/v1/cnpj/{{cnpj}} (com API_URL vazio)")
+    print(f"   BrasilAPI:   BRASILAPI_URL={base}/api/cnpj/v1/{{cnpj}}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        print("Contagem:", json.dumps(srv.contagem, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+# Gravação dos resultados das consultas (planilhas de saída).
+
+import csv
+import gzip
+import json
+import queue
+import re
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+from metricas import METRICS
+
+# ============================================================
+# FORMATOS DE SAÍDA
+# ============================================================
+# xlsx continua disponível para entregas pequenas; os demais são os indicados
+# para lotes grandes (uma sheet do Excel comporta no máximo 1.048.576 linhas).
+OUTPUT_FORMATS = ("xlsx", "parquet", "csv", "jsonl")
+EXCEL_MAX_ROWS = 1_048_576
+YEAR_COLUMN = "ANO"
+
+_EXTENSIONS = {
+    ".xlsx": "xlsx",
+    ".xlsm": "xlsx",
+    ".parquet": "parquet",
+    ".gz": "csv",
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+}
+
+
+def infer_format(path):
+    name = Path(path).name.lower()
+    fmt = next((f for ext, f in _EXTENSIONS.items() if name.endswith(ext)), None)
+    if fmt is None:
+        raise ValueError(f"Não sei qual formato usar para '{path}'. Use um de: {', '.join(OUTPUT_FORMATS)}.")
+    return fmt
+
+
+def output_base(path):
+    """Caminho de saída sem a extensão de formato (prefixo para arquivos auxiliares)."""
+    p = Path(path)
+    base = p.name
+    for ext in (".csv.gz", ".xlsx", ".xlsm", ".parquet", ".csv", ".jsonl"):
+        if base.lower().endswith(ext):
+            base = base[: -len(ext)]
+            break
+    return str(p.with_name(base))
+
+
+def pending_path_for(path):
+    """<saida>.pendentes.txt: CNPJs que ficaram para a próxima execução."""
+    return output_base(path) + ".pendentes.txt"
+
+
+def write_pending(path, cnpjs):
+    """Grava (ou remove, se não sobrou nenhum) o .pendentes.txt ao lado da saída."""
+    pend = Path(pending_path_for(path))
+    if not cnpjs:
+        pend.unlink(missing_ok=True)
+        return None
+    pend.write_text("\n".join(cnpjs) + "\n", encoding="utf-8")
+    return str(pend)
+
+
+def report_pending(output_path, pendentes):
+    """Grava o .pendentes.txt e avisa como continuar de onde o prazo parou."""
+    pend = write_pending(output_path, pendentes)
+    if pend:
+        print(f"⏰ Prazo esgotado: {len(pendentes)} CNPJs ficaram PENDENTE. "
+              f"Para continuar: --entrada {pend} com a mesma --saida (as linhas novas entram nela)")
+
+
+def export_metrics(output_path):
+    """Resumo das métricas no terminal e <saida>.metricas.{json,prom} ao lado da saída."""
+    METRICS.print_summary()
+    json_path, prom_path = METRICS.export(output_path)
+    print(f"📊 Métricas salvas em {json_path} e {prom_path}")
+
+
+def resume_target(input_path, output_path, formato=None):
+    """
+    Retomada: --entrada é o <saida>.pendentes.txt desta mesma saída e ela já existe.
+    Devolve o caminho da saída existente (as linhas novas serão mescladas nela) ou None.
+    """
+    final = output_path_for(output_path, formato or infer_format(output_path))
+    if Path(input_path).resolve() == Path(pending_path_for(output_path)).resolve() and Path(final).exists():
+        return final
+    return None
+
+
+def resume_path_for(output_path):
+    """Arquivo temporário da retomada (<saida>.retomada.<ext>), mesclado na saída no fim."""
+    return output_base(output_path) + ".retomada"
+
+
+def output_path_for(path, formato):
+    """Ajusta a extensão do arquivo de saída ao formato escolhido."""
+    ext = {"xlsx": ".xlsx", "parquet": ".parquet", "csv": ".csv.gz", "jsonl": ".jsonl"}[formato]
+    return output_base(path) + ext
+
+
+def _year_of(value):
+    m = re.search(r"\d{4}", str(value))
+    return int(m.group(0)) if m else None
+
+
+def add_year_column(df):
+    """
+    Garante a coluna ANO usada para particionar: vem de "Ano" (consulta anual)
+    ou de "MÊS" (2020-01 ou 01/01/2020, conforme o script).
+    """
+    if YEAR_COLUMN in df.columns:
+        return df
+    if "Ano" in df.columns:
+        return df.assign(**{YEAR_COLUMN: df["Ano"].astype(int)})
+    if "MÊS" in df.columns:
+        return df.assign(**{YEAR_COLUMN: df["MÊS"].map(_year_of)})
+    return df
+
+
+def write_output(df, path, formato=None, partition_by_year=True):
+    """
+    Grava o DataFrame no formato escolhido e devolve o caminho efetivamente escrito.
+      - xlsx:    uma aba, limitada a EXCEL_MAX_ROWS linhas
+      - parquet: diretório particionado por ANO (ANO=2020/, ANO=2021/, ...)
+      - csv:     CSV compactado com gzip
+      - jsonl:   um objeto JSON por linha
+    """
+    formato = formato or infer_format(path)
+    if formato not in OUTPUT_FORMATS:
+        raise ValueError(f"Formato de saída inválido: {formato}. Use um de: {', '.join(OUTPUT_FORMATS)}.")
+    path = output_path_for(path, formato)
+
+    if formato == "xlsx":
+        if len(df) + 1 > EXCEL_MAX_ROWS:
+            raise ValueError(
+                f"{len(df):,} linhas não cabem em uma planilha do Excel "
+                f"(máximo {EXCEL_MAX_ROWS:,}). Use --formato parquet, csv ou jsonl."
+            )
+        df.to_excel(path, index=False)
+    elif formato == "parquet":
+        df = add_year_column(df) if partition_by_year else df
+        if partition_by_year and YEAR_COLUMN in df.columns:
+            # como o to_excel, uma nova execução substitui os anos que ela reescreve
+            df.to_parquet(path, index=False, partition_cols=[YEAR_COLUMN],
+                          existing_data_behavior="delete_matching")
+        else:
+            df.to_parquet(path, index=False)
+    elif formato == "csv":
+        df.to_csv(path, index=False, compression="gzip")
+    elif formato == "jsonl":
+        df.to_json(path, orient="records", lines=True, force_ascii=False)
+    return path
+
+
+def dataframe_to_bytes(df, formato):
+    """Versão em memória de write_output, para downloads (parquet sem partição)."""
+    buf = BytesIO()
+    if formato == "xlsx":
+        df.to_excel(buf, index=False)
+    elif formato == "parquet":
+        df.to_parquet(buf, index=False)
+    elif formato == "csv":
+        df.to_csv(buf, index=False, compression={"method": "gzip"})
+    elif formato == "jsonl":
+        buf.write(df.to_json(orient="records", lines=True, force_ascii=False).encode("utf-8"))
+    else:
+        raise ValueError(f"Formato de saída inválido: {formato}.")
+    return buf.getvalue()
+
+
+# ============================================================
+# LAYOUT LARGO (1 linha por CNPJ, 1 coluna por mês)
+# ============================================================
+# Códigos compactos usados nas células da matriz
+REGIME_SIMPLES = "SN"      # permaneceu no Simples Nacional o mês inteiro
+REGIME_EXCLUIDA = "EX"     # excluída do Simples antes/durante o mês
+REGIME_NAO_OPTANTE = "NO"  # não optante / nunca esteve no Simples no mês
+REGIME_PENDENTE = "PD"     # não consultado dentro do prazo (--max-duration)
+
+WIDE_FIXED_COLUMNS = ["CNPJ", "PRIMEIRO_MES_SIMPLES", "ULTIMO_MES_SIMPLES", "Situacao_Atual"]
+
+
+def regime_code(regime, motivo):
+    if regime is None:
+        return REGIME_PENDENTE
+    if regime:
+        return REGIME_SIMPLES
+    if (motivo or "").startswith("Excluída"):
+        return REGIME_EXCLUIDA
+    return REGIME_NAO_OPTANTE
+
+
+def wide_row(cnpj, coverage, situacao_atual=""):
+    """
+    Monta a linha larga de um CNPJ a partir da cobertura mensal
+    [(mes_str, regime, motivo), ...] já em ordem cronológica.
+    """
+    codes = []
+    first_sn = ""
+    last_sn = ""
+    for mes_str, regime, motivo in coverage:
+        codes.append(regime_code(regime, motivo))
+        if regime:
+            if not first_sn:
+                first_sn = mes_str
+            last_sn = mes_str
+    return [cnpj, first_sn, last_sn, situacao_atual or ""] + codes
+
+
+WIDE_LEGEND = [
+    ["Código", "Significado"],
+    [REGIME_SIMPLES, "Simples Nacional o mês inteiro"],
+    [REGIME_EXCLUIDA, "Excluída do Simples Nacional"],
+    [REGIME_NAO_OPTANTE, "Não optante/Nunca esteve no Simples Nacional neste mês"],
+    [REGIME_PENDENTE, "Pendente: não consultado dentro do prazo (rodar de novo com o .pendentes.txt)"],
+]
+
+
+# ============================================================
+# CORREÇÃO NO LUGAR (reprocessamento da fila de erros)
+# ============================================================
+def read_output(path, formato=None, key_col="CNPJ"):
+    """Lê de volta uma saída gravada por write_output/StreamingWriter (CNPJ como texto)."""
+    import pandas as pd
+    formato = formato or infer_format(path)
+    if formato == "xlsx":
+        return pd.read_excel(path, dtype={key_col: str})
+    if formato == "parquet":
+        df = pd.read_parquet(path)
+        if YEAR_COLUMN in df.columns:
+            df[YEAR_COLUMN] = df[YEAR_COLUMN].astype(int)
+        return df
+    if formato == "csv":
+        return pd.read_csv(path, dtype={key_col: str}, keep_default_na=False)
+    return pd.read_json(path, orient="records", lines=True, dtype={key_col: str})
+
+
+def patch_output(path, new_rows, key_col="CNPJ", formato=None):
+    """
+    Troca, no arquivo de saída existente, as linhas dos CNPJs presentes em `new_rows`
+    (DataFrame com as mesmas colunas) pelas novas, na mesma posição. No xlsx a
+    planilha é editada com openpyxl (outras abas e formatação ficam como estão).
+    Devolve o número de CNPJs corrigidos.
+    """
+    formato = formato or infer_format(path)
+    if new_rows is None or new_rows.empty:
+        return 0
+    keys = set(new_rows[key_col].astype(str))
+    if formato == "xlsx":
+        _patch_xlsx(path, new_rows, key_col)
+        return len(keys)
+
+    import pandas as pd
+    df = read_output(path, formato, key_col)
+    if formato == "parquet" and YEAR_COLUMN in df.columns:
+        new_rows = add_year_column(new_rows)
+    df_keys = df[key_col].astype(str)
+    mask = df_keys.isin(keys)
+    first = {}
+    for pos, key in enumerate(df_keys):
+        if key in keys:
+            first.setdefault(key, pos)
+    pieces, start = [], 0
+    # cada CNPJ corrigido entra onde estava a primeira linha antiga dele
+    for key, pos in sorted(first.items(), key=lambda kv: kv[1]):
+        pieces.append(df.iloc[start:pos][~mask.iloc[start:pos]])
+        pieces.append(new_rows[new_rows[key_col].astype(str) == key].reindex(columns=df.columns))
+        start = pos
+    pieces.append(df.iloc[start:][~mask.iloc[start:]])
+    novos = keys - set(first)
+    if novos:
+        pieces.append(new_rows[new_rows[key_col].astype(str).isin(novos)].reindex(columns=df.columns))
+    write_output(pd.concat(pieces, ignore_index=True), path, formato)
+    return len(keys)
+
+
+def merge_resume(final_path, partial_path, formato=None, key_col="CNPJ"):
+    """Mescla a saída parcial de uma retomada na saída existente e apaga a parcial."""
+    import shutil
+    formato = formato or infer_format(final_path)
+    n = patch_output(final_path, read_output(partial_path, formato, key_col), key_col, formato)
+    partial = Path(partial_path)
+    if partial.is_dir():
+        shutil.rmtree(partial)
+    else:
+        partial.unlink(missing_ok=True)
+    return n
+
+
+def _patch_xlsx(path, new_rows, key_col):
+    from openpyxl import load_workbook
+    wb = load_workbook(path)
+    ws = wb.worksheets[0]
+    header = [c.value for c in ws[1]]
+    col = header.index(key_col)
+    antigos = {}
+    for r in range(2, ws.max_row + 1):
+        antigos.setdefault(str(ws.cell(r, col + 1).value), []).append(r)
+    apagar = []
+    for key, grupo in new_rows.groupby(new_rows[key_col].astype(str), sort=False):
+        linhas = [[None if _isnan(v) else v for v in row]
+                  for row in grupo.reindex(columns=header).itertuples(index=False)]
+        velhas = antigos.get(key, [])
+        if len(velhas) == len(linhas):
+            for r, valores in zip(velhas, linhas):
+                for c, v in enumerate(valores, start=1):
+                    ws.cell(r, c, v)
+        else:
+            apagar.extend(velhas)
+            for valores in linhas:
+                ws.append(valores)
+    for r in sorted(apagar, reverse=True):
+        ws.delete_rows(r)
+    wb.save(path)
+
+
+def _isnan(v):
+    return v is None or (isinstance(v, float) and v != v)
+
+
+# ============================================================
+# GRAVAÇÃO INCREMENTAL (thread de escrita + fila limitada)
+# ============================================================
+_STOP = object()
+
+
+class StreamingWriter:
+    """
+    Grava os resultados à medida que cada CNPJ termina, numa thread própria.
+
+    O laço de consultas chama `put(linhas)` com as linhas de um CNPJ (listas na
+    ordem de `columns`) e segue para a próxima requisição enquanto a escrita
+    acontece em paralelo. A fila é limitada (`queue_size`): se a escrita atrasar,
+    o `put` espera, e a memória fica estável independente do tamanho do lote.
+
+      - xlsx:    openpyxl write-only (linhas vão direto para o arquivo temporário do zip)
+      - parquet: um row group a cada `row_group_size` linhas; particionado por ANO
+                 quando `partition_col` é informado (coluna "MÊS" ou "Ano")
+      - csv:     gzip, acrescentando linha a linha
+      - jsonl:   um objeto JSON por linha
+
+    Uso:
+        with StreamingWriter("saida.parquet", columns, partition_col="MÊS") as w:
+            for cnpj in cnpjs:
+                w.put(linhas_do_cnpj)
+    """
+
+    def __init__(self, path, columns, formato=None, partition_col=None, sheet_name="CONSULTA",
+                 freeze_panes=None, legend=None, queue_size=64, row_group_size=50_000):
+        self.formato = formato or infer_format(path)
+        if self.formato not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato de saída inválido: {self.formato}. Use um de: {', '.join(OUTPUT_FORMATS)}.")
+        self.path = output_path_for(path, self.formato)
+        self.columns = list(columns)
+        self.partition_col = partition_col
+        self.sheet_name = sheet_name
+        self.freeze_panes = freeze_panes
+        self.legend = legend
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="StreamingWriter", daemon=True)
+        self._thread.start()
+
+    # ---------- API usada pelo laço de consultas ----------
+    def put(self, rows):
+        if self._error is not None:
+            raise RuntimeError(f"Falha ao gravar {self.path}: {self._error}") from self._error
+        if rows:
+            self._queue.put(rows)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"Falha ao gravar {self.path}: {self._error}") from self._error
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Mesmo com erro no laço, fecha o que já foi escrito (resultado parcial)
+            try:
+                self.close()
+            except Exception:
+                pass
+        return False
+
+    # ---------- thread de escrita ----------
+    def _run(self):
+        # Em caso de erro a thread continua consumindo a fila até o close(),
+        # para não travar quem está bloqueado no put(); o erro sobe no próximo put/close.
+        try:
+            getattr(self, f"_open_{self.formato}")()
+        except Exception as e:
+            self._error = e
+        while True:
+            rows = self._queue.get()
+            if rows is _STOP:
+                break
+            if self._error is not None:
+                continue
+            try:
+                t0 = time.perf_counter()
+                getattr(self, f"_write_{self.formato}")(rows)
+                METRICS.observe("escrita", time.perf_counter() - t0, formato=self.formato)
+                self.rows_written += len(rows)
+            except Exception as e:
+                self._error = e
+        if self._error is None:
+            try:
+                with METRICS.timer("escrita_fechamento", formato=self.formato):
+                    getattr(self, f"_close_{self.formato}")()
+                METRICS.inc("linhas_gravadas", self.rows_written, formato=self.formato)
+            except Exception as e:
+                self._error = e
+
+    # xlsx
+    def _open_xlsx(self):
+        from openpyxl import Workbook
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet(self.sheet_name)
+        if self.freeze_panes:
+            self._ws.freeze_panes = self.freeze_panes
+        self._ws.append(self.columns)
+
+    def _write_xlsx(self, rows):
+        if self.rows_written + len(rows) + 1 > EXCEL_MAX_ROWS:
+            raise ValueError(
+                f"O resultado passou de {EXCEL_MAX_ROWS:,} linhas, o máximo de uma planilha do Excel. "
+                f"Use --formato parquet, csv ou jsonl."
+            )
+        for row in rows:
+            self._ws.append(row)
+
+    def _close_xlsx(self):
+        if self.legend:
+            ws = self._wb.create_sheet("LEGENDA")
+            for row in self.legend:
+                ws.append(row)
+        self._wb.save(self.path)
+
+    # csv (gzip)
+    def _open_csv(self):
+        self._fh = gzip.open(self.path, "wt", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._fh)
+        self._csv.writerow(self.columns)
+
+    def _write_csv(self, rows):
+        self._csv.writerows(rows)
+
+    def _close_csv(self):
+        self._fh.close()
+
+    # jsonl
+    def _open_jsonl(self):
+        self._fh = open(self.path, "w", encoding="utf-8")
+
+    def _write_jsonl(self, rows):
+        cols = self.columns
+        self._fh.writelines(
+            json.dumps(dict(zip(cols, row)), ensure_ascii=False, default=str) + "\n" for row in rows
+        )
+
+    def _close_jsonl(self):
+        self._fh.close()
+
+    # parquet (row groups, particionado por ano)
+    def _open_parquet(self):
+        import pyarrow  # noqa: F401  (falha cedo se o pyarrow não estiver instalado)
+        self._pq_writers = {}
+        self._pq_buffers = {}
+        self._pq_schema = None
+        if self.partition_col:
+            self._part_idx = self.columns.index(self.partition_col)
+            Path(self.path).mkdir(parents=True, exist_ok=True)
+
+    def _parquet_target(self, year):
+        if year is None:
+            return self.path
+        part_dir = Path(self.path) / f"{YEAR_COLUMN}={year}"
+        if part_dir.exists():
+            # como o to_excel, uma nova execução substitui os anos que ela reescreve
+            for old in part_dir.glob("*.parquet"):
+                old.unlink()
+        part_dir.mkdir(parents=True, exist_ok=True)
+        return str(part_dir / "part-0.parquet")
+
+    def _write_parquet(self, rows):
+        for row in rows:
+            year = _year_of(row[self._part_idx]) if self.partition_col else None
+            buf = self._pq_buffers.setdefault(year, [])
+            buf.append(row)
+            if len(buf) >= self.row_group_size:
+                self._flush_parquet(year)
+
+    def _flush_parquet(self, year):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        buf = self._pq_buffers.get(year)
+        if not buf:
+            return
+        table = pa.Table.from_arrays(
+            [pa.array([r[i] for r in buf]) for i in range(len(self.columns))],
+            names=self.columns,
+        )
+        if self._pq_schema is None:
+            self._pq_schema = table.schema
+        else:
+            table = table.cast(self._pq_schema)
+        writer = self._pq_writers.get(year)
+        if writer is None:
+            writer = pq.ParquetWriter(self._parquet_target(year), self._pq_schema)
+            self._pq_writers[year] = writer
+        writer.write_table(table)
+        self._pq_buffers[year] = []
+
+    def _close_parquet(self):
+        for year in list(self._pq_buffers):
+            self._flush_parquet(year)
+        for writer in self._pq_writers.values():
+            writer.close()
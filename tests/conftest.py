@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Interface"))
+sys.path.insert(0, str(ROOT / "Usando Playwright"))
+
+import pytest
+
+
+@pytest.fixture
+def provedor():
+    """Provedor local (provedor_local.py) numa thread, sem latência; corpus ajustável por teste."""
+    from provedor_local import ProvedorConfig, iniciar_servidor
+    srv, base = iniciar_servidor(ProvedorConfig(latencia="zero"))
+    yield srv, base + "/"
+    srv.shutdown()
+    srv.server_close()
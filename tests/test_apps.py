@@ -0,0 +1,30 @@
+import textwrap
+
+from apps import WarmWorkerPool
+
+
+def test_pool_sobe_workers_antes_do_primeiro_job(tmp_path):
+    log = tmp_path / "imports.txt"
+    script = tmp_path / "script.py"
+    script.write_text(textwrap.dedent(f"""
+        import os
+        with open({str(log)!r}, "a") as f:
+            f.write(str(os.getpid()) + "\\n")
+
+        def main():
+            with open({str(log)!r} + ".main", "w") as f:
+                f.write(str(os.getpid()))
+    """), encoding="utf-8")
+
+    pool = WarmWorkerPool(str(script), max_workers=2, poll_seconds=3600)
+    try:
+        for f in pool.warmup:
+            f.result(timeout=60)
+        aquecidos = set(log.read_text().split())
+        assert len(aquecidos) == 2            # script já importado nos dois, sem job nenhum
+
+        pool.run(str(tmp_path / "entrada.xlsx"))
+        assert (tmp_path / "imports.txt.main").read_text() in aquecidos
+        assert set(log.read_text().split()) == aquecidos     # o job não importou de novo
+    finally:
+        pool._executor.shutdown()
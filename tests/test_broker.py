@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+import consulta_http
+from broker_limites import PRIORIDADE_INTERATIVA, PRIORIDADE_LOTE, QuotaExceeded, RateBroker
+
+
+class _Resposta:
+    status_code = 200
+    headers = {"Content-Type": "application/json"}
+    text = '{"status": "OK"}'
+
+    def json(self):
+        return {"status": "OK"}
+
+
+class _Sessao:
+    def get(self, url, timeout=None):
+        return _Resposta()
+
+
+def test_receitaws_divide_o_balde_qualquer_que_seja_a_api_key(monkeypatch, tmp_path):
+    broker = RateBroker(tmp_path / "broker.sqlite3", limits={"receitaws": "100/s"}, quotas={"receitaws": 10})
+    monkeypatch.setattr(consulta_http, "default_broker", lambda: broker)
+    for i, chave in enumerate(["tok-a", "tok-b", "", None]):
+        consulta_http.fetch_cnpj(f"1122233300018{i}", None, chave, session=_Sessao())
+    assert broker.usage("receitaws") == 4
+    broker.close()
+
+
+def test_interativa_passa_na_frente_do_lote(tmp_path):
+    broker = RateBroker(tmp_path / "broker.sqlite3", limits={"infosimples": "2/s"})
+    broker.acquire("infosimples", "tok")
+    broker.acquire("infosimples", "tok")          # balde vazio: a próxima ficha sai em 0,5 s
+    ordem = []
+
+    def esperar(nome, prioridade):
+        broker.acquire("infosimples", "tok", priority=prioridade, timeout=10)
+        ordem.append(nome)
+
+    lote = threading.Thread(target=esperar, args=("lote", PRIORIDADE_LOTE))
+    lote.start()
+    time.sleep(0.1)                                # o lote entra na fila primeiro
+    interativa = threading.Thread(target=esperar, args=("interativa", PRIORIDADE_INTERATIVA))
+    interativa.start()
+    lote.join(10)
+    interativa.join(10)
+    assert ordem == ["interativa", "lote"]
+    broker.close()
+
+
+def test_cota_diaria_esgotada(tmp_path):
+    broker = RateBroker(tmp_path / "broker.sqlite3", quotas={"infosimples": 2})
+    broker.acquire("infosimples", "tok")
+    broker.acquire("infosimples", "tok")
+    with pytest.raises(QuotaExceeded):
+        broker.acquire("infosimples", "tok")
+    assert broker.usage("infosimples", "tok") == 2
+    # a cota é por chave: outra API_KEY ainda tem saldo
+    broker.acquire("infosimples", "outro-tok")
+    broker.close()
@@ -0,0 +1,28 @@
+from cache_consultas import ConsultaCache
+from consulta_http import is_cacheable
+from processamento import query_infosimples
+from provedor_local import gerar_corpus
+
+
+def test_cache_separa_endpoints(tmp_path, provedor):
+    srv, api_url = provedor
+    cnpj = gerar_corpus(1, 11)[0]
+    cache = ConsultaCache(tmp_path / "cache.sqlite3")
+    stats = {}
+    query_infosimples(cnpj, api_url, "tok", cache=cache, stats=stats)
+    query_infosimples(cnpj, api_url, "tok", cache=cache, stats=stats)
+    assert stats["cache_hits"] == 1
+
+    # outro endpoint (mesmo provedor): não pode sair do cache do primeiro
+    outro = api_url.replace("127.0.0.1", "localhost")
+    query_infosimples(cnpj, outro, "tok", cache=cache, stats=stats)
+    assert stats["cache_hits"] == 1
+    assert len(cache) == 2
+    cache.close()
+
+
+def test_receitaws_status_error_nao_entra_no_cache():
+    assert not is_cacheable(200, {"status": "ERROR", "message": "CNPJ inválido"})
+    assert is_cacheable(200, {"status": "OK", "simples": {"optante": True}})
+    assert not is_cacheable(200, {"code": 612})
+    assert is_cacheable(200, {"code": 200, "data": []})
@@ -0,0 +1,40 @@
+import gzip
+
+import pytest
+
+from consulta_http import CassetteMiss, fetch_cnpj, set_cassette
+from provedor_local import gerar_corpus
+
+TOKEN = "token-secreto-do-teste"
+
+
+class _SemRede:
+    def post(self, *a, **kw):
+        raise AssertionError("reprodução não pode tocar na rede")
+
+    get = post
+
+
+@pytest.fixture
+def cassete(tmp_path):
+    yield tmp_path / "respostas.jsonl.gz"
+    set_cassette(None, None)
+
+
+def test_gravar_e_reproduzir_devolvem_o_mesmo(cassete, provedor):
+    srv, api_url = provedor
+    cnpjs = gerar_corpus(3, 5)
+    srv.config.corpus = set(cnpjs[:2])        # o terceiro volta como 612 (não encontrado)
+
+    set_cassette(cassete, "gravar")
+    gravado = [fetch_cnpj(c, api_url, TOKEN) for c in cnpjs]
+    assert gravado[2][1]["code"] == 612
+
+    set_cassette(cassete, "reproduzir")
+    srv.shutdown()
+    assert [fetch_cnpj(c, api_url, TOKEN, session=_SemRede()) for c in cnpjs] == gravado
+    with pytest.raises(CassetteMiss):
+        fetch_cnpj(gerar_corpus(1, 6)[0], api_url, TOKEN, session=_SemRede())
+
+    with gzip.open(cassete, "rt", encoding="utf-8") as f:
+        assert TOKEN not in f.read()
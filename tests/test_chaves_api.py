@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from chaves_api import KeyPool
+from consulta_http import DeadlineExceeded, deadline_after, fetch_cnpj
+
+
+@pytest.fixture
+def pool(tmp_path):
+    p = KeyPool([("tok1", None, None)], path=tmp_path / "chaves.sqlite3")
+    p.report("tok1", 429, None)          # chave no banco por 15 min
+    yield p
+    p.close()
+
+
+def test_pick_nao_espera_alem_do_timeout(pool):
+    t0 = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.pick(timeout=2.0)
+    assert time.monotonic() - t0 < 1.0
+
+
+def test_fetch_com_chaves_no_banco_vira_prazo_esgotado(pool):
+    t0 = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        fetch_cnpj("11222333000181", "http://127.0.0.1:9/", pool, deadline=deadline_after(30))
+    assert time.monotonic() - t0 < 1.0
+
+
+def test_so_conta_no_saldo_o_que_chegou_ao_provedor(monkeypatch, tmp_path, provedor):
+    import consulta_http
+    from broker_limites import RateBroker
+    srv, api_url = provedor
+    pool = KeyPool([("tok1", 5, None)], path=tmp_path / "chaves.sqlite3")
+    label = next(iter(pool.usage()))
+
+    # erro de conexão: a reserva do pick() volta
+    with pytest.raises(Exception):
+        fetch_cnpj("11222333000181", "http://127.0.0.1:9/", pool)
+    assert pool.usage()[label][0] == 0
+
+    # chegou: conta; a próxima fica sem ficha no broker antes do prazo e não conta
+    broker = RateBroker(tmp_path / "broker.sqlite3", limits={"infosimples": "1/h"})
+    monkeypatch.setattr(consulta_http, "default_broker", lambda: broker)
+    status, _ = fetch_cnpj("11222333000181", api_url, pool)
+    assert status == 200 and pool.usage()[label][0] == 1
+    with pytest.raises(DeadlineExceeded):
+        fetch_cnpj("11222333000199", api_url, pool, deadline=deadline_after(5))
+    assert pool.usage()[label][0] == 1
+    broker.close()
+    pool.close()
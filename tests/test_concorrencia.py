@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from concorrencia import AdaptiveLimiter, SingleFlight
+
+
+def _amostras(limiter, latencia, n):
+    for _ in range(n):
+        limiter.acquire()
+        limiter.release(latencia, status=200)
+
+
+def test_limite_volta_a_subir_depois_de_mudanca_de_patamar():
+    limiter = AdaptiveLimiter(initial=8, max_limit=16)
+    _amostras(limiter, 2.0, 50)
+    antes = limiter.limit
+
+    # 2 s -> 40 s para sempre: o primeiro pico corta, depois a referência acompanha
+    _amostras(limiter, 40.0, 1)
+    cortado = limiter.limit
+    assert cortado < antes
+
+    _amostras(limiter, 40.0, 100)
+    assert limiter.latency_ewma > 30
+    assert limiter.limit > cortado
+    assert limiter._overload_reason(40.0, 200, None) is None
+
+
+def test_erro_de_rede_nao_entra_na_latencia():
+    limiter = AdaptiveLimiter(initial=4)
+    _amostras(limiter, 1.0, 10)
+    limiter.acquire()
+    limiter.release(60.0, error=TimeoutError("timeout"))
+    assert limiter.latency_ewma < 2
+
+
+def test_vaga_devolvida_sem_requisicao_nao_mexe_em_nada():
+    limiter = AdaptiveLimiter(initial=4)
+    _amostras(limiter, 1.0, 10)
+    limite, ewma, amostras = limiter.limit, limiter.latency_ewma, limiter._samples
+    limiter.acquire()
+    limiter.release(skipped=True)
+    assert (limiter.limit, limiter.latency_ewma, limiter._samples) == (limite, ewma, amostras)
+    assert limiter.inflight == 0
+
+
+def test_erro_que_nao_e_sobrecarga_deixa_o_limite_igual():
+    class SSLError(Exception):
+        pass
+
+    limiter = AdaptiveLimiter(initial=4)
+    _amostras(limiter, 1.0, 10)
+    limite = limiter.limit
+    for erro in (SSLError("handshake"), ValueError("JSON inválido")):
+        limiter.acquire()
+        limiter.release(0.5, status=200, error=erro)
+    assert limiter.limit == limite
+
+
+def _ao_mesmo_tempo(n, fn):
+    """Roda fn() em n threads liberadas juntas; devolve os resultados (ou exceções)."""
+    largada = threading.Barrier(n)
+    saidas = [None] * n
+
+    def rodar(i):
+        largada.wait()
+        try:
+            saidas[i] = fn()
+        except Exception as e:
+            saidas[i] = e
+
+    threads = [threading.Thread(target=rodar, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return saidas
+
+
+def test_singleflight_faz_uma_chamada_para_todos():
+    flights = SingleFlight()
+    chamadas = []
+
+    def consulta():
+        chamadas.append(1)
+        time.sleep(0.3)          # segura o voo até todas as threads chegarem
+        return 200, {"code": 200}
+
+    saidas = _ao_mesmo_tempo(8, lambda: flights.do(("infosimples", "11222333000181"), consulta))
+    assert len(chamadas) == 1
+    assert saidas == [(200, {"code": 200})] * 8
+    assert len(flights) == 0
+
+
+def test_singleflight_repassa_a_excecao_para_quem_espera():
+    flights = SingleFlight()
+    chamadas = []
+
+    def consulta():
+        chamadas.append(1)
+        time.sleep(0.3)
+        raise ConnectionError("provedor fora do ar")
+
+    saidas = _ao_mesmo_tempo(5, lambda: flights.do(("infosimples", "11222333000181"), consulta))
+    assert len(chamadas) == 1
+    assert all(isinstance(e, ConnectionError) for e in saidas)
+    # terminada a chamada, a chave sai da tabela: a próxima consulta vai de novo ao provedor
+    with pytest.raises(ConnectionError):
+        flights.do(("infosimples", "11222333000181"), consulta)
+    assert len(chamadas) == 2
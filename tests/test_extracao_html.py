@@ -0,0 +1,91 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from consulta_simples_mensal import extract_periods_from_response
+from extracao_html import cnpj_do_resultado, parse_resultado_html, to_infosimples_json
+
+FIXTURES = Path(__file__).resolve().parent.parent / "Usando Playwright" / "fixtures"
+HTMLS = sorted(FIXTURES.glob("*.html"))
+
+
+def _periodos_json(periodos):
+    return [{"start": p["start"].isoformat(), "end": p["end"].isoformat() if p["end"] else None,
+             "detalhe": p["detalhe"]} for p in periodos]
+
+
+@pytest.mark.parametrize("arq", HTMLS, ids=[a.stem for a in HTMLS])
+def test_extracao_confere_com_esperado(arq):
+    parsed = parse_resultado_html(arq.read_text(encoding="utf-8"))
+    esperado = json.loads(arq.with_suffix(".esperado.json").read_text(encoding="utf-8"))
+    obtido = dict(parsed, periodos=_periodos_json(parsed["periodos"]),
+                  periodos_simei=_periodos_json(parsed["periodos_simei"]))
+    assert obtido == esperado
+
+    # no formato InfoSimples os motores mensal/anual leem os mesmos períodos
+    resposta = to_infosimples_json(parsed)
+    if esperado["erro"]:
+        assert resposta["code"] == 612
+    else:
+        assert resposta["code"] == 200
+        periodos = extract_periods_from_response(resposta)
+        assert [(p["start"], p.get("end")) for p in periodos] == \
+               [(p["start"], p["end"]) for p in parsed["periodos"]]
+
+
+@pytest.mark.parametrize("arq", HTMLS, ids=[a.stem for a in HTMLS])
+def test_cnpj_mostrado_na_pagina(arq):
+    # resultado: valor do rótulo "CNPJ:"; página de erro: o campo do formulário
+    assert cnpj_do_resultado(arq.read_text(encoding="utf-8")) == arq.stem
+
+
+class _PaginaFalsa:
+    """Só o que consultar_cnpj usa da Page do Playwright; devolve um HTML fixo."""
+
+    def __init__(self, html):
+        self.html = html
+        self.eventos = []
+
+    def locator(self, sel):
+        class _Loc:
+            async def count(self):
+                return 1          # form ainda na tela (caminho 1 do _ensure_form)
+        return _Loc()
+
+    async def fill(self, sel, valor):
+        self.eventos.append("fill")
+
+    def expect_navigation(self, **kw):
+        pagina = self
+
+        class _Nav:
+            async def __aenter__(self):
+                pagina.eventos.append("nav_inicio")
+
+            async def __aexit__(self, *exc):
+                pagina.eventos.append("nav_fim")
+        return _Nav()
+
+    async def click(self, sel):
+        self.eventos.append("click")
+
+    async def wait_for_selector(self, sel, timeout=None):
+        self.eventos.append("seletor")
+
+    async def evaluate(self, js):
+        return self.html
+
+
+def test_consulta_espera_navegacao_e_confere_cnpj():
+    import asyncio
+    from consulta_simples_playwright import consultar_cnpj
+    html = (FIXTURES / "39752938000101.html").read_text(encoding="utf-8")
+
+    pagina = _PaginaFalsa(html)
+    assert asyncio.run(consultar_cnpj(pagina, "39.752.938/0001-01")) == html
+    assert pagina.eventos == ["fill", "nav_inicio", "click", "nav_fim", "seletor"]
+
+    # resultado velho (de outro CNPJ) ainda na página: não pode sair com o CNPJ novo
+    with pytest.raises(RuntimeError):
+        asyncio.run(consultar_cnpj(_PaginaFalsa(html), "52337301000109"))
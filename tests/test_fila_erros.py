@@ -0,0 +1,42 @@
+import consulta_simples_anual as anual
+from fila_erros import DeadLetterQueue
+from provedor_local import gerar_corpus
+
+
+def _rodar(monkeypatch, tmp_path, api_url, cnpjs, **kw):
+    entrada = tmp_path / "entrada.txt"
+    entrada.write_text("\n".join(cnpjs) + "\n", encoding="utf-8")
+    monkeypatch.setattr(anual, "INPUT_FILE", str(entrada))
+    monkeypatch.setattr(anual, "OUTPUT_FILE", str(tmp_path / "saida.csv"))
+    monkeypatch.setattr(anual, "API_URL", api_url)
+    monkeypatch.setattr(anual, "SLEEP", 0)
+    anual.main(formato="csv", **kw)
+
+
+def test_execucao_parcial_nao_apaga_outras_falhas(monkeypatch, tmp_path, provedor):
+    srv, api_url = provedor
+    cnpjs = gerar_corpus(4, 7)
+    srv.config.corpus = set(cnpjs[:3])          # o 4º volta code 612 -> fila de erros
+    dlq = DeadLetterQueue.for_output(tmp_path / "saida.csv")
+    dlq.add("11222333000181", "anual", "ERRO_CONSULTA", "de uma execução anterior")
+
+    _rodar(monkeypatch, tmp_path, api_url, cnpjs)
+    assert {i["cnpj"] for i in dlq.items()} == {"11222333000181", cnpjs[3]}
+
+    _rodar(monkeypatch, tmp_path, api_url, cnpjs, limpar_dlq=True)
+    assert {i["cnpj"] for i in dlq.items()} == {cnpjs[3]}
+
+
+def test_reprocessar_conta_retentativas(monkeypatch, tmp_path, provedor):
+    import json
+    srv, api_url = provedor
+    cnpjs = gerar_corpus(3, 9)
+    srv.config.corpus = set(cnpjs[:2])
+    _rodar(monkeypatch, tmp_path, api_url, cnpjs)
+
+    srv.config.corpus = None
+    anual.reprocessar(formato="csv", forcar=True)
+    metricas = json.loads((tmp_path / "saida.reprocessar.metricas.json").read_text(encoding="utf-8"))
+    contadores = {(c["nome"], c["labels"].get("resultado")): c["valor"] for c in metricas["contadores"]}
+    assert contadores[("retentativas", "corrigido")] == 1
+    assert DeadLetterQueue.for_output(tmp_path / "saida.csv").items() == []
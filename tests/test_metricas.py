@@ -0,0 +1,26 @@
+from metricas import BUCKETS, Metrics
+
+
+def test_histograma_em_baldes_fixos():
+    m = Metrics()
+    for i in range(10000):
+        m.observe("fetch", (i % 100 + 1) / 1000, provider="x")     # 1..100 ms
+    h = next(iter(m._hist.values()))
+    assert len(h.counts) == len(BUCKETS) + 1 and h.n == 10000
+
+    e = m.summary()["etapas"][0]
+    assert e["n"] == 10000 and e["max_s"] == 0.1
+    assert abs(e["total_s"] - 505.0) < 1e-6
+    assert 0.025 <= e["p50_s"] <= 0.1 and 0.05 <= e["p95_s"] <= 0.1
+
+    prom = m.to_prometheus()
+    assert "# TYPE consulta_fetch_seconds histogram" in prom
+    assert 'consulta_fetch_seconds_bucket{provider="x",le="+Inf"} 10000' in prom
+
+
+def test_export_ao_lado_da_saida(tmp_path):
+    m = Metrics()
+    m.inc("cnpjs")
+    json_path, prom_path = m.export(tmp_path / "resultado.csv.gz")
+    assert json_path == str(tmp_path / "resultado.metricas.json")
+    assert prom_path == str(tmp_path / "resultado.metricas.prom")
@@ -0,0 +1,61 @@
+import consulta_simples_anual as anual
+import consulta_simples_mensal as mensal
+from consulta_http import PENDENTE, deadline_after
+from provedor_local import gerar_corpus, parse_latencia
+from saidas import pending_path_for, read_output
+
+
+def _preparar(monkeypatch, mod, tmp_path, api_url, cnpjs, saida):
+    entrada = tmp_path / "entrada.txt"
+    entrada.write_text("\n".join(cnpjs) + "\n", encoding="utf-8")
+    monkeypatch.setattr(mod, "INPUT_FILE", str(entrada))
+    monkeypatch.setattr(mod, "OUTPUT_FILE", str(tmp_path / saida))
+    monkeypatch.setattr(mod, "API_URL", api_url)
+    monkeypatch.setattr(mod, "SLEEP", 0)
+
+
+def _retomar(monkeypatch, mod, saida):
+    pend = pending_path_for(saida)
+    monkeypatch.setattr(mod, "INPUT_FILE", pend)
+    monkeypatch.setattr(mod, "DEADLINE", None)
+    return pend
+
+
+def test_retomada_anual_mescla_na_mesma_saida(monkeypatch, tmp_path, provedor):
+    srv, api_url = provedor
+    srv.config.latencia = parse_latencia("fixa:100")
+    cnpjs = gerar_corpus(10, 3)
+    _preparar(monkeypatch, anual, tmp_path, api_url, cnpjs, "saida.csv")
+    monkeypatch.setattr(anual, "DEADLINE", deadline_after(0.35))
+    anual.main(formato="csv")
+
+    saida = tmp_path / "saida.csv.gz"
+    pend = _retomar(monkeypatch, anual, saida)
+    assert 0 < len(open(pend).read().split()) < len(cnpjs)
+    anual.main(formato="csv")
+
+    df = read_output(saida, "csv")
+    assert len(df) == len(cnpjs) * len(anual.YEARS)
+    assert set(df["CNPJ"]) == set(cnpjs)
+    assert not (df["Regime"] == PENDENTE).any()
+    assert not (tmp_path / "saida.pendentes.txt").exists()
+    assert not list(tmp_path.glob("*.retomada*"))
+
+
+def test_retomada_mensal_larga_xlsx(monkeypatch, tmp_path, provedor):
+    srv, api_url = provedor
+    srv.config.latencia = parse_latencia("fixa:100")
+    cnpjs = gerar_corpus(10, 5)
+    _preparar(monkeypatch, mensal, tmp_path, api_url, cnpjs, "saida.xlsx")
+    monkeypatch.setattr(mensal, "DEADLINE", deadline_after(0.35))
+    mensal.main(layout="largo", formato="xlsx")
+
+    saida = tmp_path / "saida.xlsx"
+    pend = _retomar(monkeypatch, mensal, saida)
+    assert 0 < len(open(pend).read().split()) < len(cnpjs)
+    mensal.main(layout="largo", formato="xlsx")
+
+    df = read_output(saida, "xlsx")
+    assert len(df) == len(cnpjs)
+    assert set(df["CNPJ"]) == set(cnpjs)
+    assert not (tmp_path / "saida.pendentes.txt").exists()